@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+SC-D70 Bridge asyncio API
+The bridge as an asyncio object, for embedding in web UIs, OSC servers and other services
+"""
+
+import asyncio
+import collections
+import concurrent.futures
+import errno
+import time
+
+import usb.core
+import usb.util
+
+from batching import FLUSH_DEADLINE
+from bridge_core import UsbMidiEncoder, configure_device, find_device
+from midi_input import EventInput, message_events, now_ms
+from midi_merge import MergedInput
+from supervisor import BridgeSupervisor
+from usb_async import open_ring
+
+# Events queued by send() before it waits for the bridge thread to catch up;
+# senders resume once it is half empty
+SEND_BACKLOG = 4096
+# send() yields to the event loop every this many messages, so a sender in a
+# tight loop does not hold up other tasks until the backlog fills
+SEND_YIELD = 256
+# Status events kept for a slow status() reader before the oldest are dropped
+STATUS_BACKLOG = 256
+# Bridge thread wait period; bounds how long close() and drain() take to be
+# noticed while other inputs are merged in
+IDLE_WAIT = 0.05
+
+
+class _SendQueue(EventInput):
+    """EventInput for send(); tells a waiting sender when it has room again"""
+
+    def __init__(self, backlog, on_room):
+        super().__init__()
+        self.backlog = backlog
+        self.on_room = on_room
+        self.waiting = False
+        # Events pushed (on the event loop) and read (on the bridge thread) so far
+        self.pushed = 0
+        self.taken = 0
+
+    def push(self, message, timestamp=None):
+        events = message_events(message, now_ms() if timestamp is None else timestamp)
+        self.pushed += len(events)
+        self.put(events)
+
+    def read(self, count):
+        events = super().read(count)
+        self.taken += len(events)
+        if self.waiting and self.queued <= self.backlog // 2:
+            self.waiting = False
+            self.on_room()
+        return events
+
+
+class AsyncBridge:
+    """The SC-D70 bridge driven from an asyncio event loop.
+
+    `await bridge.send(message)` queues a raw MIDI message (any length,
+    SysEx included) for the SC-D70, waiting only while SEND_BACKLOG
+    events are already queued. `async for kind, message in bridge.status()`
+    yields ("connected", ...), the supervisor's fault and recovery events
+    ("timeout", "stall", "offline", "error", "recovered") and finally
+    ("stopped", ...). Further MIDI inputs in `inputs` (name: input) are
+    merged with what is sent.
+
+    Everything that touches USB (opening the device, the bridge loop with
+    its supervisor, closing) runs on one dedicated executor thread, so the
+    event loop never blocks on the SC-D70. close() (or leaving `async
+    with`) is shielded: cancelling the task that awaits it does not stop
+    the shutdown halfway. Messages not yet read by the bridge thread are
+    dropped then; await drain() first to send everything.
+    """
+
+    def __init__(self, dev=None, inputs=None, midi_filter=None, deadline=FLUSH_DEADLINE,
+                 backlog=SEND_BACKLOG, log=None):
+        self.dev = dev
+        self.inputs = dict(inputs or {})
+        self.midi_filter = midi_filter
+        self.deadline = deadline
+        self.backlog = backlog
+        self.log = log or (lambda message: None)
+        self.supervisor = None
+        self.queue = None
+        self.midi_in = None
+        self._send_source = None
+        self.running = False
+        self.sent = 0
+        self.packets = 0
+        self.last_status = None
+        self._loop = None
+        self._executor = None
+        self._task = None
+        self._closing = None
+        self._room = None
+        self._drains = collections.deque()
+        self._watchers = []
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def start(self):
+        """Open the SC-D70 and start the bridge thread"""
+        loop = self._loop = asyncio.get_running_loop()
+        self._room = asyncio.Event()
+        self.queue = _SendQueue(self.backlog, lambda: loop.call_soon_threadsafe(self._room.set))
+        if self.inputs:
+            self.midi_in = MergedInput(interleave=True)
+            self.midi_in.add("send", self.queue)
+            self._send_source = self.midi_in.sources[0]
+            for name, midi_in in self.inputs.items():
+                self.midi_in.add(name, midi_in)
+        else:
+            self.midi_in = self.queue
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="SC-D70 USB")
+        try:
+            await loop.run_in_executor(self._executor, self._open)
+        except BaseException:
+            # Runs after _open on the same thread, even if this was cancelled
+            self._executor.submit(self._release)
+            self._executor.shutdown(wait=False)
+            raise
+        self.running = True
+        self._task = loop.run_in_executor(self._executor, self._run)
+        self._publish("connected", f"SC-D70 bridge running ({len(self.inputs) + 1} inputs)")
+
+    def _open(self):
+        dev = self.dev or find_device()
+        if dev is None:
+            raise usb.core.USBError("SC-D70 not found", errno=errno.ENODEV)
+        self.dev = dev
+        configure_device(dev)
+        ring = open_ring(dev, deadline=self.deadline)
+        self.supervisor = BridgeSupervisor(dev, ring, self.midi_in,
+                                           UsbMidiEncoder(midi_filter=self.midi_filter),
+                                           log=self.log)
+        self.supervisor.on_status = self._status
+
+    def _run(self):
+        supervisor = self.supervisor
+        midi_in = self.midi_in
+        while self.running:
+            try:
+                bulk = supervisor.ring.bulk
+                if midi_in.wait(IDLE_WAIT) or supervisor.disconnected or (
+                        bulk is not None and bulk.busy):
+                    # USB faults are handled (and reported) by the supervisor
+                    self.packets += supervisor.pump()
+                if self._drains and supervisor.ring is not None:
+                    if not midi_in.poll():
+                        # Idle: wait here rather than for the next input
+                        supervisor.ring.drain()
+                    self._drained(supervisor.ring)
+            except Exception as e:
+                self._status("error", f"Bridge Loop Error: {e}")
+                time.sleep(0.1)
+
+    def _drained(self, ring):
+        """Resolve the drain() calls whose messages `ring` has finished writing.
+
+        Each call waits for the send() events queued before it. Once the
+        bridge has packed them, the call waits for the ring's packets
+        submitted by then (plus those still in the bulk lane) to finish.
+        Later sends do not hold it up, and a ring replaced by a reopen has
+        finished (or lost) all it will.
+        """
+        packed = self.queue.taken
+        source = self._send_source
+        if source is not None:
+            # Read by the merger but not yet handed to the bridge
+            packed -= source.queued + len(source.sysex or ())
+        for drain in list(self._drains):
+            if drain[3] is None and drain[1] <= packed:
+                drain[2] = ring
+                drain[3] = ring.submitted + (len(ring.bulk) if ring.bulk is not None else 0)
+        while self._drains:
+            future, _, drain_ring, target = self._drains[0]
+            if not future.done() and (target is None or
+                                      drain_ring is ring and ring.done < target):
+                break
+            self._drains.popleft()
+            self._loop.call_soon_threadsafe(_resolve, future)
+
+    def _release(self):
+        supervisor = self.supervisor
+        if supervisor is not None:
+            try:
+                supervisor.close()
+            except Exception as e:
+                self.log(f"USB Output Close Error: {e}")
+            self.dev = supervisor.dev
+        if self.dev is not None:
+            try:
+                usb.util.dispose_resources(self.dev)
+            except Exception:
+                pass
+
+    async def send(self, message, timestamp=None):
+        """Queue one raw MIDI message for the SC-D70"""
+        queue = self.queue
+        while queue.queued >= self.backlog:
+            # Clear before checking again so a wakeup in between is not lost
+            self._room.clear()
+            queue.waiting = True
+            if queue.queued < self.backlog:
+                break
+            if not self.running:
+                raise RuntimeError("AsyncBridge is closed")
+            await self._room.wait()
+        if not self.running:
+            raise RuntimeError("AsyncBridge is closed")
+        queue.push(message, timestamp)
+        self.sent += 1
+        if not self.sent % SEND_YIELD:
+            await asyncio.sleep(0)
+
+    async def drain(self):
+        """Wait until every message sent so far has been written to the SC-D70
+        (or lost to a USB fault); messages sent meanwhile do not delay it"""
+        if not self.running:
+            return
+        future = self._loop.create_future()
+        # [future, events pushed so far, ring and packet count to wait for]
+        self._drains.append([future, self.queue.pushed, None, None])
+        # Wake the bridge thread if it is waiting for input
+        self.midi_in.wake()
+        await future
+
+    async def status(self):
+        """Async iterator of (kind, message) status events, starting with the
+        latest one, until the bridge stops"""
+        queue = asyncio.Queue(STATUS_BACKLOG)
+        if self.last_status is not None:
+            queue.put_nowait(self.last_status)
+        if self._closing is not None and self._closing.done():
+            queue.put_nowait(None)
+        else:
+            self._watchers.append(queue)
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    return
+                yield event
+        finally:
+            if queue in self._watchers:
+                self._watchers.remove(queue)
+
+    def _status(self, kind, message):
+        # Called on the bridge thread
+        self._loop.call_soon_threadsafe(self._publish, kind, message)
+
+    def _publish(self, kind, message):
+        self.last_status = (kind, message)
+        for queue in self._watchers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait((kind, message))
+
+    async def close(self):
+        """Stop the bridge thread and close the SC-D70"""
+        if self._closing is None:
+            self._closing = asyncio.get_running_loop().create_task(self._shutdown())
+        await asyncio.shield(self._closing)
+
+    async def _shutdown(self):
+        if self._task is None:
+            return
+        self.running = False
+        self.supervisor.stop()
+        self.midi_in.wake()
+        self._room.set()
+        try:
+            await self._task
+        finally:
+            await self._loop.run_in_executor(self._executor, self._release)
+            self._executor.shutdown(wait=False)
+            while self._drains:
+                _resolve(self._drains.popleft()[0])
+            supervisor = self.supervisor
+            self._publish("stopped", f"SC-D70 bridge stopped: {self.sent} messages sent, "
+                                     f"{supervisor.recoveries} USB recoveries, "
+                                     f"{supervisor.lost} packets lost")
+            for queue in self._watchers:
+                if queue.full():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+SC-D70 USB Audio Capture
+Streams the SC-D70's 24-bit/48 kHz stereo USB audio to a host output device
+"""
+
+import array
+import os
+import sys
+import threading
+
+import numpy as np
+import sounddevice as sd
+import usb.core
+
+from pcm24 import CHANNELS, FRAME_BYTES, PAYLOAD_PACKET, PADDED_PACKET, PCM24Decoder
+from resampler import AdaptiveResampler
+
+try:
+    import usb_reader
+except ImportError:
+    # `setup.py build_ext --inplace` leaves the extension in research/
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "research"))
+    try:
+        import usb_reader
+    except ImportError:
+        usb_reader = None
+
+SAMPLE_RATE = 48000
+INTERFACE_AUDIO = 1
+AUDIO_ALTSETTING = 1
+ENDPOINT_AUDIO_IN = 0x81
+
+# Ten 312-byte packets per read, as used by the research tools
+READ_SIZE = 10 * PADDED_PACKET
+
+RING_FRAMES = 16384      # ~340 ms at 48 kHz
+PREFILL_FRAMES = 2048    # ~43 ms buffered before playback starts
+BLOCK_SIZE = 512
+
+
+class AudioRing:
+    """Preallocated single-producer/single-consumer float32 frame ring.
+
+    The capture thread only advances `write_pos` and the audio callback only
+    advances `read_pos`; both are monotonically increasing frame counters,
+    so no lock is needed. Frames that do not fit are dropped and counted in
+    `overruns`; frames the callback had to fill with silence are counted in
+    `underruns`.
+    """
+
+    def __init__(self, capacity_frames=RING_FRAMES, channels=CHANNELS):
+        self.capacity = capacity_frames
+        self.buf = np.zeros((capacity_frames, channels), dtype=np.float32)
+        self.write_pos = 0
+        self.read_pos = 0
+        self.overruns = 0
+        self.underruns = 0
+
+    def fill(self):
+        """Frames currently buffered"""
+        return self.write_pos - self.read_pos
+
+    def write_pcm24(self, decoder, raw, lengths=None):
+        """Decode a multi-packet USB read (with its packet sizes, if the
+        reader knows them) straight into the ring"""
+        frames = decoder.unpack(raw, lengths) // CHANNELS
+        free = self.capacity - self.fill()
+        if frames > free:
+            self.overruns += frames - free
+            frames = free
+        if not frames:
+            return 0
+        start = self.write_pos % self.capacity
+        first = min(frames, self.capacity - start)
+        decoder.to_float32(self.buf[start:start + first])
+        if first < frames:
+            decoder.to_float32(self.buf[:frames - first], first * CHANNELS)
+        self.write_pos += frames
+        return frames
+
+    def read_into(self, out):
+        """Copy up to len(out) frames into `out`, zero-filling any shortfall"""
+        frames = len(out)
+        count = min(frames, self.fill())
+        start = self.read_pos % self.capacity
+        first = min(count, self.capacity - start)
+        out[:first] = self.buf[start:start + first]
+        if first < count:
+            out[first:count] = self.buf[:count - first]
+        if count < frames:
+            out[count:] = 0
+            self.underruns += frames - count
+        self.read_pos += count
+        return count
+
+
+def pyusb_reader(dev):
+    """Read function for the audio endpoint using the bridge's pyusb device.
+
+    Read functions return (samples, packet sizes); pyusb only reports the
+    total, so the decoder works the sizes out from the data.
+    """
+    dev.set_interface_altsetting(interface=INTERFACE_AUDIO, alternate_setting=AUDIO_ALTSETTING)
+    buffer = array.array("B", bytes(READ_SIZE))
+    raw = np.frombuffer(buffer, dtype=np.uint8)
+
+    def read():
+        try:
+            return raw[:dev.read(ENDPOINT_AUDIO_IN, buffer, timeout=100)], None
+        except usb.core.USBTimeoutError:
+            return raw[:0], None
+    return read
+
+
+def native_reader():
+    """Read function using the usb_reader C extension (see research/)"""
+    if usb_reader is None:
+        raise ImportError("usb_reader is not built: run `python3 setup.py build_ext --inplace` "
+                          "in research/")
+    device = usb_reader.Device()
+    raw = np.zeros(READ_SIZE, dtype=np.uint8)
+    lengths = np.zeros(READ_SIZE // PADDED_PACKET, dtype=np.uint32)
+
+    def read():
+        # usb_reader drops the padding of 312-byte packets itself
+        return raw[:device.read_iso(raw, ENDPOINT_AUDIO_IN, PADDED_PACKET,
+                                    payload=PAYLOAD_PACKET, lengths=lengths)], lengths
+    read.close = device.close
+    return read
+
+
+class AudioCapture:
+    """USB audio capture thread feeding a sounddevice output stream.
+
+    With `drift_compensation` the output callback pulls through an
+    AdaptiveResampler that holds the ring at `prefill_frames`, so the
+    SC-D70 and output device clocks can drift apart indefinitely.
+    """
+
+    def __init__(self, read, output_device=None, capacity_frames=RING_FRAMES,
+                 prefill_frames=PREFILL_FRAMES, block_size=BLOCK_SIZE,
+                 drift_compensation=True):
+        self.read = read
+        self.output_device = output_device
+        self.ring = AudioRing(capacity_frames)
+        self.decoder = PCM24Decoder(READ_SIZE // FRAME_BYTES)
+        self.prefill_frames = prefill_frames
+        self.block_size = block_size
+        self.resampler = None
+        if drift_compensation:
+            self.resampler = AdaptiveResampler(self.ring, prefill_frames)
+        self.primed = False
+        self.read_errors = 0
+        self.running = False
+        self.thread = None
+        self.stream = None
+
+    def capture_loop(self):
+        ring = self.ring
+        decoder = self.decoder
+        while self.running:
+            try:
+                ring.write_pcm24(decoder, *self.read())
+            except Exception:
+                self.read_errors += 1
+
+    def callback(self, outdata, frames, time_info, status):
+        if not self.primed:
+            if self.ring.fill() < self.prefill_frames:
+                outdata.fill(0)
+                return
+            self.primed = True
+        if self.resampler:
+            self.resampler.read_into(outdata)
+        else:
+            self.ring.read_into(outdata)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.capture_loop, daemon=True)
+        self.thread.start()
+        self.stream = sd.OutputStream(device=self.output_device, samplerate=SAMPLE_RATE,
+                                      channels=CHANNELS, dtype="float32",
+                                      blocksize=self.block_size, callback=self.callback)
+        self.stream.start()
+
+    def stop(self):
+        self.running = False
+        if self.stream:
+            self.stream.stop()
+            self.stream.close()
+            self.stream = None
+        if self.thread:
+            self.thread.join(timeout=1)
+            self.thread = None
+        close = getattr(self.read, "close", None)
+        if close:
+            close()
+
+    def stats(self):
+        stats = {
+            "fill": self.ring.fill(),
+            "overruns": self.ring.overruns,
+            "underruns": self.ring.underruns,
+            "read_errors": self.read_errors,
+            "framing_errors": self.decoder.framing_errors,
+        }
+        if self.resampler:
+            stats["fill_avg"] = round(self.resampler.fill_avg, 1)
+            stats["drift_ppm"] = round(self.resampler.drift_ppm, 2)
+            stats["ratio"] = self.resampler.ratio
+        return stats
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+SC-D70 Bridge Transfer Batching
+Adaptive flush deadline for coalescing MIDI into full USB transfers
+"""
+
+# Longest a partly filled transfer waits for more input (ms)
+FLUSH_DEADLINE = 0.5
+# Weight of each new sample in the write time and input gap averages
+SMOOTHING = 1.0 / 8
+# Input gaps are capped here, so one long pause does not hide a burst after it
+IDLE_GAP = 0.01
+
+
+class FlushDeadline:
+    """Decides how long a partly filled transfer may wait for more MIDI.
+
+    Set as `ring.batcher` (open_ring does). pump_midi writes a slot as soon
+    as it fills; this decides what happens to a slot that is only partly
+    filled once the input is drained. Write completion times and the gaps between
+    input reads are averaged. While input arrives faster than writes
+    complete, a write sent now would only hold up the next one, so the slot
+    waits up to one write time (at most `limit` ms) for more. When input is
+    sparser than that the deadline is 0 and every event is written at once.
+    """
+
+    def __init__(self, limit=FLUSH_DEADLINE):
+        self.limit = limit / 1000.0
+        self.write_time = 0.0     # average write completion time (s)
+        self.gap = IDLE_GAP       # average time between input reads (s)
+        self.opened = 0.0         # perf_counter time the pending slot began waiting
+        self._last_input = 0.0
+
+    @property
+    def deadline(self):
+        """Seconds a partly filled transfer may wait at the current load"""
+        deadline = min(self.limit, self.write_time)
+        return deadline if self.gap < deadline else 0.0
+
+    def record_input(self, count, now):
+        """`count` events were read at perf_counter time `now`"""
+        gap = min((now - self._last_input) / count, IDLE_GAP)
+        self._last_input = now
+        self.gap += (gap - self.gap) * SMOOTHING
+
+    def record_write(self, seconds):
+        """A write took `seconds` from submission to completion"""
+        self.write_time += (seconds - self.write_time) * SMOOTHING
+
+    def hold(self, now):
+        """Seconds the pending slot may still wait (<= 0: write it now)"""
+        if not self.opened:
+            self.opened = now
+        return self.deadline - (now - self.opened)
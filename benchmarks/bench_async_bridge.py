@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Async bridge benchmark
+Messages per second through AsyncBridge.send() against pushing into a
+bridge thread directly, and event loop lag meanwhile, on a simulated SC-D70
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from async_bridge import AsyncBridge
+from bridge_core import UsbMidiEncoder, configure_device, find_device
+from midi_input import EventInput
+from sim_device import SimulatedBus
+from supervisor import BridgeSupervisor
+from usb_async import open_ring
+
+MESSAGES = 100000
+SYSEX_MESSAGES = 2000
+SYSEX_SIZE = 256
+# Transfer latencies simulated: none (CPU bound) and one 1 ms USB frame
+LATENCIES = (0.0, 0.001)
+SENDERS = (1, 4)
+# Period of the ticker task whose lateness is the event loop lag
+TICK = 0.001
+
+
+def note(i):
+    return bytes((0x90 | (i % 16), 36 + (i % 48), 100 if i % 2 else 0))
+
+
+def sysex(i):
+    return bytes((0xF0, 0x7D)) + bytes((i + j) & 0x7F for j in range(SYSEX_SIZE - 3)) + b"\xF7"
+
+
+def packets(messages):
+    return sum((len(message) + 2) // 3 for message in messages)
+
+
+def threaded(messages, latency):
+    """Bridge thread fed by EventInput.push, as the front ends run it"""
+    bus = SimulatedBus(latency=latency).install()
+    dev = find_device()
+    configure_device(dev)
+    source = EventInput()
+    supervisor = BridgeSupervisor(dev, open_ring(dev), source, UsbMidiEncoder(),
+                                  log=lambda msg: None)
+    stop = threading.Event()
+    done = threading.Event()
+    expected = packets(messages)
+
+    def run():
+        while not stop.is_set():
+            if source.wait(0.05):
+                supervisor.pump()
+                if bus.devices[0].packets >= expected:
+                    done.set()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    start = time.perf_counter()
+    cpu = time.process_time()
+    for message in messages:
+        source.push(message)
+    pushed = time.perf_counter() - start
+    done.wait()
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+    stop.set()
+    thread.join()
+    supervisor.stop()
+    supervisor.close()
+    bus.uninstall()
+    return len(messages) / elapsed, pushed * 1e6 / len(messages), cpu * 1e6 / len(messages), None
+
+
+async def send_async(messages, latency, senders):
+    bus = SimulatedBus(latency=latency).install()
+    lags = []
+    ticking = True
+
+    async def ticker():
+        while ticking:
+            before = time.perf_counter()
+            await asyncio.sleep(TICK)
+            lags.append(time.perf_counter() - before - TICK)
+
+    async def sender(part):
+        for message in part:
+            await bridge.send(message)
+
+    async with AsyncBridge() as bridge:
+        tick = asyncio.create_task(ticker())
+        await asyncio.sleep(TICK * 2)
+        lags.clear()
+        start = time.perf_counter()
+        cpu = time.process_time()
+        await asyncio.gather(*(sender(messages[i::senders]) for i in range(senders)))
+        sent = time.perf_counter() - start
+        await bridge.drain()
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu
+        ticking = False
+        await tick
+    delivered = bus.devices[0].packets
+    bus.uninstall()
+    if delivered != packets(messages):
+        raise RuntimeError(f"{delivered} of {packets(messages)} packets delivered")
+    lags.sort()
+    return (len(messages) / elapsed, sent * 1e6 / len(messages), cpu * 1e6 / len(messages),
+            (lags[int(len(lags) * 0.99)], lags[-1]))
+
+
+def main():
+    print("--- Async Bridge (simulated SC-D70) ---\n")
+    print(f"{'messages':<18}{'xfer ms':>8}  {'api':<20}{'msg/s':>9}{'us/send':>9}"
+          f"{'cpu us':>8}{'lag p99':>9}{'lag max':>9}")
+    loads = (
+        (f"{MESSAGES} notes", [note(i) for i in range(MESSAGES)]),
+        (f"{SYSEX_MESSAGES} SysEx", [sysex(i) for i in range(SYSEX_MESSAGES)]),
+    )
+    for label, messages in loads:
+        for latency in LATENCIES:
+            runs = [("thread + push", lambda: threaded(messages, latency))]
+            for senders in SENDERS:
+                runs.append((f"await send x{senders}",
+                             lambda senders=senders: asyncio.run(
+                                 send_async(messages, latency, senders))))
+            for name, run in runs:
+                rate, per_send, cpu, lag = run()
+                lag = ("-", "-") if lag is None else (f"{lag[0] * 1000:.2f}", f"{lag[1] * 1000:.2f}")
+                print(f"{label:<18}{latency * 1000:>8g}  {name:<20}{rate:>9.0f}{per_send:>9.2f}"
+                      f"{cpu:>8.1f}{lag[0]:>9}{lag[1]:>9}")
+    print("\nmsg/s: first send to last transfer complete; us/send: time in push() or send(), "
+          "which waits while the backlog is full; "
+          "cpu us: process CPU per message;\nlag: how late a 1 ms asyncio.sleep wakes "
+          "meanwhile (ms)")
+
+
+if __name__ == "__main__":
+    main()
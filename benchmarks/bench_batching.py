@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Transfer batching benchmark
+USB transfers per event, latency and burst throughput for one-max-packet
+and 1 KiB transfers, with and without the adaptive flush deadline, on a
+simulated SC-D70
+"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bridge_core import UsbMidiEncoder, configure_device, find_device
+from latency import BridgeMetrics
+from midi_input import EventInput, now_ms
+from sim_device import SimulatedBus
+from supervisor import BridgeSupervisor
+from usb_async import open_ring
+
+# Each transfer takes one 1 ms USB frame
+FRAME_LATENCY = 0.001
+SECONDS = 2.0
+RATES = (100, 2000, 8000)
+BURST_EVENTS = 1000
+BURSTS = 50
+
+CONFIGS = (
+    ("max-packet, immediate", {"slot_packets": 16, "slots": 64, "deadline": 0}),
+    ("1 KiB, immediate", {"deadline": 0}),
+    ("1 KiB, adaptive", {}),
+)
+
+
+def note(i):
+    return (0x90 | (i % 16), 36 + (i % 48), 100 if i % 2 else 0)
+
+
+class Bridge:
+    def __init__(self, options):
+        self.bus = SimulatedBus(latency=FRAME_LATENCY).install()
+        self.dev = self.bus.devices[0]
+        self.source = EventInput()
+        dev = find_device()
+        configure_device(dev)
+        ring = open_ring(dev, **options)
+        self.metrics = ring.metrics = BridgeMetrics()
+        self.supervisor = BridgeSupervisor(dev, ring, self.source, UsbMidiEncoder(),
+                                           log=lambda msg: None)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self.source.wait(0.05):
+                self.supervisor.pump()
+
+    def wait_packets(self, count, timeout=30.0):
+        deadline = time.monotonic() + timeout
+        while self.dev.packets < count and time.monotonic() < deadline:
+            time.sleep(0.0005)
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.supervisor.stop()
+        self.supervisor.close()
+        self.bus.uninstall()
+
+
+def paced(options, rate):
+    bridge = Bridge(options)
+    count = int(rate * SECONDS)
+    start = time.perf_counter()
+    for i in range(count):
+        delay = start + i / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        bridge.source.push(note(i))
+    bridge.wait_packets(count)
+    bridge.stop()
+    total = bridge.metrics.stats()["total"]
+    return bridge.dev.transfers, count, total["p50"], total["p99"]
+
+
+def burst(options):
+    """Push to the first and to the last note of a burst being written, in ms"""
+    bridge = Bridge(options)
+    first = []
+    last = []
+    for b in range(BURSTS):
+        sent = bridge.dev.packets
+        stamp = now_ms()
+        events = [[list(note(i)) + [0], stamp] for i in range(BURST_EVENTS)]
+        start = time.perf_counter()
+        bridge.source.put(events)
+        while bridge.dev.packets == sent:
+            time.sleep(0.0001)
+        first.append((time.perf_counter() - start) * 1000.0)
+        while bridge.dev.packets < sent + BURST_EVENTS:
+            time.sleep(0.0001)
+        last.append((time.perf_counter() - start) * 1000.0)
+    bridge.stop()
+    first.sort()
+    last.sort()
+    return (bridge.dev.transfers, BURSTS * BURST_EVENTS, first[len(first) // 2],
+            last[len(last) // 2], last[-1])
+
+
+def main():
+    print(f"--- Transfer Batching (simulated SC-D70, {FRAME_LATENCY * 1000:g} ms per transfer) ---\n")
+    print(f"{'load':<18}{'config':<26}{'transfers':>10}{'events/xfer':>12}{'p50 ms':>9}{'p99 ms':>9}")
+    for rate in RATES:
+        for name, options in CONFIGS:
+            transfers, events, p50, p99 = paced(options, rate)
+            print(f"{f'{rate} ev/s':<18}{name:<26}{transfers:>10}{events / transfers:>12.1f}"
+                  f"{p50:>9.3f}{p99:>9.3f}")
+    print(f"\n{'load':<18}{'config':<26}{'transfers':>10}{'events/xfer':>12}{'first ms':>9}"
+          f"{'last ms':>9}{'last max':>9}{'packets/s':>11}")
+    for name, options in CONFIGS:
+        transfers, events, first, last, worst = burst(options)
+        print(f"{f'burst of {BURST_EVENTS}':<18}{name:<26}{transfers:>10}{events / transfers:>12.1f}"
+              f"{first:>9.3f}{last:>9.3f}{worst:>9.3f}{BURST_EVENTS / last * 1000:>11.0f}")
+    print("\nburst: median push to first and to last note written, worst last note, and "
+          "packets/s over the median burst")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Bridge load test
+Throughput, latency and CPU per event of the bridge loops on a simulated
+SC-D70, compared with the last run stored in benchmarks/results/ (with
+--save this run is appended there)
+"""
+
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+
+from bridge_core import UsbMidiEncoder, configure_device, find_device
+from latency import BridgeMetrics
+from midi_input import EventInput
+from midi_merge import MergedInput
+from sim_device import AUDIO_PADDED_PACKET, ENDPOINT_AUDIO_IN, SimulatedBus
+from supervisor import BridgeSupervisor
+from usb_async import open_ring
+
+RESULTS_FILE = os.path.join(HERE, "results", "bridge_load.jsonl")
+
+# Throughput: as many notes as the producer can push, on an ideal bus
+FLOOD_EVENTS = 50000
+# Latency: a steady stream, each transfer taking one 1 ms USB frame
+PACED_RATE = 1000
+PACED_SECONDS = 2.0
+FRAME_LATENCY = 0.001
+# Faults: stalls at this rate per transfer plus one unplug in the middle
+STALL_RATE = 0.01
+FAULT_EVENTS = 5000
+# Audio: seconds of EP 0x81 reads
+AUDIO_SECONDS = 0.5
+
+
+def note(i):
+    return (0x90 | (i % 16), 36 + (i % 48), 100 if i % 2 else 0)
+
+
+class Bridge:
+    """One bridge thread as a front end runs it: the terminal bridge pumps
+    its input directly, the menu bar app always pumps a MergedInput"""
+
+    def __init__(self, front_end):
+        self.source = EventInput()
+        if front_end == "menubar":
+            self.midi_in = MergedInput()
+            self.midi_in.add("load", self.source)
+        else:
+            self.midi_in = self.source
+        dev = find_device()
+        configure_device(dev)
+        ring = open_ring(dev)
+        self.metrics = ring.metrics = BridgeMetrics()
+        self.supervisor = BridgeSupervisor(dev, ring, self.midi_in, UsbMidiEncoder(),
+                                           log=lambda msg: None)
+        self.cpu = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        start = time.thread_time()
+        supervisor = self.supervisor
+        while not self._stop.is_set():
+            if self.midi_in.wait(0.05) or supervisor.disconnected:
+                supervisor.pump()
+        self.cpu = time.thread_time() - start
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.supervisor.stop()
+        self.supervisor.close()
+
+
+def wait_packets(dev, count, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while dev.packets < count and time.monotonic() < deadline:
+        time.sleep(0.0005)
+
+
+def flood(front_end):
+    bus = SimulatedBus().install()
+    dev = bus.devices[0]
+    bridge = Bridge(front_end)
+    start = time.perf_counter()
+    for i in range(FLOOD_EVENTS):
+        bridge.source.push(note(i))
+    wait_packets(dev, FLOOD_EVENTS)
+    elapsed = time.perf_counter() - start
+    bridge.stop()
+    bus.uninstall()
+    return {"events_per_s": round(dev.packets / elapsed),
+            "cpu_us_per_event": round(bridge.cpu / max(dev.packets, 1) * 1e6, 2)}
+
+
+def paced(front_end):
+    bus = SimulatedBus(latency=FRAME_LATENCY).install()
+    dev = bus.devices[0]
+    bridge = Bridge(front_end)
+    count = int(PACED_RATE * PACED_SECONDS)
+    start = time.perf_counter()
+    for i in range(count):
+        delay = start + i / PACED_RATE - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        bridge.source.push(note(i))
+    wait_packets(dev, count)
+    bridge.stop()
+    bus.uninstall()
+    total = bridge.metrics.stats()["total"]
+    return {"latency_ms": {"p50": total["p50"], "p99": total["p99"], "p999": total["p999"]},
+            "cpu_us_per_event": round(bridge.cpu / max(dev.packets, 1) * 1e6, 2)}
+
+
+def faults(front_end):
+    bus = SimulatedBus(latency=FRAME_LATENCY, stall_rate=STALL_RATE, seed=1).install()
+    dev = bus.devices[0]
+    bridge = Bridge(front_end)
+    for i in range(FAULT_EVENTS):
+        # Unplugged for 500 events (~100 ms) while input keeps coming
+        if i == FAULT_EVENTS // 2:
+            dev.unplug()
+        elif i == FAULT_EVENTS // 2 + 500:
+            dev.plug()
+        bridge.source.push(note(i))
+        time.sleep(0.0002)
+    time.sleep(1.0)
+    bridge.stop()
+    bus.uninstall()
+    supervisor = bridge.supervisor
+    return {"delivered": dev.packets, "stalls": supervisor.stalls,
+            "recoveries": supervisor.recoveries, "lost": supervisor.lost}
+
+
+def audio():
+    bus = SimulatedBus().install()
+    dev = bus.devices[0]
+    buffer = bytearray(10 * AUDIO_PADDED_PACKET)
+    start = time.perf_counter()
+    while time.perf_counter() - start < AUDIO_SECONDS:
+        dev.read(ENDPOINT_AUDIO_IN, buffer, timeout=100)
+    bus.uninstall()
+    return {"packets_per_s": round(dev.audio_packets / (time.perf_counter() - start))}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        else:
+            flat[prefix + key] = value
+    return flat
+
+
+def previous_run():
+    if not os.path.exists(RESULTS_FILE):
+        return None
+    with open(RESULTS_FILE) as f:
+        lines = [line for line in f if line.strip()]
+    return json.loads(lines[-1]) if lines else None
+
+
+def main():
+    save = "--save" in sys.argv
+    print("--- Bridge Load Test (simulated SC-D70) ---\n")
+    results = {}
+    for front_end in ("terminal", "menubar"):
+        results[front_end] = {"flood": flood(front_end), "paced": paced(front_end),
+                              "faults": faults(front_end)}
+    results["audio"] = audio()
+
+    previous = previous_run()
+    before = flatten(previous["results"]) if previous else {}
+    print(f"{'metric':<42}{'value':>12}{'previous':>12}{'change':>9}")
+    for key, value in flatten(results).items():
+        old = before.get(key)
+        change = f"{(value - old) / old * 100:+.0f}%" if old else ""
+        print(f"{key:<42}{value:>12}{'' if old is None else old:>12}{change:>9}")
+    if previous:
+        print(f"\nprevious: {previous['time']} ({previous['commit']}, {previous['machine']})")
+
+    if save:
+        os.makedirs(os.path.dirname(RESULTS_FILE), exist_ok=True)
+        record = {"time": datetime.datetime.now().isoformat(timespec="seconds"),
+                  "commit": git_commit(),
+                  "python": platform.python_version(),
+                  "machine": f"{platform.system()} {platform.machine()}",
+                  "results": results}
+        with open(RESULTS_FILE, "a") as f:
+            f.write(json.dumps(record) + "\n")
+        print(f"\nSaved to {os.path.relpath(RESULTS_FILE)}")
+
+
+if __name__ == "__main__":
+    main()
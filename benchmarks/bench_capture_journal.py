@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Capture journal benchmark
+Cost of journaling each USB write, and input-to-write latency of the bridge
+pump with and without a journal
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bridge_core import PacketRing, UsbMidiEncoder, pump_midi
+from capture import CaptureJournal
+from latency import BridgeMetrics
+from midi_input import EventInput
+
+BATCHES = 20000
+ROUNDS = 3000
+# Events per pump in the latency runs: a single note, a chord, a dense burst
+BURSTS = (1, 16, 128)
+# Alternating runs with and without the journal; the median of each is shown
+REPEATS = 5
+
+
+class NullDevice:
+    def write(self, endpoint, data, timeout=None):
+        return len(data)
+
+
+def bench_record(path):
+    ring = PacketRing()
+    print(f"{'packets/write':<16}{'record':>10}{'per packet':>12}")
+    for packets in (1, 8, 64, 256):
+        journal = CaptureJournal(path)
+        for i in range(packets):
+            ring.append(0x09, 0x90, 60, 100)
+        start = time.perf_counter()
+        for _ in range(BATCHES):
+            journal.record(ring._buf, ring._start, ring._pos)
+        elapsed = time.perf_counter() - start
+        journal.close()
+        print(f"{packets:<16}{elapsed / BATCHES * 1e6:>8.2f}us{elapsed / BATCHES / packets * 1e9:>10.0f}ns")
+        ring.advance()
+
+
+def run(burst, path):
+    """Input-to-write latency percentiles (us) of `burst`-event pumps"""
+    midi_in = EventInput()
+    ring = PacketRing()
+    ring.metrics = metrics = BridgeMetrics()
+    journal = None
+    if path:
+        journal = ring.journal = CaptureJournal(path)
+    dev = NullDevice()
+    encoder = UsbMidiEncoder()
+    for i in range(ROUNDS):
+        for n in range(burst):
+            midi_in.push((0x90 | n % 16, 36 + (i + n) % 48, 100))
+        pump_midi(midi_in, ring, dev, encoder)
+    if journal:
+        journal.close()
+    return metrics.total
+
+
+def main():
+    print("--- Capture Journal Benchmark ---\n")
+    fd, path = tempfile.mkstemp(suffix=".journal")
+    os.close(fd)
+    try:
+        bench_record(path)
+        print(f"\nMIDI input -> USB write, median of {REPEATS} runs of {ROUNDS} pumps (us)")
+        print(f"{'events/pump':<14}{'':<10}{'p50':>8}{'p90':>8}{'p99':>8}")
+        for burst in BURSTS:
+            # Warm up, then alternate so both see the same machine state
+            run(burst, None)
+            runs = {None: [], path: []}
+            for _ in range(REPEATS):
+                for journal_path in (None, path):
+                    hist = run(burst, journal_path)
+                    runs[journal_path].append([hist.percentile(p) for p in (50, 90, 99)])
+            for name, journal_path in (("off", None), ("journal", path)):
+                p50, p90, p99 = (sorted(column)[REPEATS // 2] for column in zip(*runs[journal_path]))
+                print(f"{burst:<14}{name:<10}{p50:>8}{p90:>8}{p99:>8}")
+        print(f"\nJournal size after {ROUNDS} x {BURSTS[-1]} events: "
+              f"{os.path.getsize(path) / 1024:.0f} KiB")
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
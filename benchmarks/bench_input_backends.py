@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+MIDI input backend benchmark
+Idle CPU and event-to-USB-write latency for the event and poll backends
+"""
+
+import collections
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bridge_core import PacketRing, UsbMidiEncoder, pump_midi
+from midi_input import EventInput, PollingInput, now_ms
+
+IDLE_SECONDS = 2.0
+EVENTS = 500
+EVENT_INTERVAL = 0.004
+
+
+class FakePygameInput:
+    """Deque-backed stand-in for pygame.midi.Input"""
+    def __init__(self):
+        self.events = collections.deque()
+
+    def push(self, message, timestamp=None):
+        self.events.append([list(message) + [0], now_ms()])
+
+    def poll(self):
+        return bool(self.events)
+
+    def read(self, count):
+        out = []
+        while self.events and len(out) < count:
+            out.append(self.events.popleft())
+        return out
+
+    def close(self):
+        pass
+
+
+class FakeDevice:
+    """Records the time of every write"""
+    def __init__(self):
+        self.write_times = []
+
+    def write(self, endpoint, data, timeout=None):
+        self.write_times.append(now_ms())
+        return len(data)
+
+
+def bridge_thread(midi_in, dev, stop, cpu):
+    ring = PacketRing()
+    encoder = UsbMidiEncoder()
+    start = time.thread_time()
+    while not stop.is_set():
+        if midi_in.wait(0.5):
+            pump_midi(midi_in, ring, dev, encoder)
+    cpu.append(time.thread_time() - start)
+
+
+def run_bridge(midi_in, feed):
+    dev = FakeDevice()
+    stop = threading.Event()
+    cpu = []
+    t = threading.Thread(target=bridge_thread, args=(midi_in, dev, stop, cpu))
+    t.start()
+    sent = feed()
+    time.sleep(0.05)
+    stop.set()
+    if isinstance(midi_in, EventInput):
+        midi_in.close()
+    t.join()
+    return dev, sent, cpu[0]
+
+
+def idle(midi_in):
+    def feed():
+        time.sleep(IDLE_SECONDS)
+        return []
+    _dev, _sent, cpu = run_bridge(midi_in, feed)
+    return cpu / IDLE_SECONDS * 100.0
+
+
+def latency(midi_in, source):
+    def feed():
+        sent = []
+        for i in range(EVENTS):
+            sent.append(now_ms())
+            source.push([0x90, i % 128, 100])
+            time.sleep(EVENT_INTERVAL)
+        return sent
+    dev, sent, _cpu = run_bridge(midi_in, feed)
+    return sorted(w - s for s, w in zip(sent, dev.write_times))
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def report(name, cpu, lat):
+    print(f"{name:<6} idle CPU {cpu:6.2f}%   latency p50 {percentile(lat, 0.5):6.3f} ms"
+          f"   p99 {percentile(lat, 0.99):6.3f} ms   max {lat[-1]:6.3f} ms")
+
+
+def main():
+    print("--- MIDI Input Backend Benchmark ---")
+    fake = FakePygameInput()
+    poll_cpu = idle(PollingInput(fake))
+    fake = FakePygameInput()
+    poll_lat = latency(PollingInput(fake), fake)
+    report("poll", poll_cpu, poll_lat)
+
+    event_cpu = idle(EventInput())
+    midi_in = EventInput()
+    event_lat = latency(midi_in, midi_in)
+    report("event", event_cpu, event_lat)
+
+
+if __name__ == "__main__":
+    main()
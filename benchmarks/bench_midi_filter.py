@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+MIDI filter pipeline benchmark
+Throughput of the bridge pump with 12 compiled filter rules
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bridge_core import PacketRing, UsbMidiEncoder, pump_midi
+from midi_filter import MidiFilter
+from bench_packet_encoder import FakeDevice, FakeInput
+
+EVENTS = 200000
+
+RULES = [
+    {"type": "drop", "messages": ["active_sensing", "clock", "sysex"]},
+    {"type": "drop", "messages": ["program_change"], "channels": [10]},
+    {"type": "drop", "messages": ["poly_aftertouch", "channel_aftertouch"]},
+    {"type": "channel", "map": {"1": 2, "2": 1}},
+    {"type": "channel", "map": {"16": 10}},
+    {"type": "transpose", "semitones": -12, "channels": [1]},
+    {"type": "transpose", "semitones": 7, "channels": [3, 4]},
+    {"type": "velocity", "curve": 0.6, "min": 20, "max": 120},
+    {"type": "velocity", "curve": 1.5, "channels": [10]},
+    {"type": "cc", "map": {"1": 11, "64": None}},
+    {"type": "cc", "map": {"74": 71}, "channels": [5, 6, 7]},
+    {"type": "drop", "messages": ["pitch_bend"], "channels": [9]},
+]
+
+
+def make_events(count):
+    """Notes, CCs and pitch bend spread over all 16 channels"""
+    kinds = [0x90, 0x80, 0x90, 0x80, 0xB0, 0xE0]
+    events = []
+    for i in range(count):
+        status = kinds[i % len(kinds)] | (i % 16)
+        events.append([[status, (i * 7) % 128, 1 + (i % 127), 0], i])
+    return events
+
+
+def interpreted(events, dev):
+    """The same rules evaluated per event with Python branching"""
+    packets = bytearray()
+    for event in events:
+        status, d1, d2 = event[0][0], event[0][1], event[0][2]
+        if status >= 0xF0:
+            continue
+        kind = status & 0xF0
+        ch = (status & 0x0F) + 1
+        if kind in (0xA0, 0xD0) or (kind == 0xC0 and ch == 10):
+            continue
+        ch = {1: 2, 2: 1}.get(ch, ch)
+        ch = 10 if ch == 16 else ch
+        if kind in (0x80, 0x90):
+            if ch == 1:
+                d1 -= 12
+            elif ch in (3, 4):
+                d1 += 7
+            if not 0 <= d1 < 128:
+                continue
+        if kind == 0x90 and d2:
+            d2 = max(1, min(127, round(20 + 100 * (d2 / 127.0) ** 0.6)))
+            if ch == 10:
+                d2 = max(1, min(127, round(1 + 126 * (d2 / 127.0) ** 1.5)))
+        if kind == 0xB0:
+            if d1 == 64:
+                continue
+            d1 = 11 if d1 == 1 else d1
+            if ch in (5, 6, 7) and d1 == 74:
+                d1 = 71
+        if kind == 0xE0 and ch == 9:
+            continue
+        packets += bytes((kind >> 4, kind | (ch - 1), d1, d2))
+    dev.write(0x02, packets)
+    return len(packets) // 4
+
+
+def run(name, fn, events):
+    best = None
+    for _ in range(5):
+        start = time.perf_counter()
+        count = fn(events, FakeDevice())
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    rate = len(events) / best
+    print(f"{name:<18} {count:>7} packets  {rate / 1e6:5.2f} M events/s")
+    return rate
+
+
+def main():
+    events = make_events(EVENTS)
+    midi_filter = MidiFilter(RULES)
+    print("--- MIDI Filter Benchmark ---")
+    print(f"{len(RULES)} rules, {EVENTS} events\n")
+    base = run("no filter", lambda ev, dev: pump_midi(FakeInput(ev), PacketRing(), dev,
+                                                     UsbMidiEncoder()), events)
+    compiled = run("compiled tables", lambda ev, dev: pump_midi(FakeInput(ev), PacketRing(), dev,
+                                                               UsbMidiEncoder(midi_filter=midi_filter)),
+                   events)
+    naive = run("interpreted rules", interpreted, events)
+    print(f"\nCompiled vs no filter: {compiled / base:.2f}x, vs interpreted: {compiled / naive:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
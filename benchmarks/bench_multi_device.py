@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Multiple SC-D70 benchmark
+Aggregate throughput of per-device workers on simulated units, and how much
+one stalled unit slows down the others
+"""
+
+import os
+import sys
+import time
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from usb._interop import as_array
+
+from multi_device import DeviceWorker, InputRouter, unit_filter
+from midi_input import EventInput
+
+EVENTS = 40000
+# Simulated bus: full-speed bulk moves ~1.2 MB/s, and a write completes
+# no sooner than the next 1 ms frame
+BUS_RATE = 1.2e6
+WRITE_OVERHEAD = 0.001
+STALL = 0.02
+
+
+class SimDevice:
+    """SC-D70 stand-in whose writes take as long as the bus would"""
+
+    def __init__(self, delay=0.0):
+        self._ctx = types.SimpleNamespace(backend=None)
+        self.delay = delay
+        self.packets = 0
+
+    def write(self, endpoint, data, timeout=None):
+        size = len(as_array(data))
+        time.sleep(WRITE_OVERHEAD + size / BUS_RATE + self.delay)
+        self.packets += size // 4
+        return size
+
+
+def make_events(count):
+    events = []
+    for i in range(count):
+        status = (0x90 if i % 2 == 0 else 0x80) | (i % 16)
+        events.append([[status, 36 + (i % 48), 100, 0], 0.0])
+    return events
+
+
+def run(units, stalled=0):
+    """Route EVENTS notes, split by channel, to `units` simulated SC-D70s.
+    Returns seconds until each healthy unit had all of its packets."""
+    devices = [SimDevice(STALL if i < stalled else 0.0) for i in range(units)]
+    workers = []
+    channels = []
+    for i, dev in enumerate(devices):
+        channels.append([c for c in range(1, 17) if (c - 1) % units == i])
+        workers.append(DeviceWorker(f"sim-{i}", dev, ["sequencer"],
+                                    unit_filter({"channels": channels[-1]}),
+                                    log=lambda msg: None))
+    source = EventInput()
+    router = InputRouter()
+    router.add(source, [worker.queues["sequencer"] for worker in workers], channels)
+    for worker in workers:
+        worker.start()
+    expected = EVENTS // units
+    start = time.perf_counter()
+    events = make_events(EVENTS)
+    for i in range(0, len(events), 50):
+        source.put(events[i:i + 50])
+        router.pump()
+    done = {}
+    while len(done) < units - stalled:
+        for i, dev in enumerate(devices[stalled:], stalled):
+            if i not in done and dev.packets >= expected:
+                done[i] = time.perf_counter() - start
+        time.sleep(0.0005)
+    for worker in workers:
+        worker.stop()
+    return max(done.values())
+
+
+def main():
+    print("--- Multiple SC-D70 Benchmark ---")
+    print(f"{EVENTS} note events split by channel, simulated {BUS_RATE / 1e6:.1f} MB/s buses\n")
+    base = None
+    for units in (1, 2, 4, 8):
+        elapsed = run(units)
+        rate = EVENTS / elapsed
+        base = base or rate
+        print(f"{units} unit(s): {elapsed * 1000:7.1f} ms  {rate / 1000:7.1f} k packets/s  "
+              f"({rate / base:.2f}x)")
+    healthy = run(4)
+    stalled = run(4, stalled=1)
+    print(f"\n4 units, one stalled ({STALL * 1000:.0f} ms per write): others done in "
+          f"{stalled * 1000:.1f} ms vs {healthy * 1000:.1f} ms with none stalled")
+
+
+if __name__ == "__main__":
+    main()
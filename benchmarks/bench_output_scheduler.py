@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Output scheduler benchmark
+Timing jitter of a dense sequence sent as polled vs. scheduled at timestamp + delay
+"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bridge_core import PacketRing, UsbMidiEncoder, pump_midi
+from latency import Histogram
+from midi_input import EventInput, now_ms
+from scheduler import SCHEDULE_DELAY, ScheduledInput
+
+EVENTS = 4000
+# One event every 0.5 ms, delivered by the "driver" in 4 ms bursts
+SPACING_MS = 0.5
+BURST_MS = 4.0
+
+
+class TimedDevice:
+    """Records when each packet was written"""
+    def __init__(self):
+        self.times = []
+
+    def write(self, endpoint, data, timeout=None):
+        now = now_ms()
+        self.times.extend([now] * (len(data) // 4))
+        return len(data)
+
+
+def produce(midi_in, start):
+    """Push the sequence with exact timestamps, but only every BURST_MS"""
+    i = 0
+    while i < EVENTS:
+        time.sleep(BURST_MS / 1000.0)
+        now = now_ms()
+        while i < EVENTS and start + i * SPACING_MS <= now:
+            midi_in.push([0x90 | (i % 16), 36 + (i % 48), 100], start + i * SPACING_MS)
+            i += 1
+
+
+def run(scheduled):
+    source = EventInput()
+    midi_in = ScheduledInput(source) if scheduled else source
+    dev = TimedDevice()
+    ring = PacketRing()
+    encoder = UsbMidiEncoder()
+    start = now_ms() + 10
+    producer = threading.Thread(target=produce, args=(source, start))
+    producer.start()
+    while len(dev.times) < EVENTS:
+        if midi_in.wait(0.5):
+            pump_midi(midi_in, ring, dev, encoder)
+    producer.join()
+    delay = SCHEDULE_DELAY if scheduled else 0.0
+    hist = Histogram()
+    for i, written in enumerate(dev.times):
+        hist.record(int(abs(written - (start + i * SPACING_MS + delay)) * 1000))
+    return hist, midi_in.late if scheduled else None
+
+
+def main():
+    print("--- Output Scheduler Benchmark ---")
+    print(f"{EVENTS} events {SPACING_MS} ms apart, delivered in {BURST_MS:.0f} ms bursts\n")
+    print(f"{'':<22}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}  (|ms| from intended time)")
+    for name, scheduled in (("as polled", False), (f"scheduled +{SCHEDULE_DELAY:.0f} ms", True)):
+        hist, late = run(scheduled)
+        print(f"{name:<22}{hist.percentile(50) / 1000:>9.3f}{hist.percentile(90) / 1000:>9.3f}"
+              f"{hist.percentile(99) / 1000:>9.3f}{hist.max / 1000:>9.3f}")
+        if late is not None:
+            print(f"{'':<22}{late} events ({100.0 * late / EVENTS:.1f}%) arrived after their due time")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+USB-MIDI packet encoder micro-benchmark
+Compares the PacketRing encoder with the original list-based bridge loop
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from usb._interop import as_array
+
+from bridge_core import ENDPOINT_MIDI_OUT, PacketRing, UsbMidiEncoder, pump_midi
+
+EVENTS = 200000
+
+
+class FakeDevice:
+    """Does pyusb's buffer conversion, then acts like an instant bus"""
+    def write(self, endpoint, data, timeout=None):
+        return len(as_array(data))
+
+
+class FakeInput:
+    """pygame.midi.Input stand-in that replays a fixed event list"""
+    def __init__(self, events):
+        self.events = events
+        self.pos = 0
+
+    def poll(self):
+        return self.pos < len(self.events)
+
+    def read(self, n):
+        chunk = self.events[self.pos:self.pos + n]
+        self.pos += n
+        return chunk
+
+
+def make_events(count):
+    events = []
+    for i in range(count):
+        status = 0x90 | (i % 16) if i % 2 == 0 else 0x80 | (i % 16)
+        events.append([[status, 36 + (i % 48), 100, 0], i])
+    return events
+
+
+def list_path(midi_in, dev):
+    """The per-event list building bridge loop, as originally shipped"""
+    packets = []
+    while midi_in.poll():
+        events = midi_in.read(50)
+        for event in events:
+            data = event[0]
+            if data[0] >= 0xF8:
+                continue
+            cin = (data[0] >> 4) & 0x0F
+            packets.extend([cin, data[0], data[1], data[2]])
+    if packets:
+        dev.write(ENDPOINT_MIDI_OUT, packets, timeout=10)
+    return len(packets) // 4
+
+
+def ring_path(midi_in, dev):
+    return pump_midi(midi_in, PacketRing(), dev, UsbMidiEncoder())
+
+
+def run(name, fn, events):
+    dev = FakeDevice()
+    best = None
+    for _ in range(5):
+        midi_in = FakeInput(events)
+        start = time.perf_counter()
+        count = fn(midi_in, dev)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    rate = count / best
+    print(f"{name:<12} {count:>8} packets  {rate / 1e6:6.2f} M packets/s")
+    return rate
+
+
+def main():
+    events = make_events(EVENTS)
+    print("--- USB-MIDI Packet Encoder Benchmark ---")
+    base = run("list", list_path, events)
+    ring = run("PacketRing", ring_path, events)
+    print(f"\nSpeedup: {ring / base:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
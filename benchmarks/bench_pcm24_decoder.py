@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+24-bit PCM decoder benchmark
+MB/s of raw USB reads decoded by PCM24Decoder vs the research tools' code
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "research"))
+
+from analyze_signal import decode_stream
+from pcm24 import PADDED_PACKET, PAYLOAD_PACKET, PCM24Decoder
+
+PACKETS_PER_READ = 10
+READS = 2000
+
+
+def pcm24_to_float32(data_bytes):
+    """research/pitch_compare.py's decoder (that script runs on import)"""
+    raw = np.frombuffer(data_bytes, dtype=np.uint8).reshape(-1, 3)
+    int_vals = (raw[:, 0].astype(np.int32) |
+                (raw[:, 1].astype(np.int32) << 8) |
+                (raw[:, 2].astype(np.int32) << 16))
+    int_vals[int_vals >= 0x800000] -= 0x1000000
+    return int_vals.astype(np.float32) / 8388608.0
+
+
+def strip_padding_loop(chunk):
+    """Per-packet padding check in the style of diagnose_structure.py"""
+    arr = np.frombuffer(chunk, dtype=np.uint8)
+    if len(arr) % PADDED_PACKET != 0:
+        return chunk
+    payload = bytearray()
+    for pkt in arr.reshape(-1, PADDED_PACKET):
+        if all(c == 0 for c in pkt[PAYLOAD_PACKET:]):
+            payload.extend(pkt[:PAYLOAD_PACKET].tobytes())
+        else:
+            payload.extend(pkt.tobytes())
+    return bytes(payload)
+
+
+def make_reads(packet_size):
+    rng = np.random.default_rng(0)
+    reads = []
+    for _ in range(READS):
+        raw = rng.integers(0, 256, PACKETS_PER_READ * packet_size, dtype=np.uint8)
+        if packet_size == PADDED_PACKET:
+            raw.reshape(-1, PADDED_PACKET)[:, PAYLOAD_PACKET:] = 0
+        reads.append(raw.tobytes())
+    return reads
+
+
+def run(name, fn, reads):
+    total = sum(len(r) for r in reads)
+    start = time.perf_counter()
+    for r in reads:
+        fn(r)
+    elapsed = time.perf_counter() - start
+    print(f"  {name:<34} {total / elapsed / 1e6:8.1f} MB/s")
+
+
+def main():
+    decoder = PCM24Decoder(PACKETS_PER_READ * PADDED_PACKET // 6)
+    out = np.zeros(decoder.max_samples, dtype=np.float32)
+
+    def framed(r):
+        raw = np.frombuffer(r, dtype=np.uint8)
+        decoder.to_float32(out[:decoder.unpack(raw)])
+
+    print("--- 24-bit PCM Decoder Benchmark ---")
+    print(f"(stream needs {48000 * 6 / 1e6:.3f} MB/s)")
+    for packet_size in (PAYLOAD_PACKET, PADDED_PACKET):
+        reads = make_reads(packet_size)
+        print(f"\n{packet_size}-byte packets, {PACKETS_PER_READ} per read:")
+        run("analyze_signal.decode_stream", lambda r: decode_stream(r, 24, "little", 2), reads)
+        run("pitch_compare.pcm24_to_float32", pcm24_to_float32, reads)
+        if packet_size == PADDED_PACKET:
+            run("per-packet strip + pcm24_to_float32",
+                lambda r: pcm24_to_float32(strip_padding_loop(r)), reads[:200])
+        run("PCM24Decoder", framed, reads)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Priority lanes benchmark
+Latency of notes played while a large SysEx dump is being sent, through the
+bulk lane and through a single packet queue, on a simulated SC-D70
+"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bridge_core import UsbMidiEncoder, configure_device, find_device, stream_sysex
+from midi_input import EventInput, message_events, now_ms
+from midi_merge import MergedInput
+from sim_device import SimulatedBus
+from supervisor import BridgeSupervisor
+from usb_async import open_ring
+
+# Each transfer takes one 1 ms USB frame
+FRAME_LATENCY = 0.001
+# GS DT1 messages of 128 data bytes, 16 KiB of SysEx in all
+DUMP_MESSAGES = 112
+DUMP_DATA = 128
+NOTES = 200
+NOTE_INTERVAL = 0.002
+
+
+def dump_messages():
+    messages = []
+    for i in range(DUMP_MESSAGES):
+        address = (0x40, 0x10 + (i >> 4), (i & 0x0F) << 3)
+        data = bytes(j & 0x7F for j in range(i, i + DUMP_DATA))
+        checksum = -(sum(address) + sum(data)) & 0x7F
+        messages.append(bytes((0xF0, 0x41, 0x10, 0x42, 0x12)) + bytes(address) + data
+                        + bytes((checksum, 0xF7)))
+    return messages
+
+
+def long_message():
+    """One SysEx as long as the whole dump (a sample or vendor bulk dump)"""
+    size = DUMP_MESSAGES * (DUMP_DATA + 10)
+    return [bytes((0xF0, 0x7D)) + bytes(j & 0x7F for j in range(size - 3)) + b"\xF7"]
+
+
+def note(i):
+    """Distinct note on for each i, so its packet identifies it"""
+    return bytes((0x90 | (i % 16), i % 128, 1 + i // 128))
+
+
+class Bridge:
+    """Bridge thread with a keyboard and a dump input merged, timing when
+    each note's transfer completes"""
+
+    def __init__(self, lanes):
+        self.bus = SimulatedBus(latency=FRAME_LATENCY).install()
+        dev = find_device()
+        configure_device(dev)
+        self.keys = EventInput()
+        self.dump = EventInput()
+        self.midi_in = MergedInput(interleave=lanes)
+        self.midi_in.add("dump", self.dump)
+        self.midi_in.add("keys", self.keys)
+        self.ring = open_ring(dev, lanes=lanes)
+        self.supervisor = BridgeSupervisor(dev, self.ring, self.midi_in, UsbMidiEncoder(),
+                                           log=lambda msg: None)
+        self.delivered = {}
+        self.bulk_packets = 0
+        self.last_bulk = 0.0
+        write = dev.write
+
+        def timed_write(endpoint, data, timeout=None):
+            size = write(endpoint, data, timeout)
+            now = time.perf_counter()
+            for i in range(0, len(data), 4):
+                if data[i] == 0x09:
+                    self.delivered[bytes(data[i + 1:i + 4])] = now
+                elif 0x04 <= data[i] <= 0x07:
+                    self.bulk_packets += 1
+                    self.last_bulk = now
+            return size
+        dev.write = timed_write
+        self.syx = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        supervisor = self.supervisor
+        if self.syx is not None:
+            if self.ring.bulk is not None:
+                self.ring.bulk.stream(self.syx)
+            else:
+                # Today's --send-syx: the whole file before anything else
+                stream_sysex(self.ring, supervisor.dev, self.syx)
+        while not self._stop.is_set():
+            bulk = supervisor.ring.bulk
+            if self.midi_in.wait(0.01) or bulk is not None and bulk.busy:
+                supervisor.pump()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.supervisor.stop()
+        self.supervisor.close()
+        self.bus.uninstall()
+
+
+def run(lanes, source):
+    bridge = Bridge(lanes)
+    messages = long_message() if source == "long" else dump_messages()
+    if source == "syx":
+        bridge.syx = messages
+    start = time.perf_counter()
+    bridge._thread.start()
+    if source != "syx":
+        stamp = now_ms()
+        bridge.dump.put([event for message in messages for event in message_events(message, stamp)])
+    pushed = {}
+    for i in range(NOTES):
+        delay = start + i * NOTE_INTERVAL - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        pushed[note(i)] = time.perf_counter()
+        bridge.keys.push(note(i))
+    deadline = time.monotonic() + 30
+    while len(bridge.delivered) < NOTES and time.monotonic() < deadline:
+        time.sleep(0.001)
+    time.sleep(0.05)
+    bridge.stop()
+    expected = sum((len(message) + 2) // 3 for message in messages)
+    if bridge.bulk_packets != expected:
+        raise RuntimeError(f"{bridge.bulk_packets} of {expected} SysEx packets delivered")
+    latencies = sorted((bridge.delivered[key] - pushed[key]) * 1000.0 for key in pushed
+                       if key in bridge.delivered)
+    return (latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)],
+            latencies[-1], (bridge.last_bulk - start) * 1000.0, len(latencies))
+
+
+def main():
+    print(f"--- Priority Lanes (simulated SC-D70, {FRAME_LATENCY * 1000:g} ms per transfer) ---\n")
+    print(f"{DUMP_MESSAGES * (DUMP_DATA + 10) // 1024} KiB GS dump, a note every "
+          f"{NOTE_INTERVAL * 1000:g} ms meanwhile; note latency from push to transfer complete\n")
+    print(f"{'dump from':<14}{'output':<14}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}{'dump ms':>9}"
+          f"{'notes':>7}")
+    sources = {"input": "MIDI input", "long": "one SysEx", "syx": ".syx stream"}
+    for source, label in sources.items():
+        for lanes in (False, True):
+            p50, p99, worst, dump, count = run(lanes, source)
+            name = "bulk lane" if lanes else "single queue"
+            print(f"{label:<14}{name:<14}"
+                  f"{p50:>9.2f}{p99:>9.2f}{worst:>9.2f}{dump:>9.0f}{count:>7}")
+
+
+if __name__ == "__main__":
+    main()
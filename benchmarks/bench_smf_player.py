@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Standard MIDI File player benchmark
+Parse throughput and memory of a multi-megabyte file, and how close to its
+tempo-mapped time each event reaches a simulated SC-D70
+"""
+
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bridge_core import PacketRing, UsbMidiEncoder, pump_midi
+from latency import Histogram
+from midi_input import now_ms
+from smf import MidiFile, SmfInput
+
+DIVISION = 480
+# Big file: 16 tracks of notes, controllers and an occasional GS SysEx
+TRACKS = 16
+TRACK_EVENTS = 100000
+# Events parsed while tracing memory
+MEMORY_EVENTS = 200000
+# Timing run: one note every PLAY_TICKS across 4 tracks, tempo doubling halfway
+PLAY_EVENTS = 3000
+PLAY_TICKS = 1
+TEMPO_SLOW = 480000       # 1 ms per tick at 480 ticks per quarter note
+TEMPO_FAST = 240000       # 0.5 ms per tick
+
+
+def vlq(value):
+    out = [value & 0x7F]
+    value >>= 7
+    while value:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    return bytes(reversed(out))
+
+
+def chunk(kind, data):
+    return kind + len(data).to_bytes(4, "big") + data
+
+
+def header(tracks):
+    return chunk(b"MThd", (1).to_bytes(2, "big") + tracks.to_bytes(2, "big")
+                 + DIVISION.to_bytes(2, "big"))
+
+
+def tempo(value):
+    return b"\xFF\x51\x03" + value.to_bytes(3, "big")
+
+
+END = b"\x00\xFF\x2F\x00"
+GS_SYSEX = bytes([0x41, 0x10, 0x42, 0x12, 0x40, 0x01, 0x30, 0x04, 0x0B, 0xF7])
+
+
+def big_track(channel):
+    out = bytearray()
+    status = 0x90 | channel
+    out += b"\x00" + bytes([status])
+    for i in range(TRACK_EVENTS):
+        # Each event starts right after its delta time
+        if i % 1000 == 999:
+            out += b"\xF0" + vlq(len(GS_SYSEX)) + GS_SYSEX + vlq(0) + bytes([status])
+        elif i % 7 == 6:
+            out += bytes([0xB0 | channel, 7, i % 128]) + vlq(i % 5) + bytes([status])
+        out += bytes([36 + i % 48, 100 if i % 2 else 0]) + vlq(i % 3 * 10)
+    out += b"\x90\x24\x00" + END
+    return chunk(b"MTrk", bytes(out))
+
+
+def timing_file():
+    """File whose track i plays note n at tick n * 4 + i; returns it and the
+    expected ms of every note"""
+    half = PLAY_EVENTS // 2
+    conductor = b"\x00" + tempo(TEMPO_SLOW) + vlq(half * PLAY_TICKS) + tempo(TEMPO_FAST) + END
+    tracks = [chunk(b"MTrk", conductor)]
+    per_track = PLAY_EVENTS // 4
+    for track in range(4):
+        out = bytearray()
+        last = 0
+        for n in range(per_track):
+            tick = (n * 4 + track) * PLAY_TICKS
+            out += vlq(tick - last) + bytes([0x90 | track, 36 + n % 48, 100])
+            last = tick
+        tracks.append(chunk(b"MTrk", bytes(out) + END))
+    expected = []
+    for tick in range(0, PLAY_EVENTS * PLAY_TICKS, PLAY_TICKS):
+        slow = min(tick, half * PLAY_TICKS)
+        expected.append(slow * TEMPO_SLOW / 1000.0 / DIVISION
+                        + (tick - slow) * TEMPO_FAST / 1000.0 / DIVISION)
+    return header(len(tracks)) + b"".join(tracks), expected
+
+
+class TimedDevice:
+    """Records when each packet was written"""
+    def __init__(self):
+        self.times = []
+
+    def write(self, endpoint, data, timeout=None):
+        now = now_ms()
+        self.times.extend([now] * (len(data) // 4))
+        return len(data)
+
+
+def write_temp(data):
+    fd, path = tempfile.mkstemp(suffix=".mid")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    return path
+
+
+def bench_parse():
+    path = write_temp(header(TRACKS) + b"".join(big_track(c) for c in range(TRACKS)))
+    try:
+        size = os.path.getsize(path)
+        start = time.perf_counter()
+        smf = MidiFile(path)
+        count = 0
+        last = 0.0
+        for ms, message in smf.events():
+            count += 1
+            last = ms
+        elapsed = time.perf_counter() - start
+        smf.close()
+        # tracemalloc slows parsing ~10x: measure memory over part of a second pass
+        tracemalloc.start()
+        smf = MidiFile(path)
+        for n, event in enumerate(smf.events()):
+            if n == MEMORY_EVENTS:
+                break
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        smf.close()
+    finally:
+        os.remove(path)
+    print(f"Parse: {size / 1e6:.1f} MB, {TRACKS} tracks, {count} events "
+          f"({last / 60000:.1f} min of music)")
+    print(f"       {elapsed * 1000:.0f} ms  {count / elapsed / 1e6:.2f} M events/s  "
+          f"{size / elapsed / 1e6:.1f} MB/s")
+    print(f"       peak Python memory {peak / 1024:.0f} KiB over the first {MEMORY_EVENTS} events")
+
+
+def bench_timing():
+    data, expected = timing_file()
+    path = write_temp(data)
+    try:
+        smf = SmfInput(path)
+        dev = TimedDevice()
+        ring = PacketRing()
+        encoder = UsbMidiEncoder()
+        while not smf.done:
+            if smf.wait(0.5):
+                pump_midi(smf, ring, dev, encoder)
+        smf.close()
+    finally:
+        os.remove(path)
+    hist = Histogram()
+    for written, ms in zip(dev.times, expected):
+        hist.record(int(abs(written - (smf.start + ms)) * 1000))
+    print(f"\nTiming: {len(dev.times)} notes over {expected[-1] / 1000:.1f} s, "
+          f"4 tracks, tempo doubling halfway")
+    print(f"{'':<8}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}  (|ms| from tempo-mapped time)")
+    print(f"{'':<8}{hist.percentile(50) / 1000:>9.3f}{hist.percentile(90) / 1000:>9.3f}"
+          f"{hist.percentile(99) / 1000:>9.3f}{hist.max / 1000:>9.3f}")
+
+
+def main():
+    print("--- Standard MIDI File Player Benchmark ---\n")
+    bench_parse()
+    bench_timing()
+
+
+if __name__ == "__main__":
+    main()
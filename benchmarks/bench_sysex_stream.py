@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+SysEx streaming benchmark
+Encodes a 100 KB GS bulk dump through stream_sysex and pump_midi
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bridge_core import SYSEX_CHUNK_SIZE, PacketRing, UsbMidiEncoder, pump_midi, stream_sysex
+from bench_packet_encoder import FakeDevice, FakeInput
+
+DUMP_BYTES = 100 * 1024
+# Roland DT1 messages carrying 128 data bytes each, like a GS bulk dump
+DT1_DATA = 128
+USB_FULL_SPEED = 12e6 / 8
+
+
+def gs_dump(size):
+    """Concatenated GS DT1 SysEx messages totalling about `size` bytes"""
+    out = bytearray()
+    address = 0
+    while len(out) < size:
+        data = bytes((address + i) & 0x7F for i in range(DT1_DATA))
+        body = bytes([0x48, (address >> 14) & 0x7F, (address >> 7) & 0x7F, address & 0x7F]) + data
+        checksum = (128 - sum(body) % 128) & 0x7F
+        out += bytes([0xF0, 0x41, 0x10, 0x42, 0x12]) + body + bytes([checksum, 0xF7])
+        address += DT1_DATA
+    return bytes(out)
+
+
+def as_events(data):
+    """The dump as pygame delivers it: each message split into 4-byte events"""
+    events = []
+    for message in data.split(b"\xf7")[:-1]:
+        message += b"\xf7"
+        for i in range(0, len(message), 4):
+            events.append([list(message[i:i + 4].ljust(4, b"\0")), 0])
+    return events
+
+
+def file_path(dump, dev):
+    chunks = (dump[i:i + SYSEX_CHUNK_SIZE] for i in range(0, len(dump), SYSEX_CHUNK_SIZE))
+    return stream_sysex(PacketRing(), dev, chunks)
+
+
+def input_path(events, dev):
+    return pump_midi(FakeInput(events), PacketRing(), dev, UsbMidiEncoder())
+
+
+def run(name, fn, source):
+    best = None
+    for _ in range(5):
+        start = time.perf_counter()
+        packets = fn(source, FakeDevice())
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    fn(source, FakeDevice())
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    wire = packets * 4
+    print(f"{name:<14} {packets:>7} packets  {DUMP_BYTES / best / 1e6:6.2f} MB/s MIDI  "
+          f"{wire / best / USB_FULL_SPEED:5.1f}x USB full speed  peak {peak / 1024:6.1f} KB")
+
+
+def main():
+    dump = gs_dump(DUMP_BYTES)
+    print("--- SysEx Streaming Benchmark ---")
+    print(f"{len(dump)} byte GS bulk dump ({len(dump) // (DT1_DATA + 11)} DT1 messages)\n")
+    run(".syx stream", file_path, dump)
+    run("pygame input", input_path, as_events(dump))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Bridge soak test
+Runs the bridge loop on synthetic traffic for minutes or hours and reports
+memory growth, lost packets, latency drift and stalls in the output
+"""
+
+import argparse
+import gc
+import os
+import resource
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bridge_core import UsbMidiEncoder, configure_device, find_device
+from latency import BridgeMetrics
+from midi_input import EventInput
+from multi_device import InputRouter
+from sim_device import SimulatedBus
+from supervisor import BridgeSupervisor
+from synth_input import PATTERNS, open_synth
+from usb_async import open_ring
+
+# Longest the output may pause beyond the synthetic input's own longest
+# pause between two messages (ms) before the soak fails
+GAP_SLACK = 50.0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Bridge soak test")
+    parser.add_argument("--minutes", type=float, default=1.0)
+    parser.add_argument("--interval", type=float, default=10.0,
+                        help="seconds between report lines")
+    parser.add_argument("--pattern", default="mixed",
+                        help=f"{', '.join(PATTERNS)}, or a capture journal to replay")
+    parser.add_argument("--rate", type=float, default=20000,
+                        help="MIDI bytes per second (0: as fast as the device takes them)")
+    parser.add_argument("--usb", action="store_true",
+                        help="soak a real SC-D70 instead of a simulated one")
+    parser.add_argument("--latency-ms", type=float, default=1.0,
+                        help="simulated time per USB transfer")
+    parser.add_argument("--router", action="store_true",
+                        help="route the traffic through an InputRouter, as with several units")
+    return parser.parse_args()
+
+
+class GapMetrics(BridgeMetrics):
+    """BridgeMetrics that also keeps the longest time between two writes
+    completing, since the last reset() and overall (seconds)"""
+
+    def __init__(self):
+        super().__init__()
+        self.gap = 0.0
+        self.max_gap = 0.0
+        self._last_write = 0.0
+
+    def record_write(self, origin, submitted, completed, packets):
+        super().record_write(origin, submitted, completed, packets)
+        if self._last_write:
+            gap = completed - self._last_write
+            if gap > self.gap:
+                self.gap = gap
+                self.max_gap = max(self.max_gap, gap)
+        self._last_write = completed
+
+    def reset(self):
+        super().reset()
+        self.gap = 0.0
+
+
+def rss_mb():
+    """Resident memory now (Linux), else the peak so far"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+def main():
+    args = parse_args()
+    bus = None
+    if not args.usb:
+        bus = SimulatedBus(latency=args.latency_ms / 1000.0).install()
+    dev = find_device()
+    if dev is None:
+        print("Error: SC-D70 not found!")
+        return 1
+    configure_device(dev)
+    ring = open_ring(dev)
+    metrics = ring.metrics = GapMetrics()
+    midi_in = source = open_synth(args.pattern, args.rate)
+    router = None
+    if args.router:
+        source = EventInput()
+        router = InputRouter()
+        router.add(midi_in, [source])
+    supervisor = BridgeSupervisor(dev, ring, source, UsbMidiEncoder(), log=print)
+    stop = threading.Event()
+
+    def bridge():
+        while not stop.is_set() and not midi_in.done:
+            if source.wait(0.5) or supervisor.disconnected:
+                supervisor.pump()
+
+    def route():
+        while not stop.is_set() and not midi_in.done:
+            if router.wait(0.5):
+                router.pump()
+
+    thread = threading.Thread(target=bridge, daemon=True)
+    thread.start()
+    if router:
+        router_thread = threading.Thread(target=route, daemon=True)
+        router_thread.start()
+
+    print(f"--- Bridge Soak Test: {args.pattern} at {args.rate:g} B/s for {args.minutes:g} min "
+          f"({'USB' if args.usb else 'simulated'} SC-D70{', routed' if router else ''}) ---\n")
+    print(f"{'time':>7}{'messages':>11}{'packets':>11}{'lost':>7}{'RSS MB':>9}{'objects':>10}"
+          f"{'p50 ms':>9}{'p99 ms':>9}{'p99.9':>9}{'gap ms':>9}")
+    rows = []
+    delivered = 0
+    start = time.monotonic()
+    end = start + args.minutes * 60
+    try:
+        while time.monotonic() < end and thread.is_alive():
+            time.sleep(min(args.interval, max(0.0, end - time.monotonic())))
+            # Latency is per interval, so drift shows; the counts are totals
+            total = metrics.stats()["total"]
+            delivered += metrics.packets
+            gap = metrics.gap
+            metrics.reset()
+            lost = supervisor.lost + (supervisor.ring.dropped if supervisor.ring is not None else 0)
+            row = (time.monotonic() - start, midi_in.count, delivered, lost, rss_mb(),
+                   len(gc.get_objects()), total["p50"], total["p99"], total["p999"], gap * 1000.0)
+            rows.append(row)
+            print(f"{row[0]:>6.0f}s{row[1]:>11}{row[2]:>11}{row[3]:>7}{row[4]:>9.1f}{row[5]:>10}"
+                  f"{row[6]:>9.3f}{row[7]:>9.3f}{row[8]:>9.3f}{row[9]:>9.1f}")
+    except KeyboardInterrupt:
+        print("\nStopped")
+    stop.set()
+    thread.join()
+    if router:
+        router_thread.join()
+    supervisor.stop()
+    supervisor.close()
+    midi_in.close()
+    if bus:
+        bus.uninstall()
+
+    if len(rows) < 2:
+        return 0
+    first, last = rows[0], rows[-1]
+    hours = (last[0] - first[0]) / 3600.0
+    print(f"\nMemory:  {last[4] - first[4]:+.1f} MB RSS ({(last[4] - first[4]) / hours:+.1f} MB/h), "
+          f"{last[5] - first[5]:+d} Python objects since the first interval")
+    print(f"Lost:    {last[3]} packets ({supervisor.recoveries} recoveries, "
+          f"{supervisor.stalls} stalls, {supervisor.timeouts} timeouts)")
+    print(f"Latency: p50 {first[6]:.3f} -> {last[6]:.3f} ms, p99 {first[7]:.3f} -> {last[7]:.3f} ms "
+          f"(first -> last interval)")
+    # The output should be as steady as the input: a longer pause between
+    # writes means a stage sat on traffic (e.g. a router oversleeping)
+    gap = metrics.max_gap * 1000.0
+    allowed = midi_in.max_gap + GAP_SLACK
+    print(f"Gaps:    longest {gap:.1f} ms between writes, input's longest {midi_in.max_gap:.1f} ms")
+    if gap > allowed and not supervisor.recoveries:
+        print(f"FAIL: output paused {gap:.1f} ms, more than the {allowed:.1f} ms allowed")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
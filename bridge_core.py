@@ -0,0 +1,701 @@
+#!/usr/bin/env python3
+"""
+SC-D70 Bridge Core
+Shared USB/MIDI logic used by the terminal and menu bar front ends
+"""
+
+import array
+import functools
+import itertools
+import struct
+import sys
+import time
+
+import usb.core
+import usb.util
+
+# SC-D70 USB IDs
+VENDOR_ID = 0x0582
+PRODUCT_ID = 0x000c
+ENDPOINT_MIDI_OUT = 0x02
+# Bulk endpoint wMaxPacketSize at full speed, used when the descriptor
+# cannot be read
+FULL_SPEED_MAX_PACKET = 64
+
+# SysEx initialization messages
+GS_RESET = [0xF0, 0x41, 0x10, 0x42, 0x12, 0x40, 0x00, 0x7F, 0x00, 0x41, 0xF7]
+MASTER_VOL = [0xF0, 0x7F, 0x7F, 0x04, 0x01, 0x00, 0x7F, 0xF7]
+
+# One USB-MIDI event packet: [CIN, B0, B1, B2]
+USB_MIDI_PACKET = struct.Struct("4B")
+PACKET_SIZE = USB_MIDI_PACKET.size
+
+# pygame.midi.Input.read() batch size
+MIDI_READ_SIZE = 50
+
+# USB-MIDI 1.0 Code Index Numbers (USB Device Class Definition for MIDI
+# Devices 1.0, Table 4-1). Channel voice messages use their high nibble.
+CIN_SYSCOMMON_2 = 0x2   # two-byte System Common (MTC quarter frame, Song Select)
+CIN_SYSCOMMON_3 = 0x3   # three-byte System Common (Song Position Pointer)
+CIN_SYSEX = 0x4         # SysEx starts or continues
+CIN_SYSEX_END_1 = 0x5   # SysEx ends with one byte, or single-byte System Common
+CIN_SYSEX_END_2 = 0x6   # SysEx ends with two bytes
+CIN_SYSEX_END_3 = 0x7   # SysEx ends with three bytes
+CIN_SINGLE_BYTE = 0xF   # single byte (System Real-Time, undefined System Common)
+
+SYSEX_START = 0xF0
+SYSEX_END = 0xF7
+SYSEX_END_CIN = (CIN_SYSEX_END_1, CIN_SYSEX_END_2, CIN_SYSEX_END_3)
+# MIDI bytes carried by a packet, by CIN (0x0/0x1 are reserved)
+CIN_LENGTH = (0, 0, 2, 3, 3, 1, 2, 3, 3, 3, 3, 3, 2, 2, 3, 1)
+
+# Write timeout for flushes in the middle of a SysEx stream. Live traffic
+# uses a short timeout and drops on error; bulk dumps wait for the SC-D70
+# to accept each slot instead, so a slow device cannot corrupt them.
+STREAM_TIMEOUT = 1000
+
+# .syx file read size for stream_sysex
+SYSEX_CHUNK_SIZE = 3 * 256
+
+# Optional stand-in for the USB bus: a callable returning the SC-D70s to
+# use (see sim_device.SimulatedBus). None searches the real bus.
+device_backend = None
+
+# Most USB-MIDI packets a single pygame event can produce (a 4-byte SysEx
+# chunk completing one packet and ending the message in a second)
+MAX_EVENT_PACKETS = 2
+
+
+def _message_length(status):
+    """Length in bytes of the short message starting with `status` (0: none)"""
+    if status < 0x80 or status in (SYSEX_START, SYSEX_END):
+        return 0
+    if status < 0xF0:
+        return 2 if 0xC0 <= status < 0xE0 else 3
+    return {0xF1: 2, 0xF2: 3, 0xF3: 2}.get(status, 1)
+
+
+def _code_index(status):
+    if status < 0xF0:
+        return status >> 4
+    return {0xF1: CIN_SYSCOMMON_2, 0xF2: CIN_SYSCOMMON_3, 0xF3: CIN_SYSCOMMON_2,
+            0xF6: CIN_SYSEX_END_1}.get(status, CIN_SINGLE_BYTE)
+
+
+def _short_message_entry(status):
+    length = _message_length(status)
+    if not length:
+        return None
+    return (_code_index(status), 0x7F if length > 1 else 0, 0x7F if length > 2 else 0)
+
+
+# Per status byte: total message length, and (CIN, data1 mask, data2 mask)
+# for short messages (None for data bytes, SysEx start and end). Unused data
+# bytes are masked to zero as the spec requires.
+MESSAGE_LENGTH = tuple(_message_length(status) for status in range(256))
+SHORT_MESSAGES = tuple(_short_message_entry(status) for status in range(256))
+
+# Fast-path data byte tables, indexed by the raw byte: DATA_BYTE keeps the
+# 7-bit value, UNUSED_BYTE zeroes a byte the message does not use. A data1
+# value with DROP_MESSAGE set drops the message (used by midi_filter).
+DATA_BYTE = bytes(b & 0x7F for b in range(256))
+UNUSED_BYTE = bytes(256)
+DROP_MESSAGE = 0x80
+
+
+def message_entry(status, out_status=None, data1=None, data2=None):
+    """Encoder table entry (CIN, status to send, data1 table, data2 table)"""
+    if out_status is None:
+        out_status = status
+    cin, m1, m2 = SHORT_MESSAGES[status]
+    if data1 is None:
+        data1 = DATA_BYTE if m1 else UNUSED_BYTE
+    if data2 is None:
+        data2 = DATA_BYTE if m2 else UNUSED_BYTE
+    return (cin, out_status, data1, data2)
+
+
+# Per status byte: the entry to pack it with, or None (no short message)
+MESSAGES = tuple(message_entry(status) if SHORT_MESSAGES[status] else None
+                 for status in range(256))
+
+
+# Shift of each packet byte (CIN, status, data1, data2) within the packet
+# read as one native 32-bit word, which is how pack_events stores it
+WORD_SHIFTS = (0, 8, 16, 24) if sys.byteorder == "little" else (24, 16, 8, 0)
+
+
+@functools.lru_cache(maxsize=None)
+def _word_table(data, shift, head=0):
+    """A data byte table as packet word bits with `head` or-ed in; -1 (all
+    bits) drops the message"""
+    return tuple(-1 if b & DROP_MESSAGE else head | b << shift for b in data)
+
+
+def _word_entry(entry):
+    cin, status, data1, data2 = entry
+    head = cin << WORD_SHIFTS[0] | status << WORD_SHIFTS[1]
+    return (_word_table(data1, WORD_SHIFTS[2], head), _word_table(data2, WORD_SHIFTS[3]))
+
+
+def fast_path(messages=MESSAGES, drop_realtime=True):
+    """pack_events table: (data1 word table with the CIN and status bytes
+    already in, data2 word table) to pack, False to drop, None for the
+    byte path.
+
+    Real-time is either dropped or sent via the byte path so that the fast
+    path never has to preserve running status around it.
+    """
+    table = [_word_entry(entry) if entry else entry for entry in messages]
+    for status in range(0xF8, 0x100):
+        table[status] = False if drop_realtime or messages[status] is False else None
+    return tuple(table)
+
+
+def busy_path(table):
+    """fast_path `table` for events arriving mid-message (SysEx or a short
+    message split across events): everything it packs takes the byte path"""
+    return tuple(None if entry else entry for entry in table)
+
+
+FAST_PATH = fast_path(drop_realtime=False)
+FAST_PATH_DROP_REALTIME = fast_path()
+BUSY_PATH = busy_path(FAST_PATH)
+BUSY_PATH_DROP_REALTIME = busy_path(FAST_PATH_DROP_REALTIME)
+
+
+class PacketRing:
+    """Preallocated USB-MIDI packet buffer.
+
+    Packets are packed straight into a single bytearray split into `slots`
+    equal regions. A flush writes the filled part of the current slot and
+    moves on to the next slot, so the memory of a write that is still in
+    flight is not reused by the next batch. Nothing is allocated per event;
+    pyusb only accepts array('B') without iterating, so a synchronous flush
+    costs one bulk copy per batch.
+    """
+
+    def __init__(self, slots=4, slot_packets=256):
+        self.slots = slots
+        self.slot_size = slot_packets * PACKET_SIZE
+        self._buf = bytearray(self.slot_size * slots)
+        self._view = memoryview(self._buf)
+        self._words = self._view.cast("I")
+        self._pack_into = USB_MIDI_PACKET.pack_into
+        self._slot = 0
+        self._start = 0
+        self._end = self.slot_size
+        self._pos = 0
+        # Optional latency.BridgeMetrics, and the perf_counter time the oldest
+        # input event in the current slot arrived (0 if unknown)
+        self.metrics = None
+        self.origin = 0.0
+        # Optional observer shown every slot before it is written (see
+        # device_state.DeviceState), and packets lost to failed writes
+        self.tracker = None
+        self.dropped = 0
+        # Packets handed to USB so far, and how many of those have finished
+        # (written or failed); equal once every write has completed
+        self.submitted = 0
+        self.done = 0
+        # Optional capture.CaptureJournal recording every slot written
+        self.journal = None
+        # Optional batching.FlushDeadline timing writes for pump_midi, and
+        # lanes.BulkLane holding SysEx back for short messages to pass
+        self.batcher = None
+        self.bulk = None
+
+    def __len__(self):
+        """Number of packets waiting in the current slot"""
+        return (self._pos - self._start) // PACKET_SIZE
+
+    @property
+    def full(self):
+        return self._pos >= self._end
+
+    def append(self, cin, b0, b1=0, b2=0):
+        """Pack one USB-MIDI event packet. Returns False if the slot is full."""
+        pos = self._pos
+        if pos >= self._end:
+            return False
+        self._pack_into(self._buf, pos, cin, b0, b1, b2)
+        self._pos = pos + PACKET_SIZE
+        return True
+
+    def pending(self):
+        """Memoryview over the packets waiting in the current slot"""
+        return self._view[self._start:self._pos]
+
+    def pending_bytes(self):
+        """Copy of the pending packets in a form pyusb accepts directly.
+
+        pyusb converts anything but array('B') itself, a memoryview byte by
+        byte, so this is the one copy a synchronous write makes.
+        """
+        data = array.array("B")
+        data.frombytes(self.pending())
+        return data
+
+    def advance(self):
+        """Release the current slot's packets and move to the next slot"""
+        self._slot = (self._slot + 1) % self.slots
+        self._start = self._slot * self.slot_size
+        self._end = self._start + self.slot_size
+        self._pos = self._start
+
+    def flush(self, dev, timeout=10):
+        """Write the pending packets to the SC-D70.
+
+        Returns the number of packets written. The slot is released even if
+        the write raises, matching the bridge's drop-on-error behaviour.
+        """
+        count = len(self)
+        origin = self.origin
+        self.origin = 0.0
+        if not count:
+            return 0
+        if self.tracker:
+            self.tracker.observe(self._buf, self._start, self._pos)
+        if self.journal:
+            self.journal.record(self._buf, self._start, self._pos)
+        submitted = time.perf_counter()
+        self.submitted += count
+        try:
+            dev.write(ENDPOINT_MIDI_OUT, self.pending_bytes(), timeout=timeout)
+        except Exception:
+            self.dropped += count
+            if self.metrics:
+                self.metrics.record_error()
+            raise
+        finally:
+            self.done += count
+            self.advance()
+        completed = time.perf_counter()
+        if self.metrics:
+            self.metrics.record_write(origin, submitted, completed, count)
+        if self.batcher:
+            self.batcher.record_write(completed - submitted)
+        return count
+
+    def drain(self, timeout=None):
+        """Wait for written packets to complete (synchronous writes already have)"""
+        return True
+
+    def close(self):
+        """Release the ring (nothing to do for synchronous writes)"""
+        pass
+
+
+class UsbMidiEncoder:
+    """Encodes one MIDI input stream into USB-MIDI event packets.
+
+    Complete short messages take the fast path: a single table
+    lookup per status byte, and the packet stored as one 32-bit word. SysEx (including pygame's 4-byte SysEx events),
+    running status and anything else irregular goes through a byte-level
+    state machine whose state carries over between calls, so messages split
+    across reads are framed correctly. Real-time bytes (0xF8 and above) are
+    dropped unless `drop_realtime` is False.
+
+    A `midi_filter` (see midi_filter.py) swaps in its compiled tables, so
+    filtering and transforming cost the same lookups as plain encoding.
+    """
+
+    def __init__(self, drop_realtime=True, midi_filter=None):
+        self.drop_realtime = drop_realtime
+        self.midi_filter = midi_filter
+        if midi_filter is None:
+            self.messages = MESSAGES
+            self.table = FAST_PATH_DROP_REALTIME if drop_realtime else FAST_PATH
+            self.busy_table = BUSY_PATH_DROP_REALTIME if drop_realtime else BUSY_PATH
+            self.pass_sysex = True
+        else:
+            self.messages = midi_filter.messages
+            self.table = fast_path(midi_filter.messages, drop_realtime)
+            self.busy_table = busy_path(self.table)
+            self.pass_sysex = midi_filter.sysex
+        self.running = 0      # running status (channel voice only)
+        self.msg = 0          # status of the short message being collected
+        self.need = 0         # data bytes that message needs
+        self.have = 0
+        self.d1 = 0
+        self.sysex = False
+        self.sx_count = 0     # SysEx bytes waiting for a full packet
+        self.sx0 = 0
+        self.sx1 = 0
+
+    def reset(self):
+        self.__init__(self.drop_realtime, self.midi_filter)
+
+    def _emit(self, ring, d2):
+        entry = self.messages[self.msg]
+        self.msg = 0
+        if entry:
+            cin, status, data1, data2 = entry
+            d1 = data1[self.d1]
+            if not d1 & DROP_MESSAGE:
+                ring.append(cin, status, d1, data2[d2])
+
+    def feed(self, ring, b):
+        """Encode one raw MIDI byte; emits at most one packet into `ring`"""
+        if b >= 0xF8:
+            if self.table[b] is None:
+                ring.append(CIN_SINGLE_BYTE, b)
+            return
+        if self.sysex:
+            if b < 0x80:
+                count = self.sx_count
+                if count == 2:
+                    ring.append(CIN_SYSEX, self.sx0, self.sx1, b)
+                    self.sx_count = 0
+                elif count == 1:
+                    self.sx1 = b
+                    self.sx_count = 2
+                else:
+                    self.sx0 = b
+                    self.sx_count = 1
+                return
+            self.sysex = False
+            if b == SYSEX_END:
+                count = self.sx_count
+                if count == 2:
+                    ring.append(CIN_SYSEX_END_3, self.sx0, self.sx1, b)
+                elif count == 1:
+                    ring.append(CIN_SYSEX_END_2, self.sx0, b)
+                else:
+                    ring.append(CIN_SYSEX_END_1, b)
+                return
+            # Any other status byte aborts the SysEx; its tail is dropped
+        if b == SYSEX_START:
+            self.running = 0
+            self.msg = 0
+            if not self.pass_sysex:
+                return           # its data bytes are dropped as stray
+            self.sysex = True
+            self.sx0 = b
+            self.sx_count = 1
+            return
+        if b >= 0x80:
+            length = MESSAGE_LENGTH[b]
+            if b >= 0xF0:
+                self.running = 0
+            else:
+                self.running = b
+            self.msg = b
+            self.need = length - 1
+            self.have = 0
+            self.d1 = 0
+            if length == 1:
+                self._emit(ring, 0)
+            elif not length:
+                self.msg = 0     # stray SysEx end
+            return
+        if not self.msg:
+            if not self.running:
+                return           # stray data byte
+            self.msg = self.running
+            self.need = MESSAGE_LENGTH[self.running] - 1
+            self.have = 0
+        if self.have or self.need == 1:
+            if self.need == 1:
+                self.d1 = b
+            self._emit(ring, b)
+        else:
+            self.d1 = b
+            self.have = 1
+
+    def encode_bytes(self, ring, data, start=0):
+        """Encode raw MIDI bytes from `data[start:]` until the slot fills.
+
+        Returns the index of the first byte not consumed (len(data) if all
+        were).
+        """
+        feed = self.feed
+        end = len(data)
+        i = start
+        while i < end:
+            if ring.full:
+                return i
+            if self.sysex and not self.sx_count:
+                i = self._pack_sysex_run(ring, data, i, end)
+                if i == end or ring.full:
+                    continue
+            feed(ring, data[i])
+            i += 1
+        return end
+
+    def _pack_sysex_run(self, ring, data, i, end):
+        """Pack whole 3-byte SysEx continuation packets straight from `data`"""
+        buf = ring._buf
+        pack_into = ring._pack_into
+        pos = ring._pos
+        limit = ring._end
+        while i + 3 <= end and pos < limit:
+            b0 = data[i]
+            b1 = data[i + 1]
+            b2 = data[i + 2]
+            if (b0 | b1 | b2) & 0x80:
+                break
+            pack_into(buf, pos, CIN_SYSEX, b0, b1, b2)
+            pos += PACKET_SIZE
+            i += 3
+        ring._pos = pos
+        return i
+
+    def feed_event(self, ring, data):
+        """Encode one pygame.midi event's data bytes through the state machine"""
+        feed = self.feed
+        if data[0] >= 0xF8:
+            # Realtime events are one byte; the rest is padding even mid-SysEx
+            feed(ring, data[0])
+            return
+        for b in data:
+            feed(ring, b)
+            if not (self.sysex or self.msg):
+                break
+
+    def _track_running(self, table, events, start, stop):
+        """Take the running status from the last of `events[start:stop]`
+        that went through fast-path `table`, if any did"""
+        for i in range(stop - 1, start - 1, -1):
+            status = events[i][0][0]
+            if table[status]:
+                self.running = status if status < 0xF0 else 0
+                return
+
+    def pack_events(self, ring, events, start=0, end=None):
+        """Pack pygame.midi events from `events[start:end]` until the slot fills.
+
+        Returns the index of the first event that did not fit (`end` if all
+        did).
+        """
+        if end is None:
+            end = len(events)
+        # Fast-path packets are stored as whole 32-bit words
+        words = ring._words
+        word = ring._pos // PACKET_SIZE
+        slot_end = ring._end // PACKET_SIZE
+        table = self.busy_table if self.sysex or self.msg else self.table
+        i = start
+        fast = start              # first event since the byte path last ran
+        while i < end:
+            # The fast path packs at most one packet per event, so a run no
+            # longer than the room left in the slot needs no check per event
+            stop = i + slot_end - word
+            if stop > end:
+                stop = end
+            elif stop <= i:
+                break
+            first = word
+            skipped = 0
+            # A whole read is iterated as is, which is cheaper than islice
+            run = events if not i and stop == len(events) else itertools.islice(events, i, stop)
+            for event in run:
+                data = event[0]
+                entry = table[data[0]]
+                if entry:
+                    data1, data2 = entry
+                    packet = data1[data[1]] | data2[data[2]]
+                    if packet >= 0:
+                        words[word] = packet
+                        word += 1
+                    else:
+                        skipped += 1
+                elif entry is False:
+                    skipped += 1
+                else:
+                    break
+            else:
+                i = stop
+                continue
+            # events[i] takes the byte path, which packs up to two packets
+            i += word - first + skipped
+            if word > slot_end - MAX_EVENT_PACKETS:
+                break
+            self._track_running(table, events, fast, i)
+            ring._pos = word * PACKET_SIZE
+            self.feed_event(ring, data)
+            word = ring._pos // PACKET_SIZE
+            table = self.busy_table if self.sysex or self.msg else self.table
+            i += 1
+            fast = i
+        if i > fast:
+            # Usually the last event: no need to look further back
+            status = events[i - 1][0][0]
+            if table[status]:
+                self.running = status if status < 0xF0 else 0
+            else:
+                self._track_running(table, events, fast, i - 1)
+        ring._pos = word * PACKET_SIZE
+        return i
+
+
+def encode_sysex(ring, sysex):
+    """Pack a complete SysEx message into `ring`"""
+    UsbMidiEncoder(drop_realtime=False).encode_bytes(ring, sysex)
+
+
+def stream_sysex(ring, dev, chunks, encoder=None, timeout=STREAM_TIMEOUT):
+    """Stream raw SysEx data to the SC-D70 one ring slot at a time.
+
+    `chunks` is an iterable of byte strings (e.g. from `read_chunks`), so a
+    bulk dump of any size is framed and sent without holding it in memory.
+    Each full slot is flushed before more is encoded; on the asynchronous
+    ring that flush only blocks while every slot is still on the bus, which
+    paces the encoder to the USB writer. Returns the packets written.
+    """
+    if encoder is None:
+        encoder = UsbMidiEncoder(drop_realtime=False)
+    written = 0
+    for chunk in chunks:
+        i = encoder.encode_bytes(ring, chunk)
+        while i < len(chunk):
+            written += ring.flush(dev, timeout)
+            i = encoder.encode_bytes(ring, chunk, i)
+    written += ring.flush(dev, timeout)
+    return written
+
+
+def read_chunks(path, size=SYSEX_CHUNK_SIZE):
+    """Yield a (.syx) file's bytes in `size` byte chunks"""
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def send_sysex(dev, sysex):
+    """Send SysEx message via USB MIDI"""
+    ring = PacketRing(slots=1, slot_packets=min((len(sysex) + 2) // 3, 256))
+    try:
+        stream_sysex(ring, dev, [sysex], timeout=100)
+    except:
+        pass
+
+
+def find_device():
+    """Locate the SC-D70 on the USB bus (None if absent)"""
+    if device_backend is not None:
+        devices = device_backend()
+        return devices[0] if devices else None
+    return usb.core.find(idVendor=VENDOR_ID, idProduct=PRODUCT_ID)
+
+
+def find_devices():
+    """Every SC-D70 on the USB bus"""
+    if device_backend is not None:
+        return list(device_backend())
+    return list(usb.core.find(find_all=True, idVendor=VENDOR_ID, idProduct=PRODUCT_ID))
+
+
+def device_id(dev):
+    """Stable name for one SC-D70: its serial number, else its bus/port path"""
+    try:
+        if dev.iSerialNumber:
+            serial = usb.util.get_string(dev, dev.iSerialNumber)
+            if serial:
+                return serial
+    except (usb.core.USBError, ValueError, NotImplementedError):
+        pass
+    ports = dev.port_numbers or ()
+    return f"{dev.bus}-{'.'.join(str(port) for port in ports) or dev.address}"
+
+
+def max_packet_size(dev, endpoint=ENDPOINT_MIDI_OUT):
+    """wMaxPacketSize of `endpoint` in the active configuration's descriptors
+    (FULL_SPEED_MAX_PACKET if they cannot be read, e.g. on a simulated unit)"""
+    try:
+        for intf in dev.get_active_configuration():
+            for ep in intf:
+                if ep.bEndpointAddress == endpoint:
+                    return ep.wMaxPacketSize & 0x7FF
+    except (AttributeError, usb.core.USBError, NotImplementedError):
+        pass
+    return FULL_SPEED_MAX_PACKET
+
+
+def configure_device(dev):
+    """Claim the SC-D70 and select the MIDI interface"""
+    for intf in [0, 1, 2]:
+        try:
+            if dev.is_kernel_driver_active(intf):
+                dev.detach_kernel_driver(intf)
+        except:
+            pass
+
+    dev.set_configuration()
+    dev.set_interface_altsetting(interface=2, alternate_setting=0)
+
+
+def pump_midi(midi_in, ring, dev, encoder, timeout=10, stream_timeout=STREAM_TIMEOUT):
+    """Drain all pending MIDI input into `ring` and write it to the SC-D70.
+
+    `encoder` holds the input's SysEx/running status state between calls,
+    so SysEx dumps arriving as many pygame events stream straight through.
+    Slots that fill up, and anything flushed mid-SysEx, are written with
+    `stream_timeout` so bulk data waits for the device rather than being
+    dropped. With `ring.metrics` set, each read's queueing and encode time
+    and the input time of each slot's oldest event are recorded too.
+    With `ring.batcher` set, a slot left partly filled waits for more input
+    until the batcher's deadline instead of being written at once. With
+    `ring.bulk` set, SysEx goes into that lane and tops up transfers behind
+    the short messages, one transfer per input read, until the lane is empty.
+    Returns the number of packets written; USB errors propagate to the
+    caller.
+    """
+    written = 0
+    metrics = ring.metrics
+    batcher = ring.batcher
+    bulk = ring.bulk
+    if metrics is None and batcher is None and bulk is None:
+        # Nothing to account for per read: pack and write
+        pack = encoder.pack_events
+        while midi_in.poll():
+            events = midi_in.read(MIDI_READ_SIZE)
+            i = pack(ring, events)
+            while i < len(events):
+                written += ring.flush(dev, stream_timeout)
+                i = pack(ring, events, i)
+        return written + ring.flush(dev, stream_timeout if encoder.sysex else timeout)
+    pack = encoder.pack_events if bulk is None else functools.partial(bulk.pack_events, encoder)
+    while True:
+        while midi_in.poll():
+            if bulk is not None and len(bulk) >= bulk.max:
+                break
+            events = midi_in.read(MIDI_READ_SIZE)
+            if batcher and events:
+                batcher.record_input(len(events), time.perf_counter())
+            if metrics and events:
+                dequeued = time.perf_counter()
+                age = midi_in.clock() - events[0][1]
+                origin = dequeued - age / 1000.0
+                if not ring.origin:
+                    ring.origin = origin
+            i = pack(ring, events)
+            while i < len(events):
+                written += ring.flush(dev, stream_timeout)
+                if batcher:
+                    batcher.opened = 0.0
+                if metrics:
+                    ring.origin = origin
+                i = pack(ring, events, i)
+            if metrics and events:
+                metrics.record_read(age, dequeued, time.perf_counter())
+            if bulk is not None and len(bulk) >= bulk.limit:
+                break
+        if bulk is not None and bulk.busy:
+            bulk.fill(ring)
+            written += ring.flush(dev, stream_timeout)
+            if batcher:
+                batcher.opened = 0.0
+            continue
+        if not batcher or not len(ring):
+            break
+        hold = batcher.hold(time.perf_counter())
+        if hold <= 0 or not midi_in.wait(hold):
+            break
+    if batcher:
+        batcher.opened = 0.0
+    written += ring.flush(dev, stream_timeout if encoder.sysex else timeout)
+    return written
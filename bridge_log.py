@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+SC-D70 Bridge Logging
+Non-blocking log records written to disk in batches by a background thread
+"""
+
+import collections
+import os
+import threading
+import time
+
+MAX_BYTES = 1024 * 1024
+BACKUPS = 3
+# Records buffered between writer passes; more are dropped and counted
+CAPACITY = 16384
+# Seconds between writer passes
+INTERVAL = 0.25
+# Repeats of a message within this many seconds are written as one summary
+WINDOW = 1.0
+
+
+class BridgeLog:
+    """Log file writer that never blocks the caller on disk I/O.
+
+    `log()` only touches a bounded deque, under a lock held for a few
+    bytecodes: a message identical to the newest queued record bumps that
+    record's count, anything else is appended as [time, message, count].
+    A daemon thread swaps the deque for an empty one every `interval`
+    seconds under the same lock, so no count changes once it has a batch,
+    formats the batch, writes it with one call and rotates the file at
+    `max_bytes` (keeping `backups` old files). The first occurrence of a
+    message is written as is; repeats within `window` seconds are written
+    as one "message ×4312 in last 1s" line.
+    """
+
+    def __init__(self, path, max_bytes=MAX_BYTES, backups=BACKUPS, capacity=CAPACITY,
+                 interval=INTERVAL, window=WINDOW):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.capacity = capacity
+        self.interval = interval
+        self.window = window
+        self.dropped = 0
+        self._reported_dropped = 0
+        self._lock = threading.Lock()
+        self._queue = collections.deque()
+        self._file = None
+        self._size = 0
+        # Message being collapsed, its window start, and the records whose
+        # counts are its repeats (counts are read late, when summarized)
+        self._repeat_msg = None
+        self._repeat_start = 0.0
+        self._repeats = []
+        self._running = True
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def log(self, msg):
+        """Queue one message; never blocks"""
+        with self._lock:
+            queue = self._queue
+            if queue and queue[-1][1] == msg:
+                queue[-1][2] += 1
+            elif len(queue) < self.capacity:
+                queue.append([time.time(), msg, 1])
+            else:
+                self.dropped += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._write_pending()
+        self._write_pending(final=True)
+
+    def _write_pending(self, final=False):
+        lines = []
+        with self._lock:
+            records, self._queue = self._queue, collections.deque()
+            dropped = self.dropped
+        for record in records:
+            t, msg = record[0], record[1]
+            if msg == self._repeat_msg and t - self._repeat_start < self.window:
+                self._repeats.append(record)
+                continue
+            self._summarize(lines, t)
+            lines.append(self._format(t, msg))
+            # The first record's own count beyond 1 are repeats too
+            record[2] -= 1
+            self._repeats = [record]
+            self._repeat_msg = msg
+            self._repeat_start = t
+        now = time.time()
+        if final or now - self._repeat_start >= self.window:
+            # Keep collapsing an ongoing storm; after a quiet window the
+            # next occurrence is written in full again
+            if not self._summarize(lines, now):
+                self._repeat_msg = None
+            self._repeat_start = now
+        if dropped != self._reported_dropped:
+            lines.append(self._format(now, f"Log queue full: {dropped - self._reported_dropped} "
+                                           f"records dropped"))
+            self._reported_dropped = dropped
+        if lines:
+            self._write("".join(lines))
+
+    def _summarize(self, lines, now):
+        count = sum(record[2] for record in self._repeats)
+        if count:
+            elapsed = max(self.window, now - self._repeat_start)
+            lines.append(self._format(now, f"{self._repeat_msg} ×{count} in last {elapsed:.0f}s"))
+        self._repeats = []
+        return count
+
+    def _format(self, t, msg):
+        return f"[{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(t))}] {msg}\n"
+
+    def _write(self, text):
+        try:
+            if self._file is None:
+                self._open()
+            self._file.write(text)
+            self._file.flush()
+            self._size = self._file.tell()
+            if self._size >= self.max_bytes:
+                self._rotate()
+        except OSError:
+            pass
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, "a")
+        self._size = self._file.tell()
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        for i in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{i}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{i + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def close(self):
+        """Write everything still queued and stop the writer thread"""
+        if not self._running:
+            return
+        self._running = False
+        self._stop.set()
+        self._thread.join()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -15,7 +15,7 @@ mkdir -p "$MACOS_DIR"
 mkdir -p "$RESOURCES_DIR"
 
 # Copy Python script
-cp midi_bridge.py "$RESOURCES_DIR/"
+cp midi_bridge.py bridge_core.py midi_input.py usb_async.py audio_capture.py pcm24.py resampler.py midi_filter.py latency.py supervisor.py device_state.py midi_merge.py multi_device.py scheduler.py smf.py capture.py sim_device.py synth_input.py batching.py lanes.py async_bridge.py "$RESOURCES_DIR/"
 
 # Create launcher script that opens in Terminal
 cat > "$MACOS_DIR/SC-D70 MIDI Terminal" << 'EOF'
@@ -25,7 +25,7 @@ cd "$(dirname "$0")/../Resources"
 # Check if virtual environment exists
 VENV_PATH="../../../venv"
 if [ ! -d "$VENV_PATH" ]; then
-    osascript -e 'display dialog "Virtual environment not found!\n\nPlease run setup first:\n\ncd to the repository folder and run:\npython3 -m venv venv\n./venv/bin/pip install pyusb pygame numpy" buttons {"OK"} default button 1 with icon stop'
+    osascript -e 'display dialog "Virtual environment not found!\n\nPlease run setup first:\n\ncd to the repository folder and run:\npython3 -m venv venv\n./venv/bin/pip install -r requirements.txt" buttons {"OK"} default button 1 with icon stop'
     exit 1
 fi
 
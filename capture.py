@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+SC-D70 Bridge Capture Journal
+Records every USB-MIDI packet sent to the SC-D70, for export to .mid or replay
+"""
+
+import array
+import mmap
+import struct
+import time
+
+from bridge_core import (
+    CIN_LENGTH, CIN_SYSEX, PACKET_SIZE, STREAM_TIMEOUT, SYSEX_END_CIN, SYSEX_START,
+    PacketRing,
+)
+
+JOURNAL_MAGIC = b"SCD70JNL"
+JOURNAL_VERSION = 1
+# Header: magic, version, record size, reserved, record count, start time (epoch s)
+_HEADER = struct.Struct("<8sHHIQd")
+_COUNT = struct.Struct("<Q")
+_COUNT_OFFSET = 16
+# Record: the 4 packet bytes, then the low 32 bits of the flush time in µs
+# since the journal started (little-endian, as on every Mac)
+_RECORD = struct.Struct("<4sI")
+RECORD_SIZE = _RECORD.size
+# Records the file grows by whenever it is full
+GROW_RECORDS = 1 << 16
+# A record starting with this byte (cable 15, never used) holds bits 32-55
+# of the time; one is written before any gap of half the 32-bit range or more
+TIME_MARK = 0xFF
+MARK_GAP = 1 << 31
+
+# .mid export: 960 ticks per quarter note at 96000 µs per quarter = 0.1 ms ticks
+EXPORT_DIVISION = 960
+EXPORT_TEMPO = 96000
+# Replay spins rather than sleeps for the last SPIN_MS before a batch is due
+SPIN_MS = 1.0
+
+
+class CaptureJournal:
+    """Append-only, memory-mapped journal of the packets a ring writes.
+
+    Set as `ring.journal`; every flush then appends each packet with the
+    flush time as a fixed 8-byte record. A flush costs two strided copies
+    into the map (one for the packets, one for the timestamp), whatever its
+    size, and the record count in the header is updated each time, so the
+    journal of a bridge that crashed is still readable. The file grows by
+    `grow` records when full and is trimmed to its records on close().
+    Only the thread that flushes the ring records.
+    """
+
+    def __init__(self, path, grow=GROW_RECORDS):
+        self.path = path
+        self.grow = grow
+        self.count = 0
+        self.capacity = 0
+        self.start = time.perf_counter()
+        self.epoch = time.time()
+        self._last = 0
+        self._file = open(path, "w+b")
+        self._map = None
+        self._words = None
+        self._source = None           # the ring buffer last recorded from
+        self._source_words = None
+        self._resize(grow)
+        _HEADER.pack_into(self._map, 0, JOURNAL_MAGIC, JOURNAL_VERSION, RECORD_SIZE, 0, 0,
+                          self.epoch)
+
+    def _resize(self, capacity):
+        if self._map is not None:
+            self._words.release()
+            self._map.close()
+        self._file.truncate(_HEADER.size + capacity * RECORD_SIZE)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        # The map as 32-bit words: a record is [packet, time]
+        self._words = memoryview(self._map).cast("I")
+        self.capacity = capacity
+
+    def _mark(self, now):
+        if self.count + 1 > self.capacity:
+            self._resize(self.capacity + self.grow)
+        _RECORD.pack_into(self._map, _HEADER.size + self.count * RECORD_SIZE,
+                          bytes((TIME_MARK,)) + (now >> 32).to_bytes(3, "little"),
+                          now & 0xFFFFFFFF)
+        self.count += 1
+
+    def record(self, buf, start, end):
+        """Append the packets in buf[start:end], stamped with the current time"""
+        n = (end - start) // PACKET_SIZE
+        now = int((time.perf_counter() - self.start) * 1e6)
+        if now - self._last >= MARK_GAP:
+            self._mark(now)
+        self._last = now
+        if self.count + n > self.capacity:
+            self._resize(max(self.capacity + self.grow, self.count + n))
+        if buf is not self._source:
+            # Rings never resize their buffer, so one word view of it is kept
+            self._release_source()
+            self._source = buf
+            self._source_words = memoryview(buf).cast("I")
+        words = self._words
+        first = (_HEADER.size // 4) + self.count * 2
+        if n == 1:
+            words[first] = self._source_words[start // 4]
+            words[first + 1] = now & 0xFFFFFFFF
+        else:
+            stop = first + n * 2
+            words[first:stop:2] = self._source_words[start // 4:end // 4]
+            words[first + 1:stop:2] = array.array("I", (now & 0xFFFFFFFF,)) * n
+        count = self.count = self.count + n
+        words[_COUNT_OFFSET // 4] = count & 0xFFFFFFFF
+        words[_COUNT_OFFSET // 4 + 1] = count >> 32
+
+    def _release_source(self):
+        if self._source_words is not None:
+            self._source_words.release()
+            self._source_words = None
+            self._source = None
+
+    def close(self):
+        if self._map is None:
+            return
+        _COUNT.pack_into(self._map, _COUNT_OFFSET, self.count)
+        self._release_source()
+        self._words.release()
+        self._map.close()
+        self._map = None
+        self._file.truncate(_HEADER.size + self.count * RECORD_SIZE)
+        self._file.close()
+
+
+class JournalReader:
+    """Reads a CaptureJournal file (also one a crashed bridge left behind)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        header = self._file.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            self._file.close()
+            raise ValueError(f"{path}: not a capture journal")
+        magic, version, size, _, count, self.epoch = _HEADER.unpack(header)
+        if magic != JOURNAL_MAGIC or version != JOURNAL_VERSION or size != RECORD_SIZE:
+            self._file.close()
+            raise ValueError(f"{path}: not a capture journal (version {JOURNAL_VERSION})")
+        self.data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.count = min(count, (len(self.data) - _HEADER.size) // RECORD_SIZE)
+
+    def packets(self):
+        """Yield (seconds since the capture started, 4-byte packet) per packet"""
+        data = self.data
+        unpack = _RECORD.unpack_from
+        high = 0
+        last = 0
+        for pos in range(_HEADER.size, _HEADER.size + self.count * RECORD_SIZE, RECORD_SIZE):
+            packet, low = unpack(data, pos)
+            if packet[0] == TIME_MARK:
+                high = int.from_bytes(packet[1:], "little") << 32
+                last = high | low
+                continue
+            stamp = high | low
+            if stamp < last:
+                # The 32-bit time wrapped since the previous record
+                high += 1 << 32
+                stamp += 1 << 32
+            last = stamp
+            yield stamp / 1e6, packet
+
+    def messages(self):
+        """Yield (seconds, MIDI message bytes) in packet order; SysEx comes
+        out whole at the time of its last packet, after any short messages
+        sent between its packets"""
+        sysex = None
+        for stamp, packet in self.packets():
+            cin = packet[0] & 0x0F
+            data = packet[1:1 + CIN_LENGTH[cin]]
+            if cin == CIN_SYSEX or (cin in SYSEX_END_CIN and (sysex is not None or
+                                                             data[0] == SYSEX_START)):
+                if sysex is None:
+                    sysex = bytearray()
+                sysex += data
+                if cin != CIN_SYSEX:
+                    yield stamp, bytes(sysex)
+                    sysex = None
+            elif data:
+                yield stamp, data
+
+    def close(self):
+        self.data.close()
+        self._file.close()
+
+
+def _vlq(value):
+    if value < 0:
+        raise ValueError(f"negative variable-length quantity: {value}")
+    out = bytearray((value & 0x7F,))
+    value >>= 7
+    while value:
+        out.insert(0, value & 0x7F | 0x80)
+        value >>= 7
+    return out
+
+
+def export_midi(path, out_path):
+    """Write journal `path` as a format 0 Standard MIDI File; returns the messages"""
+    journal = JournalReader(path)
+    tick_us = EXPORT_TEMPO / EXPORT_DIVISION
+    count = 0
+    try:
+        with open(out_path, "wb") as out:
+            out.write(b"MThd" + struct.pack(">IHHH", 6, 0, 1, EXPORT_DIVISION))
+            out.write(b"MTrk\0\0\0\0")
+            track_start = out.tell()
+            out.write(b"\x00\xFF\x51\x03" + EXPORT_TEMPO.to_bytes(3, "big"))
+            last = 0
+            for stamp, message in journal.messages():
+                tick = int(stamp * 1e6 / tick_us + 0.5)
+                # Times never go backwards in a journal, but a delta must not either
+                tick = max(tick, last)
+                out.write(_vlq(tick - last))
+                last = tick
+                if message[0] == SYSEX_START:
+                    out.write(b"\xF0" + _vlq(len(message) - 1) + message[1:])
+                elif message[0] < 0xF0:
+                    out.write(message)
+                else:
+                    # System messages (and SysEx the capture began inside of)
+                    # have no SMF event of their own: escape them
+                    out.write(b"\xF7" + _vlq(len(message)) + message)
+                count += 1
+            out.write(b"\x00\xFF\x2F\x00")
+            end = out.tell()
+            out.seek(track_start - 4)
+            out.write(struct.pack(">I", end - track_start))
+    finally:
+        journal.close()
+    return count
+
+
+def replay(path, dev, ring=None, speed=1.0):
+    """Write journal `path`'s packets to `dev` again, batch by batch, with
+    the original timing (scaled by 1 / `speed`); returns packets written"""
+    ring = ring or PacketRing()
+    journal = JournalReader(path)
+    written = 0
+    batch = None
+    start = time.perf_counter() * 1000.0
+    try:
+        for stamp, packet in journal.packets():
+            if stamp != batch:
+                written += ring.flush(dev, STREAM_TIMEOUT)
+                batch = stamp
+                due = start + stamp * 1000.0 / speed
+                until = due - time.perf_counter() * 1000.0
+                if until > SPIN_MS:
+                    time.sleep((until - SPIN_MS) / 1000.0)
+                while time.perf_counter() * 1000.0 < due:
+                    pass
+            if not ring.append(*packet):
+                written += ring.flush(dev, STREAM_TIMEOUT)
+                ring.append(*packet)
+        written += ring.flush(dev, STREAM_TIMEOUT)
+        ring.drain()
+    finally:
+        journal.close()
+    return written
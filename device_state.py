@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+SC-D70 Bridge Device State
+Mirror of the SC-D70's sound state, kept from the outgoing packet stream
+"""
+
+import array
+import collections
+import re
+
+from bridge_core import MASTER_VOL, PACKET_SIZE
+
+PARTS = 16
+
+# CC values after a GS Reset: volume 100, pan center, expression full,
+# reverb send 40, everything else 0
+CC_DEFAULTS = bytearray(128)
+CC_DEFAULTS[7] = 100
+CC_DEFAULTS[10] = 64
+CC_DEFAULTS[11] = 127
+CC_DEFAULTS[91] = 40
+
+CC_BANK_MSB, CC_BANK_LSB = 0, 32
+CC_DATA_MSB, CC_DATA_LSB = 6, 38
+CC_NRPN_LSB, CC_NRPN_MSB, CC_RPN_LSB, CC_RPN_MSB = 98, 99, 100, 101
+CC_RESET_ALL = 121
+# CCs that are not kept as plain values: parameter numbers and data entry
+# (tracked as RPN/NRPN values), increment/decrement and channel mode messages
+_CC_SKIP = frozenset((CC_BANK_MSB, CC_BANK_LSB, CC_DATA_MSB, CC_DATA_LSB, 96, 97,
+                      CC_NRPN_LSB, CC_NRPN_MSB, CC_RPN_LSB, CC_RPN_MSB) + tuple(range(120, 128)))
+# Reset All Controllers, as the SC-88 series implements it
+_CC_RESET = {1: 0, 11: 127, 64: 0, 65: 0, 66: 0, 67: 0}
+
+# RPN 0-2 (pitch bend sensitivity, fine tune, coarse tune) as 14-bit
+# values, with their GS Reset defaults
+RPN_DEFAULTS = (2 << 7, 0x40 << 7, 0x40 << 7)
+RPN_NULL = 0x3FFF
+BEND_CENTER = 0x2000
+
+ROLAND_ID = 0x41
+MODEL_GS = 0x42
+ROLAND_DT1 = 0x12
+# GS parameter memory: addresses 40 00 00 to 41 7F 7F (system, patch,
+# part and drum setup parameters), one byte per address
+GS_BASE = 0x40
+GS_SIZE = 2 << 14
+GS_LINE = 0x80
+GS_DEVICE_ID = 0x10
+# Longest SysEx the mirror reads: all of the GS parameter memory in one DT1
+SYSEX_MAX_BYTES = GS_SIZE + 16
+
+# Other short SysEx (non-GS parameters) is kept as sent
+OTHER_CAPACITY = 64
+OTHER_MAX_BYTES = 128
+
+# SysEx runs (continuation packets plus the end packet) and state-changing
+# channel messages (CC, program change, pitch bend), found by CIN
+_STATE_PACKETS = re.compile(b"\\x04+[\\x05-\\x07]?|[\\x05-\\x07\\x0b\\x0c\\x0e]")
+_SYSEX_END_BYTES = {0x5: 1, 0x6: 2, 0x7: 3}
+
+
+def is_reset(data):
+    """True for GS Reset (or mode set), GM System On or GM2 System On SysEx"""
+    return (data[1:2] == b"\x7E" and data[3:5] in (b"\x09\x01", b"\x09\x03")) or \
+        (data[1:2] == bytes([ROLAND_ID]) and data[3:8] == b"\x42\x12\x40\x00\x7F")
+
+
+def roland_dt1(address, data, device_id=GS_DEVICE_ID, model=MODEL_GS):
+    """Roland DT1 (data set) SysEx writing `data` from 3-byte `address`"""
+    body = bytes(address) + bytes(data)
+    return bytes((0xF0, ROLAND_ID, device_id, model, ROLAND_DT1)) + body + \
+        bytes(((-sum(body)) & 0x7F, 0xF7))
+
+
+class DeviceState:
+    """The SC-D70's sound state, as far as the bridge has set it.
+
+    Observes each ring slot before it is written (the CIN column is scanned
+    with a compiled regex, so notes cost nothing in Python) and keeps, per
+    part, every CC, the program, pitch bend and RPN 0-2 in flat arrays,
+    plus GS parameters written by DT1 SysEx in a byte-per-address map of
+    the GS parameter memory. NRPNs and other short SysEx are sparse and kept
+    in dicts. A GS or GM reset returns everything to its defaults.
+
+    Alongside each value a flag records whether it was set since the last
+    reset. `restore()` yields only those values, so restoring a song's setup
+    takes a few hundred bytes instead of replaying the song, and needs no
+    reset: a unit at its power-on (GS Reset) state ends up here, and so does
+    one that kept its state but missed writes dropped while it was offline.
+    """
+
+    def __init__(self):
+        self.cc = bytearray(PARTS * 128)
+        self.program = bytearray(PARTS)
+        self.bend = array.array("H", [BEND_CENTER] * PARTS)
+        self.rpn = array.array("H", RPN_DEFAULTS * PARTS)
+        # 1 where the value above was set since the last reset
+        self.cc_set = bytearray(PARTS * 128)
+        self.program_set = bytearray(PARTS)
+        self.bend_set = bytearray(PARTS)
+        self.rpn_set = bytearray(PARTS * len(RPN_DEFAULTS))
+        self.select = array.array("H", [RPN_NULL] * PARTS)   # parameter number
+        self.nrpn_selected = bytearray(PARTS)                # 1 if it is an NRPN
+        self.nrpn = {}                                       # (part, number) -> value
+        self.gs = bytearray(GS_SIZE)
+        self.gs_written = bytearray(GS_SIZE)
+        self.master_volume = bytes(MASTER_VOL)
+        self.master_volume_set = False
+        self.other = collections.OrderedDict()
+        self._sysex = bytearray()
+        self._sysex_open = False
+        self.reset()
+
+    def reset(self):
+        """Back to the state right after a GS Reset"""
+        self.cc[:] = CC_DEFAULTS * PARTS
+        self.program[:] = bytes(PARTS)
+        self.bend[:] = array.array("H", [BEND_CENTER] * PARTS)
+        self.rpn[:] = array.array("H", RPN_DEFAULTS * PARTS)
+        self.cc_set[:] = bytes(PARTS * 128)
+        self.program_set[:] = bytes(PARTS)
+        self.bend_set[:] = bytes(PARTS)
+        self.rpn_set[:] = bytes(PARTS * len(RPN_DEFAULTS))
+        self.select[:] = array.array("H", [RPN_NULL] * PARTS)
+        self.nrpn_selected[:] = bytes(PARTS)
+        self.nrpn.clear()
+        self.gs_written[:] = bytes(GS_SIZE)
+        self.master_volume = bytes(MASTER_VOL)
+        self.master_volume_set = False
+        self.other.clear()
+
+    def observe(self, buf, start, end):
+        for match in _STATE_PACKETS.finditer(buf[start:end:PACKET_SIZE]):
+            i = start + match.start() * PACKET_SIZE
+            cin = buf[i]
+            if cin == 0xB:
+                self._control(buf[i + 1] & 0x0F, buf[i + 2], buf[i + 3])
+            elif cin == 0xC:
+                part = buf[i + 1] & 0x0F
+                self.program[part] = buf[i + 2]
+                self.program_set[part] = 1
+            elif cin == 0xE:
+                part = buf[i + 1] & 0x0F
+                self.bend[part] = buf[i + 2] | buf[i + 3] << 7
+                self.bend_set[part] = 1
+            else:
+                j = start + match.end() * PACKET_SIZE
+                run = buf[i:j]
+                last = run[-PACKET_SIZE]
+                del run[::PACKET_SIZE]
+                if last in _SYSEX_END_BYTES:
+                    del run[len(run) - 3 + _SYSEX_END_BYTES[last]:]
+                    self._sysex_bytes(run, True)
+                else:
+                    self._sysex_bytes(run, False)
+
+    def _control(self, part, cc, value):
+        if cc not in _CC_SKIP or cc == CC_BANK_MSB or cc == CC_BANK_LSB:
+            self.cc[part * 128 + cc] = value
+            self.cc_set[part * 128 + cc] = 1
+        elif cc == CC_RPN_MSB or cc == CC_NRPN_MSB:
+            nrpn = cc == CC_NRPN_MSB
+            number = self.select[part] if self.nrpn_selected[part] == nrpn else RPN_NULL
+            self.select[part] = value << 7 | number & 0x7F
+            self.nrpn_selected[part] = nrpn
+        elif cc == CC_RPN_LSB or cc == CC_NRPN_LSB:
+            nrpn = cc == CC_NRPN_LSB
+            number = self.select[part] if self.nrpn_selected[part] == nrpn else RPN_NULL
+            self.select[part] = number & 0x3F80 | value
+            self.nrpn_selected[part] = nrpn
+        elif cc == CC_DATA_MSB or cc == CC_DATA_LSB:
+            self._data_entry(part, cc == CC_DATA_MSB, value)
+        elif cc == CC_RESET_ALL:
+            base = part * 128
+            for reset_cc, reset_value in _CC_RESET.items():
+                self.cc[base + reset_cc] = reset_value
+                self.cc_set[base + reset_cc] = 1
+            self.bend[part] = BEND_CENTER
+            self.bend_set[part] = 1
+            self.select[part] = RPN_NULL
+
+    def _data_entry(self, part, msb, value):
+        number = self.select[part]
+        if number == RPN_NULL:
+            return
+        if self.nrpn_selected[part]:
+            # GS NRPNs only use the data entry MSB
+            if msb:
+                self.nrpn[part, number] = value
+        elif number < len(RPN_DEFAULTS):
+            index = part * len(RPN_DEFAULTS) + number
+            current = self.rpn[index]
+            self.rpn[index] = value << 7 | current & 0x7F if msb else current & 0x3F80 | value
+            self.rpn_set[index] = 1
+
+    def _sysex_bytes(self, data, end):
+        if data[:1] == b"\xF0":
+            self._sysex[:] = data
+            self._sysex_open = True
+        elif self._sysex_open:
+            if len(self._sysex) <= SYSEX_MAX_BYTES:
+                self._sysex += data
+        else:
+            return        # no SysEx started, or single-byte System Common
+        if end:
+            self._sysex_open = False
+            if len(self._sysex) <= SYSEX_MAX_BYTES:
+                self._sysex_message(bytes(self._sysex))
+            self._sysex.clear()
+
+    def _sysex_message(self, data):
+        if is_reset(data):
+            self.reset()
+        elif len(data) > 10 and data[1] == ROLAND_ID and data[4] == ROLAND_DT1:
+            body = data[5:-1]
+            if sum(body) & 0x7F:
+                return            # bad checksum: the SC-D70 ignores it too
+            if data[3] == MODEL_GS and body[0] in (GS_BASE, GS_BASE + 1):
+                address = (body[0] - GS_BASE) << 14 | body[1] << 7 | body[2]
+                values = body[3:-1][:GS_SIZE - address]
+                self.gs[address:address + len(values)] = values
+                self.gs_written[address:address + len(values)] = b"\x01" * len(values)
+            elif len(data) <= OTHER_MAX_BYTES:
+                self._other(data[:8], data)
+        elif data[1:5] == b"\x7F\x7F\x04\x01" and len(data) == 8:
+            self.master_volume = data
+            self.master_volume_set = True
+        elif len(data) <= OTHER_MAX_BYTES:
+            self._other(data, data)
+
+    def _other(self, key, data):
+        other = self.other
+        if key in other:
+            other.move_to_end(key)
+        elif len(other) >= OTHER_CAPACITY:
+            other.popitem(last=False)
+        other[key] = data
+
+    def restore(self):
+        """Yield the MIDI messages that bring an SC-D70 at its power-on
+        state, or one that missed some of the writes, to this state"""
+        if self.master_volume_set:
+            yield self.master_volume
+        # GS parameters in address order, one DT1 per run of written bytes
+        # within a 128-byte address line
+        written = self.gs_written
+        for line in range(0, GS_SIZE, GS_LINE):
+            line_end = line + GS_LINE
+            start = written.find(1, line, line_end)
+            while start >= 0:
+                stop = written.find(0, start, line_end)
+                if stop < 0:
+                    stop = line_end
+                address = (GS_BASE + (start >> 14), start >> 7 & 0x7F, start & 0x7F)
+                yield roland_dt1(address, self.gs[start:stop])
+                start = written.find(1, stop, line_end)
+        yield from self.other.values()
+        for part in range(PARTS):
+            yield from self._restore_part(part)
+
+    def _restore_part(self, part):
+        cc = 0xB0 | part
+        base = part * 128
+        values = self.cc[base:base + 128]
+        written = self.cc_set[base:base + 128]
+        bank = written[CC_BANK_MSB] or written[CC_BANK_LSB]
+        if bank:
+            yield bytes((cc, CC_BANK_MSB, values[CC_BANK_MSB], cc, CC_BANK_LSB, values[CC_BANK_LSB]))
+        if bank or self.program_set[part]:
+            yield bytes((0xC0 | part, self.program[part]))
+        number = written.find(1)
+        while number >= 0:
+            if number not in _CC_SKIP:
+                yield bytes((cc, number, values[number]))
+            number = written.find(1, number + 1)
+        selected = False
+        for number in range(len(RPN_DEFAULTS)):
+            index = part * len(RPN_DEFAULTS) + number
+            if self.rpn_set[index]:
+                value = self.rpn[index]
+                selected = True
+                yield bytes((cc, CC_RPN_MSB, 0, cc, CC_RPN_LSB, number,
+                             cc, CC_DATA_MSB, value >> 7, cc, CC_DATA_LSB, value & 0x7F))
+        for (nrpn_part, number), value in self.nrpn.items():
+            if nrpn_part == part:
+                selected = True
+                yield bytes((cc, CC_NRPN_MSB, number >> 7, cc, CC_NRPN_LSB, number & 0x7F,
+                             cc, CC_DATA_MSB, value))
+        # Leave the same parameter selected as before, so later data entry
+        # lands where the sender expects
+        number = self.select[part]
+        if selected or number != RPN_NULL:
+            msb, lsb = (CC_NRPN_MSB, CC_NRPN_LSB) if self.nrpn_selected[part] else (CC_RPN_MSB, CC_RPN_LSB)
+            yield bytes((cc, msb, number >> 7, cc, lsb, number & 0x7F))
+        if self.bend_set[part]:
+            yield bytes((0xE0 | part, self.bend[part] & 0x7F, self.bend[part] >> 7))
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+SC-D70 Bridge Device Watching
+libusb hotplug notifications for the SC-D70 and change detection for MIDI ports
+"""
+
+import collections
+import ctypes
+import threading
+
+import usb.core
+from usb.backend import libusb1
+
+import bridge_core
+from bridge_core import PRODUCT_ID, VENDOR_ID, find_device
+
+try:
+    import rtmidi
+except ImportError:
+    rtmidi = None
+
+LIBUSB_CAP_HAS_HOTPLUG = 0x0001
+LIBUSB_HOTPLUG_EVENT_DEVICE_ARRIVED = 0x01
+LIBUSB_HOTPLUG_EVENT_DEVICE_LEFT = 0x02
+LIBUSB_HOTPLUG_ENUMERATE = 0x01
+LIBUSB_HOTPLUG_MATCH_ANY = -1
+
+# libusb_handle_events_timeout period, bounds how long stop() waits
+EVENT_TIMEOUT_US = 100000
+# Bus scan period when hotplug is unavailable
+POLL_INTERVAL = 1.0
+# MIDI port list check period
+PORT_INTERVAL = 1.0
+
+_hotplug_cb_fn_p = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p,
+                                    ctypes.c_int, ctypes.c_void_p)
+
+
+class _timeval(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long),
+                ("tv_usec", ctypes.c_long)]
+
+
+class HotplugWatcher:
+    """Tracks the SC-D70 through libusb hotplug callbacks.
+
+    Registers on pyusb's own libusb context with LIBUSB_HOTPLUG_ENUMERATE,
+    so a device already plugged in is reported (and cached in `device`)
+    before start() returns, without a bus scan. The libusb callback only
+    queues the event; `on_arrived(device)` and `on_left()` run on the
+    watcher thread right after libusb returns from event handling.
+    """
+
+    def __init__(self, on_arrived, on_left, backend, vendor_id=VENDOR_ID, product_id=PRODUCT_ID):
+        self.on_arrived = on_arrived
+        self.on_left = on_left
+        self.backend = backend
+        self.lib = backend.lib
+        self.vendor_id = vendor_id
+        self.product_id = product_id
+        self.device = None
+        self._events = collections.deque()
+        self._callback = _hotplug_cb_fn_p(self._hotplug)
+        self._handle = ctypes.c_int()
+        self._running = False
+        self._thread = None
+
+    def _hotplug(self, ctx, devid, event, user_data):
+        # Only libusb_device functions are safe here: take a reference and
+        # leave everything else to the watcher thread
+        if event == LIBUSB_HOTPLUG_EVENT_DEVICE_ARRIVED:
+            self._events.append((event, libusb1._Device(devid)))
+        else:
+            self._events.append((event, None))
+        return 0
+
+    def start(self):
+        lib = self.lib
+        lib.libusb_hotplug_register_callback.argtypes = [
+            ctypes.c_void_p, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+            ctypes.c_int, _hotplug_cb_fn_p, ctypes.c_void_p, ctypes.POINTER(ctypes.c_int)]
+        lib.libusb_hotplug_deregister_callback.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        lib.libusb_handle_events_timeout.argtypes = [ctypes.c_void_p, ctypes.POINTER(_timeval)]
+        result = lib.libusb_hotplug_register_callback(
+            self.backend.ctx,
+            LIBUSB_HOTPLUG_EVENT_DEVICE_ARRIVED | LIBUSB_HOTPLUG_EVENT_DEVICE_LEFT,
+            LIBUSB_HOTPLUG_ENUMERATE, self.vendor_id, self.product_id,
+            LIBUSB_HOTPLUG_MATCH_ANY, self._callback, None, ctypes.byref(self._handle))
+        if result < 0:
+            raise usb.core.USBError(libusb1._strerror(result), result,
+                                    libusb1._libusb_errno.get(result))
+        # Enumerated devices were queued during registration
+        self._dispatch(notify=False)
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        tv = _timeval(0, EVENT_TIMEOUT_US)
+        while self._running:
+            self.lib.libusb_handle_events_timeout(self.backend.ctx, ctypes.byref(tv))
+            self._dispatch()
+
+    def _dispatch(self, notify=True):
+        while self._events:
+            event, devid = self._events.popleft()
+            if event == LIBUSB_HOTPLUG_EVENT_DEVICE_ARRIVED:
+                self.device = usb.core.Device(devid, self.backend)
+                if notify:
+                    self.on_arrived(self.device)
+            else:
+                self.device = None
+                if notify:
+                    self.on_left()
+
+    def stop(self):
+        if not self._running:
+            return
+        self._running = False
+        self._thread.join()
+        self.lib.libusb_hotplug_deregister_callback(self.backend.ctx, self._handle.value)
+
+
+class PollingWatcher:
+    """HotplugWatcher stand-in that scans the bus every `interval` seconds"""
+
+    def __init__(self, on_arrived, on_left, interval=POLL_INTERVAL):
+        self.on_arrived = on_arrived
+        self.on_left = on_left
+        self.interval = interval
+        self.device = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.device = find_device()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                device = find_device()
+            except usb.core.USBError:
+                continue
+            if device is not None and self.device is None:
+                self.device = device
+                self.on_arrived(device)
+            elif device is None and self.device is not None:
+                self.device = None
+                self.on_left()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+
+def watch_device(on_arrived, on_left):
+    """Start watching for the SC-D70: hotplug if libusb supports it, else polling"""
+    if bridge_core.device_backend is not None:
+        # Simulated devices are not on libusb's bus
+        return PollingWatcher(on_arrived, on_left).start()
+    backend = libusb1.get_backend()
+    if backend is not None and backend.lib.libusb_has_capability(LIBUSB_CAP_HAS_HOTPLUG):
+        try:
+            return HotplugWatcher(on_arrived, on_left, backend).start()
+        except usb.core.USBError:
+            pass
+    return PollingWatcher(on_arrived, on_left).start()
+
+
+class MidiPortWatcher:
+    """Calls `on_change(names)` when the MIDI input port names change.
+
+    pygame only enumerates ports at init, so the live list comes from a
+    single persistent python-rtmidi client; comparing name lists is cheap
+    enough to do every `interval` seconds. Without python-rtmidi nothing
+    changes and no thread is started.
+    """
+
+    def __init__(self, on_change, interval=PORT_INTERVAL):
+        self.on_change = on_change
+        self.interval = interval
+        self.names = []
+        self._probe = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if rtmidi is None:
+            return self
+        self._probe = rtmidi.MidiIn()
+        self.names = self._probe.get_ports()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            names = self._probe.get_ports()
+            if names != self.names:
+                self.names = names
+                self.on_change(names)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        if self._probe is not None:
+            self._probe.delete()
+            self._probe = None
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+SC-D70 Bridge Output Lanes
+Keeps bulk SysEx in a lane of its own so notes and real-time go out ahead of it
+"""
+
+from bridge_core import (
+    MAX_EVENT_PACKETS, PACKET_SIZE, SYSEX_END, SYSEX_START, USB_MIDI_PACKET, UsbMidiEncoder,
+)
+
+# Packets waiting in the bulk lane above which pump_midi writes a transfer
+# after every input read (64 full-speed transfers), and above which it stops
+# reading until the lane is back under it (64 KiB of packets)
+BULK_LIMIT = 1024
+BULK_MAX = 16384
+# Initial size of the lane's buffer in packets; it grows when needed
+BULK_PACKETS = 1024
+
+
+class BulkLane:
+    """SysEx lane between the MIDI input and a ring's transfers.
+
+    Set as `ring.bulk` (open_ring does). pump_midi then packs SysEx into
+    this lane with the lane's own encoder, and everything else into the
+    ring's slot as before. Each transfer carries the short messages waiting
+    in the slot first and is topped up with bulk packets, and the input is
+    read again between transfers, so a note played during a dump waits for
+    the transfers already on the bus rather than for the rest of the dump.
+    USB-MIDI frames every packet with its own CIN, so the SC-D70 takes
+    channel and real-time messages between the packets of a SysEx.
+    stream() sends a .syx file through the lane the same way.
+    """
+
+    def __init__(self, limit=BULK_LIMIT, maximum=BULK_MAX):
+        self.limit = limit
+        self.max = maximum
+        self.encoder = UsbMidiEncoder(drop_realtime=False)
+        self.packets = 0              # packets moved into transfers so far
+        self._buf = bytearray(BULK_PACKETS * PACKET_SIZE)
+        self._pack_into = USB_MIDI_PACKET.pack_into
+        self._head = 0
+        self._pos = 0
+        self._end = len(self._buf)
+        self._chunks = None
+        self._stream_encoder = UsbMidiEncoder(drop_realtime=False)
+
+    def __len__(self):
+        """Number of packets waiting in the lane"""
+        return (self._pos - self._head) // PACKET_SIZE
+
+    @property
+    def full(self):
+        return self._pos >= self._end
+
+    @property
+    def busy(self):
+        """True while packets are waiting or a stream() is not yet encoded"""
+        return self._pos > self._head or self._chunks is not None
+
+    def reset(self):
+        """Drop the waiting packets, any stream() and the SysEx in progress
+        (after a reopen the SC-D70 never saw its start); returns the number
+        of packets dropped"""
+        dropped = len(self)
+        self._head = self._pos = 0
+        self._chunks = None
+        self.encoder.reset()
+        self._stream_encoder.reset()
+        return dropped
+
+    def append(self, cin, b0, b1=0, b2=0):
+        """Pack one USB-MIDI event packet (the lane grows, so never False)"""
+        self.reserve(1)
+        self._pack_into(self._buf, self._pos, cin, b0, b1, b2)
+        self._pos += PACKET_SIZE
+        return True
+
+    def reserve(self, packets):
+        """Make room for `packets` more packets"""
+        size = packets * PACKET_SIZE
+        if self._pos + size <= self._end:
+            return
+        pending = self._pos - self._head
+        if self._head:
+            self._buf[:pending] = self._buf[self._head:self._pos]
+            self._head = 0
+            self._pos = pending
+        if pending + size > len(self._buf):
+            self._buf.extend(bytes(max(len(self._buf), pending + size - len(self._buf))))
+        self._end = len(self._buf)
+
+    def pack_events(self, encoder, ring, events, start=0):
+        """encoder.pack_events with SysEx diverted into the lane.
+
+        Returns the index of the first event that did not fit in `ring`'s
+        slot (len(events) if all did).
+        """
+        if not encoder.pass_sysex:
+            return encoder.pack_events(ring, events, start)
+        sysex = self.encoder
+        end = len(events)
+        i = start
+        while i < end:
+            status = events[i][0][0]
+            if status == SYSEX_START or sysex.sysex and (status < 0x80 or status == SYSEX_END):
+                self.reserve(MAX_EVENT_PACKETS)
+                sysex.feed_event(self, events[i][0])
+                i += 1
+                continue
+            # A run of short messages for the ring. They do not end a SysEx
+            # in progress: merged inputs send other inputs' notes between its
+            # chunks, and a new SysEx start still ends an unfinished one.
+            j = i + 1
+            while j < end:
+                status = events[j][0][0]
+                if status == SYSEX_START or sysex.sysex and (status < 0x80 or status == SYSEX_END):
+                    break
+                j += 1
+            i = encoder.pack_events(ring, events, i, j)
+            if i < j:
+                return i
+        return end
+
+    def stream(self, chunks):
+        """Send raw SysEx data (e.g. read_chunks of a .syx file) through the lane"""
+        self._chunks = iter(chunks)
+
+    def _refill(self, packets):
+        # Whole messages only, so they never interleave with SysEx from the input
+        encoder = self._stream_encoder
+        while (len(self) < packets or encoder.sysex) and self._chunks is not None:
+            try:
+                chunk = next(self._chunks, None)
+            except Exception:
+                self._chunks = None
+                raise
+            if chunk is None:
+                self._chunks = None
+                break
+            self.reserve(len(chunk) // 3 + MAX_EVENT_PACKETS)
+            encoder.encode_bytes(self, chunk)
+
+    def fill(self, ring):
+        """Move waiting packets into the free part of `ring`'s current slot"""
+        space = ring._end - ring._pos
+        if self._chunks is not None and not self.encoder.sysex:
+            self._refill(space // PACKET_SIZE)
+        size = min(space, self._pos - self._head)
+        if not size:
+            return
+        head = self._head
+        ring._buf[ring._pos:ring._pos + size] = self._buf[head:head + size]
+        ring._pos += size
+        self._head = head + size
+        self.packets += size // PACKET_SIZE
+        if self._head == self._pos:
+            self._head = self._pos = 0
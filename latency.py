@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+SC-D70 Bridge Latency Instrumentation
+Fixed-size histograms of MIDI input to USB write completion latency
+"""
+
+import array
+
+# Sub-bucket bits: values are kept to within 1/64 (~1.6%) of their magnitude
+SUB_BITS = 7
+# Largest recordable value is 2**MAX_BITS - 1 (in microseconds ~71 minutes)
+MAX_BITS = 32
+
+
+class Histogram:
+    """Log-linear histogram of non-negative integers (HdrHistogram layout).
+
+    Values below 2**sub_bits get a bucket each; above that every power of
+    two is split into 2**(sub_bits - 1) buckets. All counts live in one
+    preallocated array, so recording never allocates.
+    """
+
+    def __init__(self, sub_bits=SUB_BITS, max_bits=MAX_BITS):
+        self.sub_bits = sub_bits
+        self.half = 1 << (sub_bits - 1)
+        self.highest = (1 << max_bits) - 1
+        self.counts = array.array("Q", bytes(8 * (max_bits - sub_bits + 2) * self.half))
+        self.total = 0
+        self.max = 0
+
+    def index(self, value):
+        shift = value.bit_length() - self.sub_bits
+        if shift <= 0:
+            return value
+        return shift * self.half + (value >> shift)
+
+    def value_at(self, index):
+        """Highest value that lands in bucket `index`"""
+        shift = index // self.half - 1
+        if shift <= 0:
+            return index
+        return ((index - shift * self.half + 1) << shift) - 1
+
+    def record(self, value):
+        if value < 0:
+            value = 0
+        elif value > self.highest:
+            value = self.highest
+        self.counts[self.index(value)] += 1
+        self.total += 1
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        """Value at or below which `p` percent of recorded values fall"""
+        if not self.total:
+            return 0
+        target = max(1, int(self.total * p / 100.0 + 0.5))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count:
+                seen += count
+                if seen >= target:
+                    return min(self.value_at(index), self.max)
+        return self.max
+
+    def reset(self):
+        for index in range(len(self.counts)):
+            self.counts[index] = 0
+        self.total = 0
+        self.max = 0
+
+
+class BridgeMetrics:
+    """Per-batch latency of the MIDI IN -> USB OUT path, in microseconds.
+
+    `queue` is input timestamp to dequeue (time spent in the input buffer),
+    `encode` is dequeue to packed, `write` is USB submission to completion
+    and `total` is the oldest input event of a batch to its USB completion.
+    `batch` holds packets per USB write. The bridge thread records queue and
+    encode; write/total may be recorded from the USB event thread.
+    """
+
+    def __init__(self):
+        self.queue = Histogram()
+        self.encode = Histogram()
+        self.write = Histogram()
+        self.total = Histogram()
+        self.batch = Histogram()
+        self.packets = 0
+        self.write_errors = 0
+
+    def record_read(self, age_ms, dequeued, encoded):
+        """One input read: oldest event age at dequeue, perf_counter times"""
+        self.queue.record(int(age_ms * 1000))
+        self.encode.record(int((encoded - dequeued) * 1e6))
+
+    def record_write(self, origin, submitted, completed, packets):
+        """One completed USB write; `origin` is 0 if no input time is known"""
+        self.write.record(int((completed - submitted) * 1e6))
+        if origin:
+            self.total.record(int((completed - origin) * 1e6))
+        self.batch.record(packets)
+        self.packets += packets
+
+    def record_error(self):
+        self.write_errors += 1
+
+    def reset(self):
+        for hist in (self.queue, self.encode, self.write, self.total, self.batch):
+            hist.reset()
+        self.packets = 0
+        self.write_errors = 0
+
+    def stats(self):
+        """p50/p99/p99.9 of every histogram (latencies in ms)"""
+        stats = {"packets": self.packets, "writes": self.batch.total,
+                 "write_errors": self.write_errors}
+        for name in ("queue", "encode", "write", "total"):
+            hist = getattr(self, name)
+            stats[name] = {"p50": hist.percentile(50) / 1000.0,
+                           "p99": hist.percentile(99) / 1000.0,
+                           "p999": hist.percentile(99.9) / 1000.0,
+                           "max": hist.max / 1000.0}
+        stats["batch"] = {"p50": self.batch.percentile(50), "p99": self.batch.percentile(99),
+                          "max": self.batch.max}
+        return stats
+
+    def summary(self):
+        """One-line latency summary for logs and the menu bar"""
+        total = self.stats()["total"]
+        return (f"p50 {total['p50']:.2f} ms, p99 {total['p99']:.2f} ms, "
+                f"p99.9 {total['p999']:.2f} ms, {self.write_errors} errors")
+
+    def report(self):
+        """Multi-line table of every histogram"""
+        stats = self.stats()
+        lines = [f"{'':<8}{'p50':>9}{'p99':>9}{'p99.9':>9}{'max':>9}  (ms)"]
+        for name in ("queue", "encode", "write", "total"):
+            s = stats[name]
+            lines.append(f"{name:<8}{s['p50']:>9.3f}{s['p99']:>9.3f}{s['p999']:>9.3f}{s['max']:>9.3f}")
+        batch = stats["batch"]
+        lines.append(f"batches: {stats['writes']}, packets: {stats['packets']}, "
+                     f"batch size p50 {batch['p50']} / p99 {batch['p99']} / max {batch['max']}, "
+                     f"write errors: {stats['write_errors']}")
+        return "\n".join(lines)
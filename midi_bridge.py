@@ -7,38 +7,235 @@ Enables MIDI communication with Roland SC-D70 via USB on macOS
 import usb.core
 import usb.util
 import pygame.midi
+import argparse
 import time
 import sys
 
-# SC-D70 USB IDs
-VENDOR_ID = 0x0582
-PRODUCT_ID = 0x000c
-ENDPOINT_MIDI_OUT = 0x02
+from batching import FLUSH_DEADLINE
+from bridge_core import (
+    GS_RESET, MASTER_VOL, UsbMidiEncoder,
+    configure_device, find_device, find_devices, read_chunks, send_sysex, stream_sysex,
+)
+from capture import CaptureJournal, export_midi, replay
+from latency import BridgeMetrics
+from midi_filter import CONFIG_FILE, load_filter
+from midi_input import BACKEND_EVENT, BACKEND_POLL, open_input
+from midi_merge import MergedInput
+from multi_device import load_units, start_units
+from scheduler import SCHEDULE_DELAY, ScheduledInput
+from sim_device import SimulatedBus
+from smf import ALL_NOTES_OFF, SmfInput
+from supervisor import BridgeSupervisor
+from synth_input import PATTERNS, SYNTH_RATE, open_synth
+from usb_async import open_ring
 
-# SysEx initialization messages
-GS_RESET = [0xF0, 0x41, 0x10, 0x42, 0x12, 0x40, 0x00, 0x7F, 0x00, 0x41, 0xF7]
-MASTER_VOL = [0xF0, 0x7F, 0x7F, 0x04, 0x01, 0x00, 0x7F, 0xF7]
+# Seconds between latency summaries with --latency
+LATENCY_INTERVAL = 10
 
-def send_sysex(dev, sysex):
-    """Send SysEx message via USB MIDI"""
-    packets = []
-    for i in range(0, len(sysex), 3):
-        chunk = sysex[i:i+3]
-        cin = 0x07 if len(chunk) == 3 and chunk[2] == 0xF7 else 0x04
-        p = [cin, 0, 0, 0]
-        for j, b in enumerate(chunk):
-            p[1+j] = b
-        packets.extend(p)
+def parse_args():
+    parser = argparse.ArgumentParser(description="SC-D70 MIDI Bridge")
+    parser.add_argument("command", nargs="?", choices=["bridge", "play", "export", "replay"],
+                        default="bridge",
+                        help="bridge a MIDI input (default), play Standard MIDI Files, "
+                             "export a capture journal to .mid or replay it into the SC-D70")
+    parser.add_argument("files", nargs="*", metavar="FILE",
+                        help="play: .mid files, in order; export: journal and .mid file; "
+                             "replay: journal")
+    parser.add_argument("--input-backend", choices=[BACKEND_EVENT, BACKEND_POLL],
+                        default=BACKEND_EVENT,
+                        help="wake on MIDI input callbacks (event) or poll every 1ms (poll)")
+    parser.add_argument("--audio-out", metavar="DEVICE",
+                        help="also stream the SC-D70's USB audio to this output device (index or name)")
+    parser.add_argument("--latency", action="store_true",
+                        help="record input-to-USB latency; print a summary every 10s and a report on exit")
+    parser.add_argument("--config", metavar="FILE", default=CONFIG_FILE,
+                        help="config file whose \"filters\" rules are applied to the MIDI stream")
+    parser.add_argument("--send-syx", metavar="FILE",
+                        help="stream a .syx file (e.g. a GS bulk dump) to the SC-D70 before bridging")
+    parser.add_argument("--schedule", metavar="MS", type=float, nargs="?", const=SCHEDULE_DELAY,
+                        help=f"send each event at its input timestamp + MS (default {SCHEDULE_DELAY:g}) "
+                             "for constant latency instead of as soon as it is polled")
+    parser.add_argument("--audio-native", action="store_true",
+                        help="read USB audio with the research/usb_reader C extension")
+    parser.add_argument("--capture", metavar="FILE",
+                        help="record every USB-MIDI packet sent to the SC-D70 in a journal file")
+    parser.add_argument("--synth", metavar="PATTERN",
+                        help="bridge generated traffic instead of a MIDI input: "
+                             f"{', '.join(PATTERNS)}, or a capture journal to replay")
+    parser.add_argument("--synth-rate", metavar="BYTES", type=float, default=SYNTH_RATE,
+                        help=f"MIDI bytes per second for --synth patterns (default {SYNTH_RATE}, "
+                             "0 for as fast as the SC-D70 takes them)")
+    parser.add_argument("--flush-deadline", metavar="MS", type=float, default=FLUSH_DEADLINE,
+                        help=f"longest a partly filled USB transfer waits for more MIDI under load "
+                             f"(default {FLUSH_DEADLINE:g}, 0 to write every event at once)")
+    parser.add_argument("--simulate", metavar="UNITS", type=int, nargs="?", const=1,
+                        help="use simulated SC-D70s (default 1) instead of USB, for testing "
+                             "without hardware")
+    return parser.parse_args()
+
+def start_audio(dev, device, native):
+    """Start USB audio capture to output `device` (index or name)"""
+    # numpy/sounddevice are only needed when audio capture is requested
+    import audio_capture
+    if device.isdigit():
+        device = int(device)
+    read = audio_capture.native_reader() if native else audio_capture.pyusb_reader(dev)
+    capture = audio_capture.AudioCapture(read, output_device=device)
+    capture.start()
+    return capture
+
+def play(args, midi_filter):
+    """Play Standard MIDI Files straight into the SC-D70"""
+    if not args.files:
+        print("Error: play needs one or more .mid files")
+        return 1
+    print("\nConnecting to SC-D70...")
+    dev = find_device()
+    if not dev:
+        print("Error: SC-D70 not found!")
+        return 1
+    configure_device(dev)
+    send_sysex(dev, GS_RESET)
+    time.sleep(0.2)
+    send_sysex(dev, MASTER_VOL)
+    
+    ring = open_ring(dev, deadline=args.flush_deadline)
+    encoder = UsbMidiEncoder(midi_filter=midi_filter)
+    metrics = None
+    if args.latency:
+        metrics = BridgeMetrics()
+        ring.metrics = metrics
+    journal = None
+    if args.capture:
+        journal = ring.journal = CaptureJournal(args.capture)
+    # Each file becomes the supervisor's input in turn
+    supervisor = BridgeSupervisor(dev, ring, None, encoder)
     try:
-        dev.write(ENDPOINT_MIDI_OUT, packets, timeout=100)
-    except:
-        pass
+        for path in args.files:
+            try:
+                smf = SmfInput(path)
+            except (OSError, ValueError) as e:
+                print(f"Error: {e}")
+                continue
+            print(f"Playing {path} ({len(smf.smf.tracks)} tracks)... Ctrl+C to stop")
+            supervisor.midi_in = smf
+            start = time.perf_counter()
+            try:
+                while not smf.done:
+                    if smf.wait(0.5):
+                        supervisor.pump()
+                supervisor.ring.drain()
+            finally:
+                smf.close()
+            print(f"Played {smf.count} messages in {time.perf_counter() - start:.1f}s")
+    except KeyboardInterrupt:
+        print("\n\nStopping playback...")
+        try:
+            stream_sysex(supervisor.ring, supervisor.dev, [ALL_NOTES_OFF])
+            supervisor.ring.drain()
+        except usb.core.USBError:
+            pass
+    finally:
+        supervisor.close()
+        if supervisor.recoveries or supervisor.lost:
+            print(f"USB: {supervisor.recoveries} recoveries, {supervisor.lost} packets lost")
+        if journal:
+            journal.close()
+            print(f"Captured {journal.count} packets to {args.capture}")
+        if metrics:
+            print("\nLatency (file event due -> USB write complete):")
+            print(metrics.report())
+        usb.util.dispose_resources(supervisor.dev)
+        print("Done.\n")
+    return 0
 
-def main():
-    print("=" * 60)
-    print("SC-D70 MIDI Bridge")
+def export_journal(args):
+    """Write a capture journal as a Standard MIDI File"""
+    if len(args.files) != 2:
+        print("Error: export needs a journal and a .mid file")
+        return 1
+    try:
+        count = export_midi(*args.files)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        return 1
+    print(f"Exported {count} messages to {args.files[1]}")
+    return 0
+
+def replay_journal(args):
+    """Send a capture journal's packets to the SC-D70 with their original timing"""
+    if len(args.files) != 1:
+        print("Error: replay needs one journal")
+        return 1
+    dev = find_device()
+    if not dev:
+        print("Error: SC-D70 not found!")
+        return 1
+    configure_device(dev)
+    ring = open_ring(dev)
+    print(f"Replaying {args.files[0]}... Ctrl+C to stop")
+    try:
+        packets = replay(args.files[0], dev, ring)
+        print(f"Replayed {packets} packets")
+    except KeyboardInterrupt:
+        print("\n\nStopping replay...")
+    except (OSError, ValueError, usb.core.USBError) as e:
+        print(f"Error: {e}")
+        return 1
+    finally:
+        ring.close()
+        usb.util.dispose_resources(dev)
+    return 0
+
+def run_units(units, midi_ids, args, midi_filter):
+    """Bridge the selected inputs to several SC-D70s, one worker each"""
+    inputs = {pygame.midi.get_device_info(midi_id)[1].decode(): open_input(midi_id, args.input_backend)
+              for midi_id in midi_ids}
+    if args.synth:
+        inputs[args.synth] = open_synth(args.synth, args.synth_rate)
+    router, workers = start_units(units, inputs, midi_filter.rules if midi_filter else (),
+                                  deadline=args.flush_deadline, schedule=args.schedule)
+    if not workers:
+        print("Error: none of the configured SC-D70s is connected!")
+        router.close()
+        return 1
+    
+    print("\n" + "=" * 60)
+    print("MIDI Bridge Active!")
     print("=" * 60)
+    for worker in workers:
+        print(f"Output: SC-D70 {worker.unit_id}")
+    for name in inputs:
+        print(f"Input:  {name}")
+    if args.schedule is not None:
+        print(f"Timing: input timestamp + {args.schedule:g} ms")
+    if args.audio_out or args.send_syx or args.latency or args.capture:
+        print("Note: --audio-out, --send-syx, --latency and --capture need a single SC-D70")
+    print("\nPress Ctrl+C to stop")
+    print("=" * 60 + "\n")
     
+    try:
+        while True:
+            if router.wait(0.5):
+                router.pump()
+    except KeyboardInterrupt:
+        print("\n\nStopping MIDI bridge...")
+    finally:
+        router.close()
+        for worker in workers:
+            worker.stop()
+            supervisor = worker.supervisor
+            print(f"SC-D70 {worker.unit_id}: {worker.packets} packets, "
+                  f"{supervisor.recoveries} recoveries, {supervisor.lost} lost")
+            if args.schedule is not None:
+                print(f"SC-D70 {worker.unit_id} scheduled output: {worker.midi_in.late} "
+                      f"events arrived after their due time")
+        pygame.midi.quit()
+        print("Done.\n")
+    return 0
+
+def select_inputs():
+    """Ask for the MIDI input(s) to bridge; None if there are none"""
     # Initialize pygame MIDI
     pygame.midi.init()
     
@@ -48,26 +245,70 @@ def main():
     
     if not inputs:
         print("\nError: No MIDI input devices found!")
-        return 1
+        return None
     
     print("\nAvailable MIDI Inputs:")
     for i in inputs:
         info = pygame.midi.get_device_info(i)
         print(f"  {i}: {info[1].decode()}")
     
-    # Select MIDI input
+    # Select MIDI input(s); several are merged into the one SC-D70 stream
     while True:
         try:
-            midi_id = int(input(f"\nSelect MIDI Input [{inputs[0]}]: ") or inputs[0])
-            if midi_id in inputs:
+            answer = input(f"\nSelect MIDI Input(s), e.g. 1,3 [{inputs[0]}]: ") or str(inputs[0])
+            midi_ids = [int(i) for i in answer.split(",")]
+            if all(midi_id in inputs for midi_id in midi_ids):
                 break
             print(f"Invalid selection. Please choose from: {inputs}")
         except ValueError:
-            print("Please enter a number.")
+            print("Please enter a number, or numbers separated by commas.")
+    return midi_ids
+
+def main():
+    args = parse_args()
+    try:
+        midi_filter = load_filter(args.config)
+        units = load_units(args.config)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print(f"Error: invalid filters or units in {args.config}: {e}")
+        return 1
+    print("=" * 60)
+    print("SC-D70 MIDI Bridge")
+    print("=" * 60)
+    
+    if args.simulate:
+        SimulatedBus(args.simulate).install()
+        print(f"Using {args.simulate} simulated SC-D70(s)")
+    
+    if args.command == "play":
+        return play(args, midi_filter)
+    if args.command == "export":
+        return export_journal(args)
+    if args.command == "replay":
+        return replay_journal(args)
+    
+    if args.synth:
+        midi_ids = []
+    else:
+        midi_ids = select_inputs()
+        if not midi_ids:
+            return 1
+    
+    if args.audio_out is not None and args.audio_native:
+        # Checked before the SC-D70 is claimed, not once the bridge is running
+        import audio_capture
+        if audio_capture.usb_reader is None:
+            print("Error: --audio-native needs research/usb_reader built "
+                  "(python3 setup.py build_ext --inplace in research/)")
+            return 1
+    
+    # Several SC-D70s (or configured units) get one worker each
+    if units or len(find_devices()) > 1:
+        return run_units(units, midi_ids, args, midi_filter)
     
     # Find SC-D70
     print("\nConnecting to SC-D70...")
-    dev = usb.core.find(idVendor=VENDOR_ID, idProduct=PRODUCT_ID)
+    dev = find_device()
     
     if not dev:
         print("Error: SC-D70 not found!")
@@ -77,15 +318,7 @@ def main():
         return 1
     
     # Configure USB device
-    for intf in [0, 1, 2]:
-        try:
-            if dev.is_kernel_driver_active(intf):
-                dev.detach_kernel_driver(intf)
-        except:
-            pass
-    
-    dev.set_configuration()
-    dev.set_interface_altsetting(interface=2, alternate_setting=0)
+    configure_device(dev)
     
     # Initialize SC-D70
     print("Initializing SC-D70...")
@@ -94,47 +327,113 @@ def main():
     send_sysex(dev, MASTER_VOL)
     
     # Open MIDI input
-    midi_in = pygame.midi.Input(midi_id, buffer_size=4096)
+    if args.synth:
+        midi_in = open_synth(args.synth, args.synth_rate)
+    elif len(midi_ids) == 1:
+        midi_in = open_input(midi_ids[0], args.input_backend)
+    else:
+        # The ring's bulk lane lets one input's notes pass another's SysEx
+        midi_in = MergedInput(interleave=True)
+        for midi_id in midi_ids:
+            midi_in.add(pygame.midi.get_device_info(midi_id)[1].decode(),
+                        open_input(midi_id, args.input_backend))
+    if args.schedule is not None:
+        midi_in = ScheduledInput(midi_in, args.schedule)
+    ring = open_ring(dev, deadline=args.flush_deadline)
+    encoder = UsbMidiEncoder(midi_filter=midi_filter)
+    metrics = None
+    if args.latency:
+        metrics = BridgeMetrics()
+        ring.metrics = metrics
+    journal = None
+    if args.capture:
+        journal = ring.journal = CaptureJournal(args.capture)
+    # Recovers from USB faults; mirrors the SC-D70's state (--send-syx included)
+    supervisor = BridgeSupervisor(dev, ring, midi_in, encoder)
+    
+    if args.send_syx:
+        # Streamed through the bulk lane: notes played meanwhile go out first
+        print(f"Sending {args.send_syx}...")
+        start = time.perf_counter()
+        try:
+            bulk = ring.bulk
+            sent = bulk.packets
+            bulk.stream(read_chunks(args.send_syx))
+            while bulk.busy and supervisor.running:
+                supervisor.pump()
+            supervisor.ring.drain()
+            elapsed = time.perf_counter() - start
+            print(f"Sent {bulk.packets - sent} packets in {elapsed:.2f}s")
+        except (OSError, usb.core.USBError) as e:
+            print(f"Error sending {args.send_syx}: {e}")
     
     print("\n" + "=" * 60)
     print("MIDI Bridge Active!")
     print("=" * 60)
-    print(f"Input:  {pygame.midi.get_device_info(midi_id)[1].decode()}")
+    for midi_id in midi_ids:
+        print(f"Input:  {pygame.midi.get_device_info(midi_id)[1].decode()}")
+    if args.synth:
+        print(f"Input:  synthetic {args.synth}")
     print(f"Output: SC-D70 (USB)")
+    print(f"Mode:   {midi_in.backend}")
+    if args.schedule is not None:
+        print(f"Timing: input timestamp + {args.schedule:g} ms")
+    if midi_filter:
+        print(f"Filter: {len(midi_filter.rules)} rules from {args.config}")
+    if args.audio_out is not None:
+        print(f"Audio:  SC-D70 USB -> {args.audio_out}")
+    if journal:
+        print(f"Capture: {args.capture}")
     print("\nPress Ctrl+C to stop")
     print("=" * 60 + "\n")
     
     # Main MIDI loop
+    last_report = time.monotonic()
+    capture = None
     try:
+        if args.audio_out is not None:
+            capture = start_audio(dev, args.audio_out, args.audio_native)
         while True:
-            if midi_in.poll():
-                packets = []
-                while midi_in.poll():
-                    events = midi_in.read(50)
-                    for event in events:
-                        data = event[0]
-                        # Skip timing clock messages
-                        if data[0] >= 0xF8:
-                            continue
-                        # Pack into USB MIDI packet
-                        cin = (data[0] >> 4) & 0x0F
-                        packets.extend([cin, data[0], data[1], data[2]])
-                
-                # Send to SC-D70
-                if packets:
-                    try:
-                        dev.write(ENDPOINT_MIDI_OUT, packets, timeout=10)
-                    except:
-                        pass
+            if midi_in.wait(0.5):
+                supervisor.pump()
             
-            time.sleep(0.001)  # 1ms poll interval
+            if metrics and time.monotonic() - last_report >= LATENCY_INTERVAL:
+                print(f"Latency: {metrics.summary()}")
+                last_report = time.monotonic()
             
     except KeyboardInterrupt:
         print("\n\nStopping MIDI bridge...")
     finally:
+        if capture:
+            capture.stop()
+            stats = capture.stats()
+            print(f"Audio: {stats['overruns']} frames dropped (overrun), "
+                  f"{stats['underruns']} frames of silence (underrun)")
+            if "drift_ppm" in stats:
+                print(f"Audio: clock drift {stats['drift_ppm']:+.1f} ppm, "
+                      f"average fill {stats['fill_avg']:.0f} frames")
+        supervisor.close()
+        if supervisor.recoveries or supervisor.lost:
+            print(f"USB: {supervisor.recoveries} recoveries, {supervisor.stalls} stalls, "
+                  f"{supervisor.timeouts} timeouts, {supervisor.lost} packets lost")
+        if args.schedule is not None:
+            print(f"Scheduled output: {midi_in.late} events arrived after their due time")
+            midi_in = midi_in.source
+        if args.synth:
+            print(f"Synthetic input: {midi_in.count} messages, {midi_in.bytes} bytes")
+        if isinstance(midi_in, MergedInput):
+            for stats in midi_in.stats():
+                print(f"Input {stats['name']}: {stats['messages']} messages, "
+                      f"{stats['bytes']} bytes, peak queue {stats['peak_queued']} events")
+        if journal:
+            journal.close()
+            print(f"Captured {journal.count} packets to {args.capture}")
+        if metrics:
+            print("\nLatency (MIDI input -> USB write complete):")
+            print(metrics.report())
         midi_in.close()
         pygame.midi.quit()
-        usb.util.dispose_resources(dev)
+        usb.util.dispose_resources(supervisor.dev)
         print("Done.\n")
     
     return 0
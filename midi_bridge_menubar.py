@@ -5,7 +5,7 @@ Runs in the background with a menu bar icon
 """
 
 import rumps
-import usb.core
+from PyObjCTools import AppHelper
 import usb.util
 import pygame.midi
 import threading
@@ -13,29 +13,32 @@ import time
 import json
 import os
 
-# SC-D70 USB IDs
-VENDOR_ID = 0x0582
-PRODUCT_ID = 0x000c
-ENDPOINT_MIDI_OUT = 0x02
-
-# SysEx initialization messages
-GS_RESET = [0xF0, 0x41, 0x10, 0x42, 0x12, 0x40, 0x00, 0x7F, 0x00, 0x41, 0xF7]
-MASTER_VOL = [0xF0, 0x7F, 0x7F, 0x04, 0x01, 0x00, 0x7F, 0xF7]
+import bridge_core
+from batching import FLUSH_DEADLINE
+from bridge_log import BridgeLog
+from bridge_core import GS_RESET, MASTER_VOL, UsbMidiEncoder
+from capture import CaptureJournal
+from device_watch import MidiPortWatcher, watch_device
+from latency import BridgeMetrics
+from midi_filter import MidiFilter
+from midi_input import BACKEND_EVENT, BACKEND_POLL, open_input
+from midi_merge import MergedInput
+from scheduler import ScheduledInput
+from sim_device import SimulatedBus
+from supervisor import BridgeSupervisor
+from usb_async import open_ring
 
 # Preferences and Log files
 CONFIG_DIR = os.path.expanduser("~/.config/sc-d70-bridge")
 PREFS_FILE = os.path.join(CONFIG_DIR, "config.json")
 LOG_FILE = os.path.join(CONFIG_DIR, "bridge.log")
 
+# Log records are queued and written by a background thread, so logging
+# from the bridge thread never touches the disk
+logger = BridgeLog(LOG_FILE)
+
 def log(msg):
-    try:
-        if not os.path.exists(CONFIG_DIR):
-            os.makedirs(CONFIG_DIR)
-        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-        with open(LOG_FILE, "a") as f:
-            f.write(f"[{timestamp}] {msg}\n")
-    except:
-        pass
+    logger.log(msg)
 
 log("--- App Starting ---")
 
@@ -52,6 +55,10 @@ class SC_D70_Bridge(rumps.App):
 
         # Initialize UI elements
         self.status_item = rumps.MenuItem("Status: Initializing...")
+        self.latency_item = rumps.MenuItem("Latency: -")
+        # Per-input throughput of the merged MIDI inputs
+        self.activity_menu = rumps.MenuItem("Input Activity")
+        self.activity_menu.add(rumps.MenuItem("No inputs"))
         
         # Create initial MIDI Input menu correctly as a submenu
         self.midi_menu = rumps.MenuItem("MIDI Input")
@@ -60,6 +67,8 @@ class SC_D70_Bridge(rumps.App):
         
         self.menu = [
             self.status_item,
+            self.latency_item,
+            self.activity_menu,
             None,
             self.midi_menu,
             None,
@@ -70,19 +79,116 @@ class SC_D70_Bridge(rumps.App):
         self.running = False
         self.dev = None
         self.midi_in = None
-        self.midi_id = None
+        self.midi_names = []
+        self.capture = None
+        self.supervisor = None
+        self.metrics = BridgeMetrics()
         self.prefs = self.load_prefs()
+        self.midi_items = {}
+        self.activity_items = {}
+        self.inputs = self.get_midi_inputs()
+        # With "simulate" set, a software SC-D70 stands in for the USB one
+        if self.prefs.get("simulate"):
+            SimulatedBus().install()
+            log("Using a simulated SC-D70")
+        
+        # Watch for the SC-D70 and MIDI ports coming and going; the watcher
+        # also caches the SC-D70 so starting the bridge needs no bus scan
+        self.watcher = watch_device(self.device_arrived, self.device_left)
+        self.port_watcher = MidiPortWatcher(self.ports_changed).start()
         
         # Start the engine
         self.start_bridge()
         
-        # Periodically refresh the MIDI menu to catch new devices
-        self.refresh_timer = rumps.Timer(self.periodic_update, 10) # 10s is plenty
+        # Periodically refresh the latency readout
+        self.refresh_timer = rumps.Timer(self.periodic_update, 10)
         self.refresh_timer.start()
 
-    def periodic_update(self, _):
-        """Update menus without restarting the bridge"""
+    def device_arrived(self, dev):
+        """SC-D70 plugged in (watcher thread)"""
+        AppHelper.callAfter(self.on_device_arrived, dev)
+
+    def device_left(self):
+        """SC-D70 unplugged (watcher thread)"""
+        AppHelper.callAfter(self.on_device_left)
+
+    def ports_changed(self, names):
+        """MIDI input ports changed (watcher thread)"""
+        AppHelper.callAfter(self.on_ports_changed, names)
+
+    def on_device_arrived(self, dev):
+        log("SC-D70 connected")
+        if self.running and self.supervisor:
+            # The bridge thread re-opens it and restores the sound state
+            self.supervisor.device_arrived(dev)
+            self.status_item.title = f"Status: Running ({', '.join(self.midi_names)})"
+            self.title = "🎹✓"
+        elif not self.running:
+            self.start_bridge(dev)
+
+    def on_device_left(self):
+        log("SC-D70 disconnected")
+        if self.running and self.supervisor:
+            # Keep the bridge running; it recovers when the SC-D70 is back
+            self.supervisor.device_left()
+            self.status_item.title = "Status: Waiting for SC-D70"
+        else:
+            if self.running:
+                self.stop_bridge()
+            self.status_item.title = "Status: SC-D70 Not Found"
+        self.title = "🎹❌"
+
+    def on_ports_changed(self, names):
+        log(f"MIDI ports changed: {names}")
+        # pygame only enumerates ports at init. Re-initializing is safe
+        # unless a pygame input stream is open (the event backend uses rtmidi)
+        if not (self.midi_in and self.midi_in.backend == BACKEND_POLL):
+            pygame.midi.quit()
+            pygame.midi.init()
+        self.inputs = self.get_midi_inputs()
+        # Merged inputs are kept by name: drop ports that went away and
+        # re-open selected ones that came back
+        if self.running and self.midi_in:
+            available = dict((name, midi_id) for midi_id, name in self.inputs)
+            for name in self.midi_in.names:
+                if name not in available:
+                    self.midi_in.remove(name)
+                    log(f"MIDI input removed: {name}")
+            for name in self.midi_names:
+                if name in available and name not in self.midi_in.names:
+                    self.open_merged_input(available[name], name)
         self.update_midi_menu()
+        if not self.running and self.watcher.device is not None:
+            self.start_bridge()
+
+    def periodic_update(self, _):
+        """Update the latency and input activity readouts"""
+        if self.metrics.batch.total:
+            self.latency_item.title = f"Latency: {self.metrics.summary()}"
+        stats = self.midi_in.stats() if self.midi_in else []
+        self.update_activity_menu(stats)
+
+    def update_activity_menu(self, stats):
+        """One line per merged input: messages and bytes per second"""
+        try:
+            if stats and "No inputs" in self.activity_menu:
+                del self.activity_menu["No inputs"]
+            wanted = {s["name"]: s for s in stats}
+            for name in list(self.activity_items):
+                if name not in wanted:
+                    del self.activity_menu[name]
+                    del self.activity_items[name]
+            for name, s in wanted.items():
+                item = self.activity_items.get(name)
+                if item is None:
+                    item = rumps.MenuItem(name)
+                    self.activity_menu.add(item)
+                    self.activity_items[name] = item
+                # Still keyed by the input name it was added with
+                item.title = (f"{name}: {s['messages_per_s']:.0f} msg/s, "
+                              f"{s['bytes_per_s'] / 1024:.1f} KB/s, queue {s['queued']}")
+        except Exception as e:
+            log(f"Menu Update Error: {e}")
 
     def load_prefs(self):
         """Load saved preferences"""
@@ -92,7 +198,7 @@ class SC_D70_Bridge(rumps.App):
                     return json.load(f)
         except:
             pass
-        return {"midi_id": None}
+        return {"midi_inputs": [], "input_backend": BACKEND_EVENT, "audio_output": None}
     
     def save_prefs(self):
         """Save preferences"""
@@ -108,18 +214,7 @@ class SC_D70_Bridge(rumps.App):
         """Send SysEx message via USB MIDI"""
         if not self.dev:
             return
-        packets = []
-        for i in range(0, len(sysex), 3):
-            chunk = sysex[i:i+3]
-            cin = 0x07 if len(chunk) == 3 and chunk[2] == 0xF7 else 0x04
-            p = [cin, 0, 0, 0]
-            for j, b in enumerate(chunk):
-                p[1+j] = b
-            packets.extend(p)
-        try:
-            self.dev.write(ENDPOINT_MIDI_OUT, packets, timeout=100)
-        except:
-            pass
+        bridge_core.send_sysex(self.dev, sysex)
     
     def get_midi_inputs(self):
         """Get list of available MIDI inputs"""
@@ -136,43 +231,73 @@ class SC_D70_Bridge(rumps.App):
         return inputs
     
     def update_midi_menu(self):
-        """Rebuild the MIDI input submenu"""
+        """Bring the MIDI input submenu in line with the cached input list"""
+        wanted = {name: midi_id for midi_id, name in self.inputs}
         try:
-            self.midi_menu.clear()
+            if "Refreshing..." in self.midi_menu:
+                del self.midi_menu["Refreshing..."]
+            for name in list(self.midi_items):
+                if name not in wanted:
+                    del self.midi_menu[name]
+                    del self.midi_items[name]
+            for name, midi_id in wanted.items():
+                item = self.midi_items.get(name)
+                if item is None:
+                    item = rumps.MenuItem(name, callback=self.select_midi_callback)
+                    self.midi_menu.add(item)
+                    self.midi_items[name] = item
+                item.midi_id = midi_id
+                item.state = 1 if name in self.midi_names else 0
         except Exception as e:
-            log(f"Menu Clear Error: {e}")
-            
-        inputs = self.get_midi_inputs()
-        log(f"Updating MIDI menu with {len(inputs)} devices")
-        
-        for midi_id, name in inputs:
-            item = rumps.MenuItem(name, callback=self.select_midi_callback)
-            item.midi_id = midi_id
-            if midi_id == self.midi_id:
-                item.state = 1
-            self.midi_menu.add(item)
+            log(f"Menu Update Error: {e}")
     
     def select_midi_callback(self, sender):
         """Callback for selecting a MIDI device from the menu"""
         log(f"Menu selection: {sender.title} (ID: {sender.midi_id})")
-        self.select_midi(sender.midi_id)
+        self.select_midi(sender.midi_id, sender.title)
 
-    def select_midi(self, midi_id):
-        """Select MIDI input and restart bridge"""
-        self.midi_id = midi_id
-        self.prefs["midi_id"] = midi_id
+    def select_midi(self, midi_id, name):
+        """Add the MIDI input to the merge, or remove it if already merged"""
+        if name in self.midi_names:
+            if len(self.midi_names) == 1:
+                return
+            self.midi_names.remove(name)
+            if self.midi_in:
+                self.midi_in.remove(name)
+            log(f"MIDI input removed: {name}")
+        else:
+            self.midi_names.append(name)
+            if self.midi_in:
+                self.open_merged_input(midi_id, name)
+        self.prefs["midi_inputs"] = self.midi_names
         self.save_prefs()
-        self.reconnect(None)
+        self.update_midi_menu()
+        if self.running:
+            self.status_item.title = f"Status: Running ({', '.join(self.midi_names)})"
+        elif self.watcher.device is not None:
+            self.start_bridge()
+
+    def open_merged_input(self, midi_id, name):
+        """Open a MIDI input and merge it into the running bridge"""
+        try:
+            backend = self.prefs.get("input_backend", BACKEND_EVENT)
+            midi_in = open_input(midi_id, backend)
+            self.midi_in.add(name, midi_in)
+            log(f"MIDI input opened: {name} ({midi_in.backend})")
+            return True
+        except Exception as e:
+            log(f"MIDI Open Error: {name}: {e}")
+            return False
     
-    def start_bridge(self):
+    def start_bridge(self, dev=None):
         """Start the MIDI bridge"""
         log("Attempting to start bridge...")
         if self.running:
             log("Bridge already running, stopping first")
             self.stop_bridge()
         
-        # Find SC-D70
-        self.dev = usb.core.find(idVendor=VENDOR_ID, idProduct=PRODUCT_ID)
+        # SC-D70 as reported by the device watcher
+        self.dev = dev or self.watcher.device
         if not self.dev:
             log("SC-D70 not found")
             self.status_item.title = "Status: SC-D70 Not Found"
@@ -183,16 +308,8 @@ class SC_D70_Bridge(rumps.App):
         log("SC-D70 found and connected")
         
         # Configure USB
-        for intf in [0, 1, 2]:
-            try:
-                if self.dev.is_kernel_driver_active(intf):
-                    self.dev.detach_kernel_driver(intf)
-            except:
-                pass
-        
         try:
-            self.dev.set_configuration()
-            self.dev.set_interface_altsetting(interface=2, alternate_setting=0)
+            bridge_core.configure_device(self.dev)
             log("USB configuration complete")
         except Exception as e:
             log(f"USB Init Error: {e}")
@@ -207,7 +324,7 @@ class SC_D70_Bridge(rumps.App):
         log("SC-D70 initialized with GS Reset")
         
         # Get MIDI inputs
-        inputs = self.get_midi_inputs()
+        inputs = self.inputs
         if not inputs:
             log("No MIDI inputs available")
             self.status_item.title = "Status: No MIDI Inputs"
@@ -215,30 +332,29 @@ class SC_D70_Bridge(rumps.App):
             self.update_midi_menu()
             return
         
-        # Use saved preference or first input
-        self.midi_id = self.prefs.get("midi_id")
-        
-        # Verify saved ID still exists, otherwise pick first
-        available_ids = [inp[0] for inp in inputs]
-        if self.midi_id not in available_ids:
-            self.midi_id = inputs[0][0]
-            log(f"Saved MIDI ID not found, using first available: {self.midi_id}")
+        # Use saved inputs (by name; older prefs saved one ID) or the first
+        available = dict((name, midi_id) for midi_id, name in inputs)
+        names = self.prefs.get("midi_inputs")
+        if not names and self.prefs.get("midi_id") is not None:
+            names = [dict(inputs).get(self.prefs["midi_id"])]
+        self.midi_names = [name for name in names or [] if name in available]
+        if not self.midi_names:
+            self.midi_names = [inputs[0][1]]
+            log(f"Saved MIDI inputs not found, using first available: {self.midi_names[0]}")
         
-        # Open MIDI input
-        try:
-            self.midi_in = pygame.midi.Input(self.midi_id, buffer_size=4096)
-            log(f"MIDI input opened: ID {self.midi_id}")
-        except Exception as e:
-            log(f"MIDI Open Error: {e}")
+        # Open the MIDI inputs, merged into one stream
+        self.midi_in = MergedInput(interleave=True)
+        for name in self.midi_names:
+            self.open_merged_input(available[name], name)
+        if not self.midi_in.sources:
+            self.midi_in = None
             self.status_item.title = "Status: MIDI Open Error"
             self.title = "🎹⚠️"
             self.update_midi_menu()
             return
         
         # Update UI
-        info = pygame.midi.get_device_info(self.midi_id)
-        midi_name = info[1].decode() if info else "Unknown"
-        self.status_item.title = f"Status: Running ({midi_name})"
+        self.status_item.title = f"Status: Running ({', '.join(self.midi_names)})"
         self.title = "🎹✓"
         self.update_midi_menu()
         
@@ -247,49 +363,107 @@ class SC_D70_Bridge(rumps.App):
         self.bridge_thread = threading.Thread(target=self.bridge_loop, daemon=True)
         self.bridge_thread.start()
         log("Bridge thread started")
+        
+        self.start_audio()
+    
+    def start_audio(self):
+        """Stream SC-D70 USB audio if an output device is configured"""
+        device = self.prefs.get("audio_output")
+        if device is None:
+            return
+        try:
+            # numpy/sounddevice are only needed when audio capture is enabled
+            import audio_capture
+            read = audio_capture.pyusb_reader(self.dev)
+            self.capture = audio_capture.AudioCapture(read, output_device=device)
+            self.capture.start()
+            log(f"Audio capture started (output: {device})")
+        except Exception as e:
+            log(f"Audio Capture Error: {e}")
+            self.capture = None
     
     def bridge_loop(self):
         """Main MIDI bridge loop"""
         log("Bridge loop entered")
         packet_count = 0
         last_log = time.time()
+        try:
+            # "flush_deadline" (ms) caps how long partly filled transfers wait
+            ring = open_ring(self.dev, deadline=self.prefs.get("flush_deadline", FLUSH_DEADLINE))
+        except Exception as e:
+            log(f"USB Output Error: {e}")
+            return
+        self.metrics.reset()
+        ring.metrics = self.metrics
+        # With "capture_dir" set, every packet sent is journaled to a new file
+        journal = None
+        if self.prefs.get("capture_dir"):
+            path = os.path.join(os.path.expanduser(self.prefs["capture_dir"]),
+                                time.strftime("capture-%Y%m%d-%H%M%S.journal"))
+            try:
+                journal = ring.journal = CaptureJournal(path)
+                log(f"Capturing USB-MIDI to {path}")
+            except OSError as e:
+                log(f"Capture Error: {e}")
+        midi_filter = None
+        if self.prefs.get("filters"):
+            try:
+                midi_filter = MidiFilter(self.prefs["filters"])
+                log(f"MIDI filter compiled: {len(midi_filter.rules)} rules")
+            except Exception as e:
+                log(f"Filter Config Error: {e}")
+        encoder = UsbMidiEncoder(midi_filter=midi_filter)
+        # With "schedule_delay" (ms) set, events leave at input timestamp + delay
+        midi_in = self.midi_in
+        if self.prefs.get("schedule_delay") is not None:
+            midi_in = ScheduledInput(midi_in, self.prefs["schedule_delay"])
+            log(f"Scheduled output: input timestamp + {midi_in.delay} ms")
+        supervisor = self.supervisor = BridgeSupervisor(
+            self.dev, ring, midi_in, encoder, find=lambda: self.watcher.device, log=log)
         
         while self.running:
             try:
-                if self.midi_in and self.midi_in.poll():
-                    packets = []
-                    while self.midi_in.poll():
-                        events = self.midi_in.read(50)
-                        for event in events:
-                            data = event[0]
-                            if data[0] >= 0xF8:  # Skip timing clock
-                                continue
-                            cin = (data[0] >> 4) & 0x0F
-                            packets.extend([cin, data[0], data[1], data[2]])
-                    
-                    if packets and self.dev:
-                        try:
-                            self.dev.write(ENDPOINT_MIDI_OUT, packets, timeout=10)
-                            packet_count += (len(packets) // 4)
-                        except Exception as e:
-                            log(f"USB Write Error: {e}")
+                if midi_in and (midi_in.wait(0.5) or supervisor.disconnected):
+                    # USB faults are handled (and logged) by the supervisor
+                    packet_count += supervisor.pump()
+                    self.dev = supervisor.dev
                 
                 # Heartbeat logging
                 if time.time() - last_log > 60:
                     log(f"Bridge heartbeat: processed {packet_count} MIDI packets in last min")
+                    if packet_count:
+                        log(f"Latency heartbeat: {self.metrics.summary()}")
+                    if self.capture:
+                        log(f"Audio heartbeat: {self.capture.stats()}")
                     packet_count = 0
                     last_log = time.time()
-                    
-                time.sleep(0.001)
             except Exception as e:
                 log(f"Bridge Loop Error: {e}")
-                break
-        log("Bridge loop exited")
+                time.sleep(0.1)
+        try:
+            supervisor.close()
+        except Exception as e:
+            log(f"USB Output Close Error: {e}")
+        if journal:
+            journal.close()
+            log(f"Captured {journal.count} packets to {journal.path}")
+        log(f"Bridge loop exited: {supervisor.recoveries} USB recoveries, "
+            f"{supervisor.lost} packets lost")
+        self.supervisor = None
     
     def stop_bridge(self):
         """Stop the MIDI bridge"""
         log("Stopping bridge...")
         self.running = False
+        if self.supervisor:
+            self.supervisor.stop()
+        if self.capture:
+            try:
+                self.capture.stop()
+                log(f"Audio capture stopped: {self.capture.stats()}")
+            except Exception as e:
+                log(f"Audio Stop Error: {e}")
+            self.capture = None
         if self.bridge_thread:
             self.bridge_thread.join(timeout=1)
             self.bridge_thread = None
@@ -314,13 +488,16 @@ class SC_D70_Bridge(rumps.App):
     def reconnect(self, _):
         """Reconnect to SC-D70"""
         self.stop_bridge()
-        time.sleep(0.5)
         self.start_bridge()
     
     def quit_application(self, _):
         """Clean shutdown"""
         self.stop_bridge()
+        self.watcher.stop()
+        self.port_watcher.stop()
         pygame.midi.quit()
+        log("--- App Quitting ---")
+        logger.close()
         rumps.quit_application()
 
 if __name__ == "__main__":
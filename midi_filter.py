@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+SC-D70 Bridge MIDI Filters
+Config-driven filter/transform rules compiled into the encoder's lookup tables
+"""
+
+import json
+import os
+
+from bridge_core import DROP_MESSAGE, MESSAGES, SYSEX_START, message_entry
+
+CONFIG_FILE = os.path.expanduser("~/.config/sc-d70-bridge/config.json")
+
+# Channel voice message types by status high nibble
+CHANNEL_MESSAGES = {
+    "note_off": 0x80,
+    "note_on": 0x90,
+    "poly_aftertouch": 0xA0,
+    "control_change": 0xB0,
+    "program_change": 0xC0,
+    "channel_aftertouch": 0xD0,
+    "pitch_bend": 0xE0,
+}
+
+SYSTEM_MESSAGES = {
+    "sysex": SYSEX_START,
+    "mtc": 0xF1,
+    "song_position": 0xF2,
+    "song_select": 0xF3,
+    "tune_request": 0xF6,
+    "clock": 0xF8,
+    "start": 0xFA,
+    "continue": 0xFB,
+    "stop": 0xFC,
+    "active_sensing": 0xFE,
+    "reset": 0xFF,
+}
+
+NOTE_MESSAGES = (0x80, 0x90, 0xA0)
+
+
+def message_type(status):
+    """Config name of the message type starting with `status`"""
+    if status < 0xF0:
+        for name, base in CHANNEL_MESSAGES.items():
+            if status & 0xF0 == base:
+                return name
+    for name, value in SYSTEM_MESSAGES.items():
+        if status == value:
+            return name
+    return None
+
+
+def velocity_curve(curve=1.0, low=1, high=127):
+    """128-entry velocity map: v' = low + (high - low) * (v/127)**curve.
+
+    Velocity 0 (note off) is left alone; curve > 1 is softer, < 1 harder.
+    """
+    table = [0]
+    for v in range(1, 128):
+        table.append(max(1, min(127, round(low + (high - low) * (v / 127.0) ** curve))))
+    return table
+
+
+class MidiFilter:
+    """An ordered list of filter/transform rules compiled to lookup tables.
+
+    Every rule is applied symbolically to all 256 status bytes up front, so
+    the result is one encoder entry per status: the status to send and two
+    data byte tables (see bridge_core.message_entry), or False to drop it.
+    A rule's `channels` (1-16) match the channel the message has at that
+    point in the list, after any earlier remapping.
+
+    Rules (the "filters" list in config.json):
+      {"type": "drop", "messages": ["program_change"], "channels": [10]}
+      {"type": "drop", "messages": ["sysex", "active_sensing"]}
+      {"type": "channel", "map": {"1": 2, "2": 1}}
+      {"type": "transpose", "semitones": -12, "channels": [1]}
+      {"type": "velocity", "curve": 0.7, "min": 20, "max": 127}
+      {"type": "cc", "map": {"1": 11, "64": null}}
+    """
+
+    def __init__(self, rules=()):
+        self.rules = list(rules)
+        self.sysex = True
+        self.messages = self.compile()
+
+    def compile(self):
+        # Per status: [status to send, data1 values, data2 values], [] once
+        # dropped, or None if it does not start a short message
+        state = []
+        for status in range(256):
+            entry = MESSAGES[status]
+            state.append(entry and [entry[1], list(entry[2]), list(entry[3])])
+        for rule in self.rules:
+            apply = RULES.get(rule.get("type"))
+            if apply is None:
+                raise ValueError(f"Unknown filter type: {rule.get('type')!r}")
+            if rule["type"] == "drop":
+                unknown = set(rule.get("messages", ())) - set(CHANNEL_MESSAGES) - set(SYSTEM_MESSAGES)
+                if unknown:
+                    raise ValueError(f"Unknown message types: {sorted(unknown)}")
+                # System messages have no channel, so a rule with channels
+                # would silently never drop them
+                system = set(rule.get("messages", ())) & set(SYSTEM_MESSAGES)
+                if system and rule.get("channels"):
+                    raise ValueError(f"System messages {sorted(system)} have no channel; "
+                                     f"drop them in a rule without \"channels\"")
+                if "sysex" in rule.get("messages", ()):
+                    self.sysex = False
+            for current in state:
+                if current and _matches(rule, current[0]):
+                    if apply(rule, current) is False:
+                        current.clear()
+        # Identical data tables share one bytes object
+        tables = {}
+        messages = []
+        for status, current in enumerate(state):
+            if current is None:
+                messages.append(None)
+            elif not current:
+                messages.append(False)
+            else:
+                data1 = tables.setdefault(bytes(current[1]), bytes(current[1]))
+                data2 = tables.setdefault(bytes(current[2]), bytes(current[2]))
+                messages.append(message_entry(status, current[0], data1, data2))
+        return tuple(messages)
+
+
+def _matches(rule, status):
+    channels = rule.get("channels")
+    if not channels:
+        return True
+    return status < 0xF0 and (status & 0x0F) + 1 in channels
+
+
+def _map_data(values, mapping):
+    """Remap 7-bit values through `mapping`; dropped values stay dropped"""
+    for i, v in enumerate(values):
+        if not v & DROP_MESSAGE:
+            values[i] = mapping[v]
+
+
+def _drop(rule, current):
+    if message_type(current[0]) in rule.get("messages", ()):
+        return False
+
+
+def _channel(rule, current):
+    status = current[0]
+    if status >= 0xF0:
+        return
+    channels = {int(source): target for source, target in rule["map"].items()}
+    channel = channels.get((status & 0x0F) + 1)
+    if channel is not None:
+        if not 1 <= int(channel) <= 16:
+            raise ValueError(f"MIDI channel out of range: {channel}")
+        current[0] = (status & 0xF0) | (int(channel) - 1)
+
+
+def _transpose(rule, current):
+    if current[0] & 0xF0 in NOTE_MESSAGES:
+        semitones = int(rule["semitones"])
+        _map_data(current[1], [n + semitones if 0 <= n + semitones < 128 else DROP_MESSAGE
+                               for n in range(128)])
+
+
+def _velocity(rule, current):
+    if current[0] & 0xF0 == 0x90:
+        _map_data(current[2], velocity_curve(float(rule.get("curve", 1.0)),
+                                             int(rule.get("min", 1)), int(rule.get("max", 127))))
+
+
+def _cc(rule, current):
+    if current[0] & 0xF0 == 0xB0:
+        mapping = list(range(128))
+        for source, target in rule["map"].items():
+            mapping[int(source)] = DROP_MESSAGE if target is None else int(target) & 0x7F
+        _map_data(current[1], mapping)
+
+
+RULES = {
+    "drop": _drop,
+    "channel": _channel,
+    "transpose": _transpose,
+    "velocity": _velocity,
+    "cc": _cc,
+}
+
+
+def load_filter(path=CONFIG_FILE):
+    """MidiFilter from the "filters" list in `path`, or None if there is none"""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        rules = json.load(f).get("filters")
+    return MidiFilter(rules) if rules else None
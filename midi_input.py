@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+SC-D70 Bridge MIDI Input Backends
+Event-driven input (python-rtmidi callbacks) with a pygame polling fallback
+"""
+
+import collections
+import threading
+import time
+
+import pygame.midi
+
+try:
+    import rtmidi
+except ImportError:
+    rtmidi = None
+
+BACKEND_EVENT = "event"
+BACKEND_POLL = "poll"
+
+# Below this many ms to its next event a TimedInput spins rather than sleeps
+SPIN_MS = 1.0
+
+# pygame delivers SysEx as 4-byte events; callback input mimics that
+SYSEX_EVENT_SIZE = 4
+
+
+def now_ms():
+    """Millisecond timestamp used for events from the callback backend"""
+    return time.perf_counter() * 1000.0
+
+
+def message_events(message, timestamp):
+    """Raw MIDI message (any length) as pygame-style [[data], timestamp] events"""
+    if len(message) <= 3:
+        data = list(message)
+        data.extend([0] * (4 - len(data)))
+        return [[data, timestamp]]
+    events = []
+    for i in range(0, len(message), SYSEX_EVENT_SIZE):
+        data = list(message[i:i+SYSEX_EVENT_SIZE])
+        data.extend([0] * (SYSEX_EVENT_SIZE - len(data)))
+        events.append([data, timestamp])
+    return events
+
+
+class PollingInput:
+    """pygame.midi.Input wrapper that waits by polling every `interval` s"""
+
+    backend = BACKEND_POLL
+
+    def __init__(self, midi_in, interval=0.001):
+        self.midi_in = midi_in
+        self.interval = interval
+        self._wake = threading.Event()
+
+    def poll(self):
+        return self.midi_in.poll()
+
+    def read(self, count):
+        return self.midi_in.read(count)
+
+    def clock(self):
+        """Current time in the event timestamps' timebase (PortMidi ms)"""
+        return pygame.midi.time()
+
+    def wait(self, timeout):
+        """Return True once input is pending, False after `timeout` seconds"""
+        deadline = time.monotonic() + timeout
+        while not self.midi_in.poll():
+            now = time.monotonic()
+            if now >= deadline:
+                return False
+            if self._wake.wait(min(self.interval, deadline - now)):
+                self._wake.clear()
+                return self.midi_in.poll()
+        return True
+
+    def wake(self):
+        """Make a wait() in progress (or else the next one) return now; thread-safe"""
+        self._wake.set()
+
+    def close(self):
+        self.midi_in.close()
+
+
+class EventInput:
+    """Input fed by a callback; `wait` sleeps until `push` signals new data.
+
+    Presents the pygame.midi.Input read/poll interface so the bridge pump
+    does not care which backend it is draining.
+    """
+
+    backend = BACKEND_EVENT
+
+    def __init__(self):
+        self._events = collections.deque()
+        self._ready = threading.Event()
+        self._woken = False
+        self._port = None
+
+    def push(self, message, timestamp=None):
+        """Queue one raw MIDI message (any length) from the callback thread"""
+        if timestamp is None:
+            timestamp = now_ms()
+        self._events.extend(message_events(message, timestamp))
+        self._ready.set()
+
+    def put(self, events):
+        """Queue events already in pygame's [[data], timestamp] form"""
+        self._events.extend(events)
+        self._ready.set()
+
+    def poll(self):
+        return bool(self._events)
+
+    @property
+    def queued(self):
+        """Number of events waiting to be read"""
+        return len(self._events)
+
+    def read(self, count):
+        events = []
+        popleft = self._events.popleft
+        try:
+            for _ in range(count):
+                events.append(popleft())
+        except IndexError:
+            pass
+        return events
+
+    def clock(self):
+        """Current time in the event timestamps' timebase (ms)"""
+        return now_ms()
+
+    def wait(self, timeout):
+        """Block until input is pending; False after `timeout` seconds"""
+        if self._events:
+            return True
+        # Clear before re-checking so a push or wake() between the two is not lost
+        self._ready.clear()
+        if self._events:
+            return True
+        if not self._woken:
+            self._ready.wait(timeout)
+        self._woken = False
+        return bool(self._events)
+
+    def wake(self):
+        """Make a wait() in progress (or else the next one) return now; thread-safe"""
+        self._woken = True
+        self._ready.set()
+
+    def attach(self, event):
+        """Signal threading.Event `event` instead of this input's own one,
+        so a single wait covers several inputs (see MergedInput, InputRouter)"""
+        self._ready = event
+
+    def close(self):
+        if self._port is not None:
+            self._port.cancel_callback()
+            self._port.close_port()
+            self._port = None
+        self._ready.set()
+
+    def _callback(self, event, data=None):
+        message, _delta = event
+        self.push(message)
+
+
+class TimedInput:
+    """Plays (ms, message) pairs as input, each due at start + ms.
+
+    read() returns the events whose time has come, timestamped with it,
+    and wait() sleeps until just before the next one and spins the last
+    SPIN_MS, so the bridge thread releases each event on time. The clock
+    starts `preroll` ms after the first poll or wait. `done` is set once
+    every message has been read. Presents the pygame.midi.Input read/poll
+    interface like the other backends.
+    """
+
+    backend = BACKEND_EVENT
+
+    def __init__(self, messages, preroll=0.0):
+        self.preroll = preroll
+        self.start = None
+        self.count = 0
+        self._messages = iter(messages)
+        self._next = next(self._messages, None)
+        self.done = self._next is None
+        self._wake = threading.Event()
+
+    def _begin(self):
+        if self.start is None:
+            self.start = now_ms() + self.preroll
+
+    def poll(self):
+        self._begin()
+        return self._next is not None and self.start + self._next[0] <= now_ms()
+
+    def read(self, count):
+        self._begin()
+        events = []
+        now = now_ms()
+        start = self.start
+        while len(events) < count and self._next is not None:
+            ms, message = self._next
+            due = start + ms
+            if due > now:
+                break
+            events.extend(message_events(message, due))
+            self.count += 1
+            self._next = next(self._messages, None)
+        if self._next is None:
+            self.done = True
+        return events
+
+    def clock(self):
+        """Current time in the event timestamps' timebase (ms)"""
+        return now_ms()
+
+    def due(self):
+        """Seconds until the next event is due (0 if it is), None if there is none"""
+        self._begin()
+        if self._next is None:
+            return None
+        return max(self.start + self._next[0] - now_ms(), 0.0) / 1000.0
+
+    def wait(self, timeout):
+        """Block until the next event is due; False after `timeout` seconds"""
+        self._begin()
+        if self._next is None:
+            self._sleep(timeout)
+            return False
+        due = self.start + self._next[0]
+        until = due - now_ms()
+        if until > timeout * 1000.0:
+            self._sleep(timeout)
+            return False
+        if until > SPIN_MS and self._sleep((until - SPIN_MS) / 1000.0):
+            return self.poll()
+        while now_ms() < due:
+            pass
+        return True
+
+    def _sleep(self, seconds):
+        """Sleep unless woken; True if wake() cut it short"""
+        if self._wake.wait(seconds):
+            self._wake.clear()
+            return True
+        return False
+
+    def wake(self):
+        """Make a wait() in progress (or else the next one) return now; thread-safe"""
+        self._wake.set()
+
+    def close(self):
+        close = getattr(self._messages, "close", None)
+        if close:
+            close()
+        self._next = None
+        self.done = True
+
+
+def open_rtmidi_input(name):
+    """Open the rtmidi port whose name matches a pygame device name"""
+    port = rtmidi.MidiIn()
+    for index, port_name in enumerate(port.get_ports()):
+        if port_name == name or name in port_name:
+            # Clock and MTC go through (the encoder drops real-time unless
+            # asked not to, as on the polling path); only active sensing is
+            # filtered here
+            port.ignore_types(sysex=False, timing=False, active_sense=True)
+            port.open_port(index)
+            midi_in = EventInput()
+            midi_in._port = port
+            port.set_callback(midi_in._callback)
+            return midi_in
+    port.delete()
+    return None
+
+
+def open_input(midi_id, backend=BACKEND_EVENT, buffer_size=4096):
+    """Open pygame MIDI device `midi_id` with the requested backend.
+
+    The event backend needs python-rtmidi and a port of the same name; if
+    either is missing the pygame polling backend is used instead.
+    """
+    if backend == BACKEND_EVENT and rtmidi is not None:
+        info = pygame.midi.get_device_info(midi_id)
+        if info:
+            midi_in = open_rtmidi_input(info[1].decode())
+            if midi_in is not None:
+                return midi_in
+    return PollingInput(pygame.midi.Input(midi_id, buffer_size=buffer_size))
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+SC-D70 Bridge MIDI Input Merging
+Several MIDI inputs merged by timestamp and scheduled fairly into one stream
+"""
+
+import collections
+import threading
+import time
+
+from bridge_core import MESSAGE_LENGTH, MIDI_READ_SIZE, SYSEX_END, SYSEX_START
+from midi_input import BACKEND_EVENT, BACKEND_POLL, EventInput, now_ms
+
+# MIDI bytes each input may send per scheduling round
+QUANTUM = 96
+# Events queued per input before it is no longer read (its own buffer fills)
+BACKLOG = 4096
+# Events of an unfinished SysEx held back before it is sent as it arrives;
+# until its end no other input is scheduled
+SYSEX_HOLD = 1024
+# Wait granularity while any input is a polling one
+POLL_INTERVAL = 0.001
+
+
+def _is_sysex(events):
+    """True if a queued message is (part of) a SysEx"""
+    status = events[0][0][0]
+    return status < 0x80 or status == SYSEX_START or status == SYSEX_END
+
+
+class MergeSource:
+    """One input of a MergedInput and its queue of complete messages"""
+
+    def __init__(self, name, midi_in):
+        self.name = name
+        self.midi_in = midi_in
+        self.messages = collections.deque()   # (bytes, timestamp, events, more)
+        self.queued = 0                       # events in `messages`
+        self.sysex = None                     # events of an unfinished SysEx
+        self.sysex_bytes = 0
+        self.deficit = 0
+        self.received = 0
+        self.sent = 0
+        self.sent_bytes = 0
+        self.peak = 0
+        self._last_sent = 0
+        self._last_bytes = 0
+
+    def fill(self, backlog):
+        """Read pending input into whole messages; timestamps become now_ms() based"""
+        midi_in = self.midi_in
+        if self.queued >= backlog or not midi_in.poll():
+            return
+        offset = now_ms() - midi_in.clock()
+        while self.queued < backlog and midi_in.poll():
+            for event in midi_in.read(MIDI_READ_SIZE):
+                event[1] += offset
+                self._event(event)
+        if self.queued > self.peak:
+            self.peak = self.queued
+
+    def _event(self, event):
+        data = event[0]
+        if self.sysex is None:
+            status = data[0]
+            if status != SYSEX_START:
+                self._queue(MESSAGE_LENGTH[status] or 1, event[1], [event], False)
+                return
+            self.sysex = []
+            self.sysex_bytes = 0
+        sysex = self.sysex
+        sysex.append(event)
+        for n, b in enumerate(data):
+            # The end byte, or any other status byte, ends the SysEx
+            if b & 0x80 and b < 0xF8 and (b != SYSEX_START or n or len(sysex) > 1):
+                self.sysex = None
+                self._queue(self.sysex_bytes + n + 1, sysex[0][1], sysex, False)
+                return
+        self.sysex_bytes += len(data)
+        if len(sysex) >= SYSEX_HOLD:
+            self.sysex = []
+            self._queue(self.sysex_bytes, sysex[0][1], sysex, True)
+            self.sysex_bytes = 0
+
+    def _queue(self, size, timestamp, events, more):
+        self.messages.append((size, timestamp, events, more))
+        self.queued += len(events)
+        self.received += 1
+
+    def pop(self):
+        size, timestamp, events, more = self.messages.popleft()
+        self.queued -= len(events)
+        self.deficit -= size
+        if not self.messages:
+            self.deficit = 0
+        self.sent += 1
+        self.sent_bytes += size
+        return events, more
+
+
+class MergedInput:
+    """Merges several MIDI inputs into the one input the bridge pump drains.
+
+    Each input's events are grouped into whole messages (a SysEx is held
+    until its end, up to SYSEX_HOLD events), so the single encoder never
+    sees one input's SysEx interleaved with another's notes. Messages are
+    released by deficit round robin: every input with messages waiting
+    earns `quantum` bytes per round and the eligible input with the oldest
+    message goes next. A SysEx flood on one input therefore gets its fair
+    share while notes from the others keep flowing in timestamp order.
+
+    With `interleave` (for a ring with a lanes.BulkLane, which encodes
+    SysEx apart from short messages) only other SysEx waits for a long
+    SysEx to end; other inputs' short messages go between its chunks.
+
+    Output is paced by the USB ring (a flush blocks while the SC-D70 is
+    busy); `rate` optionally caps it further, in MIDI bytes per second.
+    Inputs can be added and removed while the bridge runs. Presents the
+    pygame.midi.Input read/poll interface like the input backends do.
+    """
+
+    def __init__(self, quantum=QUANTUM, backlog=BACKLOG, rate=None, burst=None,
+                 interleave=False):
+        self.quantum = quantum
+        self.interleave = interleave
+        self.backlog = backlog
+        self.rate = rate
+        self.burst = burst or quantum * 4
+        self.sources = []
+        self._tokens = self.burst
+        self._refilled = time.monotonic()
+        self._exclusive = None    # input in the middle of sending a long SysEx
+        self._ready = threading.Event()
+        self._woken = False
+        self._stats_time = time.monotonic()
+
+    @property
+    def backend(self):
+        if any(source.midi_in.backend == BACKEND_POLL for source in self.sources):
+            return BACKEND_POLL
+        return BACKEND_EVENT
+
+    def add(self, name, midi_in):
+        if isinstance(midi_in, EventInput):
+            # Pushes on any event input wake wait()
+            midi_in.attach(self._ready)
+        self.sources = self.sources + [MergeSource(name, midi_in)]
+        self._ready.set()
+
+    def remove(self, name):
+        """Stop merging input `name` and close it; its queued messages are dropped"""
+        for source in self.sources:
+            if source.name == name:
+                self.sources = [s for s in self.sources if s is not source]
+                if self._exclusive is source:
+                    self._exclusive = None
+                source.midi_in.close()
+                return True
+        return False
+
+    @property
+    def names(self):
+        return [source.name for source in self.sources]
+
+    def _next(self):
+        """Input whose message goes next, or None"""
+        exclusive = self._exclusive
+        if exclusive is not None and not self.interleave:
+            return exclusive if exclusive.messages else None
+        ready = [source for source in self.sources if source.messages and (
+            exclusive is None or source is exclusive or not _is_sysex(source.messages[0][2]))]
+        if not ready:
+            return None
+        if self.rate:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+            self._refilled = now
+            if self._tokens <= 0:
+                return None
+        eligible = [source for source in ready if source.deficit >= source.messages[0][0]]
+        if not eligible:
+            # Start as many rounds as it takes for someone to be eligible
+            rounds = min(-(-(source.messages[0][0] - source.deficit) // self.quantum)
+                         for source in ready)
+            for source in ready:
+                source.deficit += rounds * self.quantum
+            eligible = [source for source in ready if source.deficit >= source.messages[0][0]]
+        return min(eligible, key=lambda source: source.messages[0][1])
+
+    def poll(self):
+        for source in self.sources:
+            source.fill(self.backlog)
+        return self._next() is not None
+
+    def read(self, count):
+        """Up to `count` events in whole messages (a held SysEx may exceed it)"""
+        events = []
+        while len(events) < count:
+            source = self._next()
+            if source is None:
+                break
+            size = source.messages[0][0]
+            message, more = source.pop()
+            if _is_sysex(message):
+                self._exclusive = source if more else None
+            events.extend(message)
+            if self.rate:
+                self._tokens -= size
+        return events
+
+    def clock(self):
+        """Current time in the merged timestamps' timebase (ms)"""
+        return now_ms()
+
+    def wait(self, timeout):
+        """Block until a message can be sent; False after `timeout` seconds"""
+        deadline = time.monotonic() + timeout
+        polling = self.backend == BACKEND_POLL
+        while True:
+            # Clear before checking so a push in between is not lost
+            self._ready.clear()
+            if self.poll():
+                return True
+            if self._woken:
+                self._woken = False
+                return False
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            if polling:
+                remaining = min(remaining, POLL_INTERVAL)
+            elif self.rate and any(source.messages for source in self.sources):
+                remaining = min(remaining, max(POLL_INTERVAL, -self._tokens / self.rate))
+            self._ready.wait(remaining)
+
+    def wake(self):
+        """Make a wait() in progress (or else the next one) return now; thread-safe"""
+        self._woken = True
+        self._ready.set()
+
+    def stats(self):
+        """Per-input counters and rates since the previous call"""
+        now = time.monotonic()
+        elapsed = max(now - self._stats_time, 1e-6)
+        self._stats_time = now
+        stats = []
+        for source in self.sources:
+            stats.append({"name": source.name,
+                          "messages": source.sent,
+                          "bytes": source.sent_bytes,
+                          "messages_per_s": (source.sent - source._last_sent) / elapsed,
+                          "bytes_per_s": (source.sent_bytes - source._last_bytes) / elapsed,
+                          "queued": source.queued,
+                          "peak_queued": source.peak})
+            source._last_sent = source.sent
+            source._last_bytes = source.sent_bytes
+        return stats
+
+    def close(self):
+        for source in self.sources:
+            source.midi_in.close()
+        self._ready.set()
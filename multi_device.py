@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+SC-D70 Bridge Multiple Units
+One worker thread per SC-D70, fed by a router that reads each MIDI input once
+"""
+
+import json
+import os
+import threading
+import time
+
+from batching import FLUSH_DEADLINE
+from bridge_core import (
+    GS_RESET, MASTER_VOL, MIDI_READ_SIZE, UsbMidiEncoder,
+    configure_device, device_id, find_devices, send_sysex,
+)
+from midi_filter import CHANNEL_MESSAGES, CONFIG_FILE, MidiFilter
+from midi_input import BACKEND_POLL, EventInput, TimedInput, now_ms
+from midi_merge import MergedInput, POLL_INTERVAL
+from scheduler import ScheduledInput
+from supervisor import BridgeSupervisor
+from usb_async import open_ring
+
+
+def load_units(path=CONFIG_FILE):
+    """The "units" list in `path`: [{"id", "inputs"?, "channels"?, "sysex"?}]"""
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        units = json.load(f).get("units") or []
+    for unit in units:
+        if "id" not in unit:
+            raise KeyError("every unit needs an \"id\" (serial number or bus-port path)")
+        for channel in unit.get("channels", ()):
+            if not 1 <= channel <= 16:
+                raise ValueError(f"unit {unit['id']}: invalid channel {channel}")
+    return units
+
+
+def unit_filter(unit, rules=()):
+    """MidiFilter passing only `unit`'s channels (and SysEx unless disabled),
+    followed by the shared `rules`; None if nothing is filtered"""
+    own = []
+    channels = unit.get("channels")
+    if channels:
+        others = [channel for channel in range(1, 17) if channel not in channels]
+        if others:
+            own.append({"type": "drop", "messages": list(CHANNEL_MESSAGES), "channels": others})
+    if not unit.get("sysex", True):
+        own.append({"type": "drop", "messages": ["sysex"]})
+    rules = own + list(rules)
+    return MidiFilter(rules) if rules else None
+
+
+def find_unit(unit_id):
+    """The connected SC-D70 called `unit_id` (see device_id), or None"""
+    for dev in find_devices():
+        if device_id(dev) == unit_id:
+            return dev
+    return None
+
+
+class DeviceWorker:
+    """One SC-D70, its USB ring and the thread that feeds it.
+
+    The worker drains its own input into its own ring under its own
+    BridgeSupervisor, so a unit that is slow, stalled or unplugged only
+    holds up its own queue. Each physical input routed to the unit arrives
+    in an EventInput filled by an InputRouter; with several they are merged.
+    With `schedule` (ms) the worker's thread releases each event at its
+    input timestamp + `schedule`, as ScheduledInput does for one unit.
+    """
+
+    def __init__(self, unit_id, dev, inputs, midi_filter=None, log=print,
+                 deadline=FLUSH_DEADLINE, schedule=None):
+        self.unit_id = unit_id
+        self.queues = {name: EventInput() for name in inputs}
+        if len(self.queues) == 1:
+            self.midi_in, = self.queues.values()
+        else:
+            self.midi_in = MergedInput(interleave=True)
+            for name, queue in self.queues.items():
+                self.midi_in.add(name, queue)
+        if schedule is not None:
+            self.midi_in = ScheduledInput(self.midi_in, schedule)
+        self.encoder = UsbMidiEncoder(midi_filter=midi_filter)
+        self.supervisor = BridgeSupervisor(
+            dev, open_ring(dev, deadline=deadline), self.midi_in, self.encoder,
+            find=lambda: find_unit(unit_id), log=lambda msg: log(f"[{unit_id}] {msg}"))
+        self.packets = 0
+        self.running = False
+        self._thread = None
+
+    def start(self):
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name=f"SC-D70 {self.unit_id}",
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        supervisor = self.supervisor
+        while self.running:
+            if self.midi_in.wait(0.5) or supervisor.disconnected:
+                self.packets += supervisor.pump()
+
+    def stop(self):
+        self.running = False
+        self.supervisor.stop()
+        self.midi_in.close()
+        if self._thread:
+            self._thread.join(timeout=1)
+        self.supervisor.close()
+
+
+class InputRouter:
+    """Reads every MIDI input once and hands its events to the units it is
+    routed to: channel messages only to the units playing that channel,
+    everything else (SysEx, system messages) to all of them. Timestamps are
+    moved onto now_ms() here, so every unit's merge compares them on one
+    timebase."""
+
+    def __init__(self):
+        self.routes = []          # (midi_in, queues, targets by status byte)
+        self._ready = threading.Event()
+
+    def add(self, midi_in, queues, channels=None):
+        """Route `midi_in` to `queues`; `channels[i]` lists queue i's
+        channels (1-16), None for all"""
+        if isinstance(midi_in, EventInput):
+            midi_in.attach(self._ready)
+        channels = channels or [None] * len(queues)
+        targets = None
+        if any(channels):
+            everyone = tuple(range(len(queues)))
+            targets = [everyone] * 256
+            for status in range(0x80, 0xF0):
+                channel = (status & 0x0F) + 1
+                targets[status] = tuple(i for i, wanted in enumerate(channels)
+                                        if not wanted or channel in wanted)
+        self.routes.append((midi_in, queues, targets))
+
+    def pump(self):
+        """Route all pending input; returns the number of events read"""
+        count = 0
+        for midi_in, queues, targets in self.routes:
+            if not midi_in.poll():
+                continue
+            offset = now_ms() - midi_in.clock()
+            while midi_in.poll():
+                events = midi_in.read(MIDI_READ_SIZE)
+                for event in events:
+                    event[1] += offset
+                count += len(events)
+                if targets is None:
+                    for queue in queues:
+                        queue.put(events)
+                    continue
+                # SysEx continuation events start with a data byte and go
+                # wherever SysEx goes: to every unit
+                split = [[] for _ in queues]
+                for event in events:
+                    for i in targets[event[0][0]]:
+                        split[i].append(event)
+                for queue, routed in zip(queues, split):
+                    if routed:
+                        queue.put(routed)
+        return count
+
+    def wait(self, timeout):
+        """Block until any input is pending; False after `timeout` seconds"""
+        self._ready.clear()
+        if any(route[0].poll() for route in self.routes):
+            return True
+        for midi_in, _, _ in self.routes:
+            if midi_in.backend == BACKEND_POLL:
+                timeout = min(timeout, POLL_INTERVAL)
+            elif isinstance(midi_in, TimedInput):
+                # Timed inputs (synthetic traffic) signal nothing: wake when
+                # their next event is due
+                due = midi_in.due()
+                if due is not None:
+                    timeout = min(timeout, due)
+        self._ready.wait(timeout)
+        return any(route[0].poll() for route in self.routes)
+
+    def close(self):
+        for midi_in, _, _ in self.routes:
+            midi_in.close()
+        self._ready.set()
+
+
+def start_units(units, inputs, rules=(), log=print, deadline=FLUSH_DEADLINE, schedule=None):
+    """Open every configured SC-D70 that is connected and route `inputs`
+    ({name: midi_in}) to them; returns (router, workers). `schedule` is
+    passed to every DeviceWorker.
+
+    Without configured units every connected SC-D70 gets all inputs. A unit
+    without "inputs" gets all of them; one without "channels" all channels.
+    """
+    devices = {device_id(dev): dev for dev in find_devices()}
+    if not units:
+        units = [{"id": unit_id} for unit_id in devices]
+    connected = []
+    for unit in units:
+        dev = devices.get(unit["id"])
+        if dev is None:
+            log(f"[{unit['id']}] SC-D70 not connected")
+            continue
+        configure_device(dev)
+        send_sysex(dev, GS_RESET)
+        connected.append((unit, dev))
+    time.sleep(0.2)
+    workers = []
+    for unit, dev in connected:
+        send_sysex(dev, MASTER_VOL)
+        names = [name for name in unit.get("inputs", inputs) if name in inputs]
+        workers.append((unit, DeviceWorker(unit["id"], dev, names, unit_filter(unit, rules), log,
+                                           deadline, schedule)))
+    router = InputRouter()
+    for name, midi_in in inputs.items():
+        routed = [(unit, worker) for unit, worker in workers if name in worker.queues]
+        router.add(midi_in, [worker.queues[name] for _, worker in routed],
+                   [unit.get("channels") for unit, _ in routed])
+    workers = [worker for _, worker in workers]
+    for worker in workers:
+        worker.start()
+    return router, workers
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+SC-D70 Clock Drift Compensation
+Adaptive resampling between the SC-D70's clock and the host output device
+"""
+
+import numpy as np
+
+# Fill level controller gains (ratio change per frame of fill error)
+KP = 2e-7
+KI = 2e-10
+# Smoothing for the measured fill level (per output block)
+FILL_ALPHA = 0.02
+# Hard limit on the correction; real crystal drift is well under this
+MAX_CORRECTION = 0.002
+
+
+class AdaptiveResampler:
+    """Pulls frames from an AudioRing at a continuously adjusted ratio.
+
+    The ratio (input frames per output frame) is steered by a PI controller
+    on the smoothed ring fill level: a filling ring means the SC-D70 runs
+    fast, so input is consumed slightly faster, and vice versa. The integral
+    term converges on the clock drift itself, reported as `drift_ppm`.
+    Interpolation is 4-point cubic Hermite, vectorized over each block, with
+    all buffers preallocated for `max_block` output frames.
+    """
+
+    def __init__(self, ring, target_fill, max_block=4096, channels=2):
+        self.ring = ring
+        self.target_fill = target_fill
+        self.ratio = 1.0
+        self.integral = 0.0
+        self.fill_avg = float(target_fill)
+        self.phase = 0.0
+        # work[0] is one frame of history before the current read position
+        size = int(max_block * (1 + MAX_CORRECTION)) + 8
+        self.work = np.zeros((size, channels), dtype=np.float32)
+        self.have = 1
+        self.steps = np.arange(max_block, dtype=np.float64)
+        self.pos = np.zeros(max_block, dtype=np.float64)
+        self.idx = np.zeros(max_block, dtype=np.intp)
+        self.frac = np.zeros((max_block, 1), dtype=np.float32)
+
+    @property
+    def drift_ppm(self):
+        """Estimated SC-D70 clock drift relative to the output device"""
+        return self.integral * 1e6
+
+    def update_ratio(self):
+        self.fill_avg += FILL_ALPHA * (self.ring.fill() - self.fill_avg)
+        error = self.fill_avg - self.target_fill
+        self.integral = float(np.clip(self.integral + KI * error, -MAX_CORRECTION, MAX_CORRECTION))
+        correction = np.clip(KP * error + self.integral, -MAX_CORRECTION, MAX_CORRECTION)
+        self.ratio = 1.0 + float(correction)
+
+    def read_into(self, out):
+        """Fill `out` (frames x channels) with resampled audio from the ring"""
+        frames = len(out)
+        self.update_ratio()
+        ratio = self.ratio
+
+        pos = self.pos[:frames]
+        np.multiply(self.steps[:frames], ratio, out=pos)
+        pos += self.phase
+        last = int(pos[-1])
+        need = last + 4
+        if need > self.have:
+            self.ring.read_into(self.work[self.have:need])
+            self.have = need
+
+        idx = self.idx[:frames]
+        idx[:] = pos
+        frac = self.frac[:frames]
+        np.subtract(pos, idx, out=frac[:, 0], casting="unsafe")
+
+        w = self.work
+        y0 = w[idx]
+        y1 = w[idx + 1]
+        y2 = w[idx + 2]
+        y3 = w[idx + 3]
+        # Catmull-Rom / cubic Hermite
+        a = (y3 - y0) * 0.5 + (y1 - y2) * 1.5
+        b = y0 - y1 * 2.5 + y2 * 2.0 - y3 * 0.5
+        c = (y2 - y0) * 0.5
+        out[:] = ((a * frac + b) * frac + c) * frac + y1
+
+        end = self.phase + ratio * frames
+        advance = int(end)
+        self.phase = end - advance
+        keep = self.have - advance
+        w[:keep] = w[advance:self.have]
+        self.have = keep
@@ -0,0 +1,123 @@
+/*
+ * Minimal libusb-1.0 stand-in for building usb_reader without libusb or an
+ * SC-D70 attached. Declares only what usb_reader.c uses; see libusb_shim.c.
+ */
+#ifndef LIBUSB_SHIM_H
+#define LIBUSB_SHIM_H
+
+#include <stdint.h>
+#include <sys/time.h>
+
+#define LIBUSB_CALL
+
+typedef struct libusb_context libusb_context;
+typedef struct libusb_device libusb_device;
+typedef struct libusb_device_handle libusb_device_handle;
+
+enum libusb_error {
+    LIBUSB_SUCCESS = 0,
+    LIBUSB_ERROR_IO = -1,
+    LIBUSB_ERROR_INVALID_PARAM = -2,
+    LIBUSB_ERROR_ACCESS = -3,
+    LIBUSB_ERROR_NO_DEVICE = -4,
+    LIBUSB_ERROR_NOT_FOUND = -5,
+    LIBUSB_ERROR_BUSY = -6,
+    LIBUSB_ERROR_TIMEOUT = -7,
+    LIBUSB_ERROR_OVERFLOW = -8,
+    LIBUSB_ERROR_PIPE = -9,
+    LIBUSB_ERROR_INTERRUPTED = -10,
+    LIBUSB_ERROR_NO_MEM = -11,
+    LIBUSB_ERROR_NOT_SUPPORTED = -12,
+    LIBUSB_ERROR_OTHER = -99
+};
+
+enum libusb_transfer_status {
+    LIBUSB_TRANSFER_COMPLETED,
+    LIBUSB_TRANSFER_ERROR,
+    LIBUSB_TRANSFER_TIMED_OUT,
+    LIBUSB_TRANSFER_CANCELLED,
+    LIBUSB_TRANSFER_STALL,
+    LIBUSB_TRANSFER_NO_DEVICE,
+    LIBUSB_TRANSFER_OVERFLOW
+};
+
+enum libusb_transfer_type {
+    LIBUSB_TRANSFER_TYPE_CONTROL = 0,
+    LIBUSB_TRANSFER_TYPE_ISOCHRONOUS = 1,
+    LIBUSB_TRANSFER_TYPE_BULK = 2,
+    LIBUSB_TRANSFER_TYPE_INTERRUPT = 3
+};
+
+struct libusb_iso_packet_descriptor {
+    unsigned int length;
+    unsigned int actual_length;
+    enum libusb_transfer_status status;
+};
+
+struct libusb_transfer;
+typedef void (LIBUSB_CALL *libusb_transfer_cb_fn)(struct libusb_transfer *transfer);
+
+struct libusb_transfer {
+    libusb_device_handle *dev_handle;
+    uint8_t flags;
+    unsigned char endpoint;
+    unsigned char type;
+    unsigned int timeout;
+    enum libusb_transfer_status status;
+    int length;
+    int actual_length;
+    libusb_transfer_cb_fn callback;
+    void *user_data;
+    unsigned char *buffer;
+    int num_iso_packets;
+    struct libusb_iso_packet_descriptor iso_packet_desc[];
+};
+
+int libusb_init(libusb_context **ctx);
+void libusb_exit(libusb_context *ctx);
+const char *libusb_error_name(int errcode);
+libusb_device_handle *libusb_open_device_with_vid_pid(libusb_context *ctx,
+                                                      uint16_t vendor_id, uint16_t product_id);
+void libusb_close(libusb_device_handle *dev_handle);
+libusb_device *libusb_get_device(libusb_device_handle *dev_handle);
+int libusb_set_auto_detach_kernel_driver(libusb_device_handle *dev_handle, int enable);
+int libusb_claim_interface(libusb_device_handle *dev_handle, int interface_number);
+int libusb_release_interface(libusb_device_handle *dev_handle, int interface_number);
+int libusb_set_interface_alt_setting(libusb_device_handle *dev_handle,
+                                     int interface_number, int alternate_setting);
+int libusb_get_max_iso_packet_size(libusb_device *dev, unsigned char endpoint);
+int libusb_bulk_transfer(libusb_device_handle *dev_handle, unsigned char endpoint,
+                         unsigned char *data, int length, int *actual_length,
+                         unsigned int timeout);
+struct libusb_transfer *libusb_alloc_transfer(int iso_packets);
+void libusb_free_transfer(struct libusb_transfer *transfer);
+int libusb_submit_transfer(struct libusb_transfer *transfer);
+int libusb_cancel_transfer(struct libusb_transfer *transfer);
+int libusb_handle_events_timeout_completed(libusb_context *ctx, struct timeval *tv,
+                                           int *completed);
+
+static inline void libusb_fill_iso_transfer(struct libusb_transfer *transfer,
+        libusb_device_handle *dev_handle, unsigned char endpoint, unsigned char *buffer,
+        int length, int num_iso_packets, libusb_transfer_cb_fn callback,
+        void *user_data, unsigned int timeout)
+{
+    transfer->dev_handle = dev_handle;
+    transfer->endpoint = endpoint;
+    transfer->type = LIBUSB_TRANSFER_TYPE_ISOCHRONOUS;
+    transfer->timeout = timeout;
+    transfer->buffer = buffer;
+    transfer->length = length;
+    transfer->num_iso_packets = num_iso_packets;
+    transfer->user_data = user_data;
+    transfer->callback = callback;
+}
+
+static inline void libusb_set_iso_packet_lengths(struct libusb_transfer *transfer,
+                                                 unsigned int length)
+{
+    int i;
+    for (i = 0; i < transfer->num_iso_packets; i++)
+        transfer->iso_packet_desc[i].length = length;
+}
+
+#endif
@@ -0,0 +1,166 @@
+/*
+ * Fake libusb-1.0 for exercising usb_reader without hardware.
+ *
+ * Pretends an SC-D70 (0582:000c) is attached. Reads from the audio endpoint
+ * return a 24-bit LE stereo ramp in 288-byte packets; every fourth
+ * isochronous packet is a 312-byte packet with 24 bytes of zero padding,
+ * like the idle framing described in research/README.md.
+ *
+ * USB_SHIM_FAULT (read on every call) injects failures:
+ *   bulk_error        bulk reads fail with LIBUSB_ERROR_NO_DEVICE
+ *   bulk_timeout      bulk reads time out after one packet
+ *   submit_error      submitting a transfer fails with LIBUSB_ERROR_NO_DEVICE
+ *   transfer_error    isochronous transfers complete with LIBUSB_TRANSFER_ERROR
+ *   transfer_timeout  isochronous transfers time out with half their packets
+ *   events_error      event handling fails once; the cancelled transfer returns
+ *   events_dead       event handling always fails; a cancelled transfer never returns
+ *
+ * Transfers complete in submission order the next time events are handled
+ * without a fault, so one abandoned under events_dead comes back late.
+ */
+#include <stdlib.h>
+#include <string.h>
+
+#include "libusb-1.0/libusb.h"
+
+#define SHIM_VENDOR_ID    0x0582
+#define SHIM_PRODUCT_ID   0x000c
+#define SHIM_PAYLOAD      288
+#define SHIM_PADDED       312
+#define SHIM_MAX_ISO      312
+#define SHIM_MAX_PENDING  16
+
+struct libusb_context {
+    int pending;
+    int failed;
+    struct libusb_transfer *transfers[SHIM_MAX_PENDING];
+};
+struct libusb_device { int unused; };
+struct libusb_device_handle { libusb_context *ctx; unsigned int sample; int packet; };
+
+static struct libusb_device shim_device;
+
+static int shim_fault(const char *name) {
+    const char *fault = getenv("USB_SHIM_FAULT");
+    return fault && strcmp(fault, name) == 0;
+}
+
+static void shim_fill(libusb_device_handle *h, unsigned char *out, int length) {
+    int i;
+    for (i = 0; i + 3 <= length; i += 3) {
+        unsigned int s = (h->sample++ * 4099u) & 0xFFFFFFu;
+        out[i] = s & 0xFF;
+        out[i + 1] = (s >> 8) & 0xFF;
+        out[i + 2] = (s >> 16) & 0xFF;
+    }
+}
+
+int libusb_init(libusb_context **ctx) {
+    *ctx = calloc(1, sizeof(libusb_context));
+    return *ctx ? LIBUSB_SUCCESS : LIBUSB_ERROR_NO_MEM;
+}
+
+void libusb_exit(libusb_context *ctx) { free(ctx); }
+
+const char *libusb_error_name(int errcode) {
+    switch (errcode) {
+    case LIBUSB_ERROR_IO: return "LIBUSB_ERROR_IO";
+    case LIBUSB_ERROR_TIMEOUT: return "LIBUSB_ERROR_TIMEOUT";
+    case LIBUSB_ERROR_NO_DEVICE: return "LIBUSB_ERROR_NO_DEVICE";
+    case LIBUSB_ERROR_BUSY: return "LIBUSB_ERROR_BUSY";
+    default: return "LIBUSB_ERROR_OTHER";
+    }
+}
+
+libusb_device_handle *libusb_open_device_with_vid_pid(libusb_context *ctx,
+        uint16_t vendor_id, uint16_t product_id) {
+    libusb_device_handle *h;
+    if (vendor_id != SHIM_VENDOR_ID || product_id != SHIM_PRODUCT_ID)
+        return NULL;
+    h = calloc(1, sizeof(libusb_device_handle));
+    if (h)
+        h->ctx = ctx;
+    return h;
+}
+
+void libusb_close(libusb_device_handle *dev_handle) { free(dev_handle); }
+libusb_device *libusb_get_device(libusb_device_handle *dev_handle) { return &shim_device; }
+int libusb_set_auto_detach_kernel_driver(libusb_device_handle *h, int e) { return LIBUSB_ERROR_NOT_SUPPORTED; }
+int libusb_claim_interface(libusb_device_handle *h, int i) { return LIBUSB_SUCCESS; }
+int libusb_release_interface(libusb_device_handle *h, int i) { return LIBUSB_SUCCESS; }
+int libusb_set_interface_alt_setting(libusb_device_handle *h, int i, int a) { return LIBUSB_SUCCESS; }
+int libusb_get_max_iso_packet_size(libusb_device *dev, unsigned char endpoint) { return SHIM_MAX_ISO; }
+
+int libusb_bulk_transfer(libusb_device_handle *h, unsigned char endpoint,
+                         unsigned char *data, int length, int *actual_length,
+                         unsigned int timeout) {
+    int n = length - (length % SHIM_PAYLOAD);
+    *actual_length = 0;
+    if (shim_fault("bulk_error"))
+        return LIBUSB_ERROR_NO_DEVICE;
+    if (shim_fault("bulk_timeout") && n > SHIM_PAYLOAD)
+        n = SHIM_PAYLOAD;
+    shim_fill(h, data, n);
+    *actual_length = n;
+    return shim_fault("bulk_timeout") ? LIBUSB_ERROR_TIMEOUT : LIBUSB_SUCCESS;
+}
+
+struct libusb_transfer *libusb_alloc_transfer(int iso_packets) {
+    return calloc(1, sizeof(struct libusb_transfer) +
+                     iso_packets * sizeof(struct libusb_iso_packet_descriptor));
+}
+
+void libusb_free_transfer(struct libusb_transfer *transfer) { free(transfer); }
+
+int libusb_submit_transfer(struct libusb_transfer *t) {
+    libusb_device_handle *h = t->dev_handle;
+    int i, completed = t->num_iso_packets;
+    if (shim_fault("submit_error"))
+        return LIBUSB_ERROR_NO_DEVICE;
+    if (h->ctx->pending == SHIM_MAX_PENDING)
+        return LIBUSB_ERROR_BUSY;
+    if (shim_fault("transfer_timeout"))
+        completed = t->num_iso_packets / 2;
+    for (i = 0; i < t->num_iso_packets; i++) {
+        struct libusb_iso_packet_descriptor *d = &t->iso_packet_desc[i];
+        unsigned char *p = t->buffer + (size_t)i * d->length;
+        int padded = (h->packet++ % 4) == 3 && d->length >= SHIM_PADDED;
+        shim_fill(h, p, SHIM_PAYLOAD);
+        if (padded)
+            memset(p + SHIM_PAYLOAD, 0, SHIM_PADDED - SHIM_PAYLOAD);
+        d->actual_length = padded ? SHIM_PADDED : SHIM_PAYLOAD;
+        d->status = LIBUSB_TRANSFER_COMPLETED;
+        if (i >= completed) {
+            d->actual_length = 0;
+            d->status = LIBUSB_TRANSFER_TIMED_OUT;
+        }
+    }
+    t->status = LIBUSB_TRANSFER_COMPLETED;
+    if (shim_fault("transfer_error"))
+        t->status = LIBUSB_TRANSFER_ERROR;
+    else if (completed < t->num_iso_packets)
+        t->status = LIBUSB_TRANSFER_TIMED_OUT;
+    h->ctx->transfers[h->ctx->pending++] = t;
+    h->ctx->failed = 0;
+    return LIBUSB_SUCCESS;
+}
+
+int libusb_cancel_transfer(struct libusb_transfer *t) {
+    if (shim_fault("events_dead"))
+        return LIBUSB_SUCCESS;
+    t->status = LIBUSB_TRANSFER_CANCELLED;
+    return LIBUSB_SUCCESS;
+}
+
+int libusb_handle_events_timeout_completed(libusb_context *ctx, struct timeval *tv,
+                                           int *completed) {
+    int i, pending = ctx->pending;
+    if (shim_fault("events_dead") || (shim_fault("events_error") && !ctx->failed)) {
+        ctx->failed = 1;
+        return LIBUSB_ERROR_IO;
+    }
+    ctx->pending = 0;
+    for (i = 0; i < pending; i++)
+        ctx->transfers[i]->callback(ctx->transfers[i]);
+    return LIBUSB_SUCCESS;
+}
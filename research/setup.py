@@ -1,4 +1,5 @@
 from setuptools import setup, Extension
+import os
 import subprocess
 
 # Get libusb paths from pkg-config
@@ -26,9 +27,19 @@ if not library_dirs:
 if not libraries:
     libraries = ['usb-1.0']
 
+sources = ['usb_reader.c']
+
+# USB_READER_SHIM=1 builds against the fake libusb in libusb_shim/ so the
+# module can be exercised without libusb or an SC-D70 attached
+if os.environ.get('USB_READER_SHIM'):
+    include_dirs = ['libusb_shim']
+    library_dirs = []
+    libraries = []
+    sources.append('libusb_shim/libusb_shim.c')
+
 usb_reader_module = Extension(
     'usb_reader',
-    sources=['usb_reader.c'],
+    sources=sources,
     include_dirs=include_dirs,
     library_dirs=library_dirs,
     libraries=libraries,
@@ -37,7 +48,7 @@ usb_reader_module = Extension(
 
 setup(
     name='usb_reader',
-    version='1.0',
-    description='Fast USB reading module',
+    version='2.0',
+    description='Fast SC-D70 USB reading module',
     ext_modules=[usb_reader_module],
 )
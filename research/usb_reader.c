@@ -1,53 +1,428 @@
 #define PY_SSIZE_T_CLEAN
 #include <Python.h>
+#include <string.h>
 #include <libusb-1.0/libusb.h>
 
-static PyObject* usb_read_fast(PyObject* self, PyObject* args) {
-    unsigned long dev_handle_ptr;
-    int endpoint;
-    int length;
-    int timeout;
-    
-    if (!PyArg_ParseTuple(args, "kiii", &dev_handle_ptr, &endpoint, &length, &timeout)) {
+#define SC_D70_VENDOR_ID   0x0582
+#define SC_D70_PRODUCT_ID  0x000c
+#define ENDPOINT_AUDIO_IN  0x81
+#define INTERFACE_AUDIO    1
+#define AUDIO_ALTSETTING   1
+
+/* libusb_handle_events poll period, and how many polls read_iso() gives a
+   cancelled transfer to come back before it gives up on it */
+#define EVENT_POLL_US      10000
+#define CANCEL_POLLS       100
+
+/*
+ * usb_reader.Device owns its own libusb context and handle, so nothing is
+ * borrowed from pyusb. Reads go straight into caller-supplied writable
+ * buffers (bytearray, numpy array, memoryview...) with the GIL released.
+ */
+typedef struct {
+    PyObject_HEAD
+    libusb_context *ctx;
+    libusb_device_handle *handle;
+    int interface;
+    struct libusb_transfer *iso;   /* reused between read_iso() calls */
+    int iso_packets;
+    int iso_done;
+} DeviceObject;
+
+static PyObject *UsbReaderError;
+
+static PyObject *set_usb_error(const char *what, int rc) {
+    PyErr_Format(UsbReaderError, "%s: %s", what, libusb_error_name(rc));
+    return NULL;
+}
+
+static void device_release(DeviceObject *self) {
+    if (self->iso) {
+        libusb_free_transfer(self->iso);
+        self->iso = NULL;
+        self->iso_packets = 0;
+    }
+    if (self->handle) {
+        libusb_release_interface(self->handle, self->interface);
+        libusb_close(self->handle);
+        self->handle = NULL;
+    }
+    if (self->ctx) {
+        libusb_exit(self->ctx);
+        self->ctx = NULL;
+    }
+}
+
+static int Device_init(DeviceObject *self, PyObject *args, PyObject *kwds) {
+    static char *kwlist[] = {"vendor_id", "product_id", "interface", "altsetting", NULL};
+    int vendor_id = SC_D70_VENDOR_ID;
+    int product_id = SC_D70_PRODUCT_ID;
+    int interface = INTERFACE_AUDIO;
+    int altsetting = AUDIO_ALTSETTING;
+    int rc;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "|iiii", kwlist,
+                                     &vendor_id, &product_id, &interface, &altsetting)) {
+        return -1;
+    }
+
+    device_release(self);
+    self->interface = interface;
+
+    rc = libusb_init(&self->ctx);
+    if (rc < 0) {
+        self->ctx = NULL;
+        set_usb_error("libusb_init failed", rc);
+        return -1;
+    }
+
+    self->handle = libusb_open_device_with_vid_pid(self->ctx, (uint16_t)vendor_id,
+                                                   (uint16_t)product_id);
+    if (!self->handle) {
+        device_release(self);
+        PyErr_Format(UsbReaderError, "Device %04x:%04x not found", vendor_id, product_id);
+        return -1;
+    }
+
+    /* Not supported on every platform (e.g. macOS); claiming still works */
+    libusb_set_auto_detach_kernel_driver(self->handle, 1);
+
+    rc = libusb_claim_interface(self->handle, interface);
+    if (rc < 0) {
+        libusb_close(self->handle);
+        self->handle = NULL;
+        device_release(self);
+        set_usb_error("libusb_claim_interface failed", rc);
+        return -1;
+    }
+
+    rc = libusb_set_interface_alt_setting(self->handle, interface, altsetting);
+    if (rc < 0) {
+        device_release(self);
+        set_usb_error("libusb_set_interface_alt_setting failed", rc);
+        return -1;
+    }
+
+    return 0;
+}
+
+static void Device_dealloc(DeviceObject *self) {
+    device_release(self);
+    Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+static int check_open(DeviceObject *self) {
+    if (!self->handle) {
+        PyErr_SetString(PyExc_ValueError, "Device is closed");
+        return 0;
+    }
+    return 1;
+}
+
+static PyObject *Device_read_bulk(DeviceObject *self, PyObject *args, PyObject *kwds) {
+    static char *kwlist[] = {"buffer", "endpoint", "timeout", NULL};
+    Py_buffer view;
+    int endpoint = ENDPOINT_AUDIO_IN;
+    unsigned int timeout = 100;
+    int transferred = 0;
+    int rc;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "w*|iI", kwlist, &view, &endpoint, &timeout)) {
         return NULL;
     }
-    
-    libusb_device_handle* handle = (libusb_device_handle*)dev_handle_ptr;
-    
-    unsigned char* buffer = (unsigned char*)malloc(length);
-    if (!buffer) {
-        PyErr_SetString(PyExc_MemoryError, "Failed to allocate buffer");
+    if (!check_open(self)) {
+        PyBuffer_Release(&view);
         return NULL;
     }
-    
-    int transferred;
-    int result = libusb_bulk_transfer(handle, endpoint, buffer, length, &transferred, timeout);
-    
-    if (result < 0 && result != LIBUSB_ERROR_TIMEOUT) {
-        free(buffer);
-        PyErr_Format(PyExc_IOError, "USB read error: %s", libusb_error_name(result));
+    if (view.len > INT_MAX) {
+        PyBuffer_Release(&view);
+        PyErr_SetString(PyExc_ValueError, "buffer too large");
         return NULL;
     }
-    
-    PyObject* bytes_obj = PyBytes_FromStringAndSize((char*)buffer, transferred);
-    free(buffer);
-    
-    return bytes_obj;
+
+    Py_BEGIN_ALLOW_THREADS
+    rc = libusb_bulk_transfer(self->handle, (unsigned char)endpoint, (unsigned char *)view.buf,
+                              (int)view.len, &transferred, timeout);
+    Py_END_ALLOW_THREADS
+    PyBuffer_Release(&view);
+
+    if (rc < 0 && rc != LIBUSB_ERROR_TIMEOUT) {
+        return set_usb_error("USB read error", rc);
+    }
+    return PyLong_FromLong(transferred);
+}
+
+static void LIBUSB_CALL iso_callback(struct libusb_transfer *transfer) {
+    *(int *)transfer->user_data = 1;
+}
+
+/* Callback of a transfer read_iso() gave up on: user_data is the caller's
+   buffer, kept exported until libusb stops writing to it (NULL if it could
+   not be saved, in which case it stays exported for good) */
+static void LIBUSB_CALL iso_abandoned_callback(struct libusb_transfer *transfer) {
+    Py_buffer *view = (Py_buffer *)transfer->user_data;
+    PyGILState_STATE gil;
+
+    if (view) {
+        gil = PyGILState_Ensure();
+        PyBuffer_Release(view);
+        PyGILState_Release(gil);
+        PyMem_RawFree(view);
+    }
+    libusb_free_transfer(transfer);
+}
+
+/* Wait for the submitted iso transfer with the GIL released. If event
+   handling fails the transfer is cancelled and waited for CANCEL_POLLS more
+   polls at most; returns the event handling error (0 if none). */
+static int wait_iso(DeviceObject *self) {
+    struct timeval tv = {0, EVENT_POLL_US};
+    int error = 0, polls = 0, rc;
+
+    while (!self->iso_done) {
+        rc = libusb_handle_events_timeout_completed(self->ctx, &tv, &self->iso_done);
+        if (rc < 0 && !error) {
+            error = rc;
+            libusb_cancel_transfer(self->iso);
+        }
+        if (error && !self->iso_done && ++polls >= CANCEL_POLLS) {
+            break;
+        }
+    }
+    return error;
+}
+
+/* Release read_iso()'s buffers; the optional `lengths` one may be unset */
+static void release_views(Py_buffer *view, Py_buffer *lengths) {
+    if (view) {
+        PyBuffer_Release(view);
+    }
+    if (lengths->obj) {
+        PyBuffer_Release(lengths);
+    }
 }
 
-static PyMethodDef UsbReaderMethods[] = {
-    {"read_fast", usb_read_fast, METH_VARARGS, "Fast USB bulk read"},
+static PyObject *Device_read_iso(DeviceObject *self, PyObject *args, PyObject *kwds) {
+    static char *kwlist[] = {"buffer", "endpoint", "packet_size", "timeout", "payload",
+                             "lengths", NULL};
+    Py_buffer view;
+    Py_buffer lengths = {NULL, NULL};
+    unsigned int *packet_lengths = NULL;
+    int endpoint = ENDPOINT_AUDIO_IN;
+    int packet_size = 0;
+    unsigned int timeout = 100;
+    unsigned int payload = 0;
+    int packets, rc, i, events_rc = 0;
+    unsigned char *buf;
+    Py_ssize_t offset = 0;
+    enum libusb_transfer_status status;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "w*|iiIIw*", kwlist, &view, &endpoint,
+                                     &packet_size, &timeout, &payload, &lengths)) {
+        return NULL;
+    }
+    if (!check_open(self)) {
+        release_views(&view, &lengths);
+        return NULL;
+    }
+    if (packet_size <= 0) {
+        packet_size = libusb_get_max_iso_packet_size(libusb_get_device(self->handle),
+                                                     (unsigned char)endpoint);
+        if (packet_size <= 0) {
+            release_views(&view, &lengths);
+            return set_usb_error("libusb_get_max_iso_packet_size failed", packet_size);
+        }
+    }
+    if (view.len > INT_MAX || view.len < packet_size) {
+        release_views(&view, &lengths);
+        PyErr_Format(PyExc_ValueError, "buffer must hold at least one %d byte packet",
+                     packet_size);
+        return NULL;
+    }
+    packets = (int)(view.len / packet_size);
+    buf = (unsigned char *)view.buf;
+    if (lengths.obj) {
+        if (lengths.len < (Py_ssize_t)(packets * sizeof(unsigned int))) {
+            release_views(&view, &lengths);
+            PyErr_Format(PyExc_ValueError, "lengths must hold %d 32-bit packet lengths",
+                         packets);
+            return NULL;
+        }
+        packet_lengths = (unsigned int *)lengths.buf;
+    }
+
+    if (packets > self->iso_packets) {
+        if (self->iso) {
+            libusb_free_transfer(self->iso);
+        }
+        self->iso = libusb_alloc_transfer(packets);
+        if (!self->iso) {
+            self->iso_packets = 0;
+            release_views(&view, &lengths);
+            return PyErr_NoMemory();
+        }
+        self->iso_packets = packets;
+    }
+
+    self->iso_done = 0;
+    libusb_fill_iso_transfer(self->iso, self->handle, (unsigned char)endpoint, buf,
+                             packets * packet_size, packets, iso_callback,
+                             &self->iso_done, timeout);
+    libusb_set_iso_packet_lengths(self->iso, (unsigned int)packet_size);
+
+    Py_BEGIN_ALLOW_THREADS
+    rc = libusb_submit_transfer(self->iso);
+    if (rc == 0) {
+        events_rc = wait_iso(self);
+    }
+    Py_END_ALLOW_THREADS
+
+    if (rc < 0) {
+        release_views(&view, &lengths);
+        return set_usb_error("libusb_submit_transfer failed", rc);
+    }
+    if (!self->iso_done) {
+        /* libusb still owns the transfer and may yet write into the buffer:
+           both are freed by its callback if it ever comes back, and the
+           next read allocates a new transfer */
+        Py_buffer *held = PyMem_RawMalloc(sizeof(Py_buffer));
+        if (held) {
+            *held = view;
+        }
+        self->iso->user_data = held;
+        self->iso->callback = iso_abandoned_callback;
+        self->iso = NULL;
+        self->iso_packets = 0;
+        release_views(NULL, &lengths);
+        return set_usb_error("Isochronous transfer not cancelled", events_rc);
+    }
+    if (events_rc < 0) {
+        release_views(&view, &lengths);
+        return set_usb_error("USB event handling failed", events_rc);
+    }
+
+    status = self->iso->status;
+    if (status != LIBUSB_TRANSFER_COMPLETED && status != LIBUSB_TRANSFER_TIMED_OUT) {
+        release_views(&view, &lengths);
+        PyErr_Format(UsbReaderError, "Isochronous transfer failed (status %d)", (int)status);
+        return NULL;
+    }
+
+    /* Pack the received payloads together at the start of the buffer,
+       keeping at most `payload` bytes of each packet if given */
+    for (i = 0; i < packets; i++) {
+        struct libusb_iso_packet_descriptor *desc = &self->iso->iso_packet_desc[i];
+        unsigned int length = desc->actual_length;
+        if (desc->status != LIBUSB_TRANSFER_COMPLETED) {
+            length = 0;
+        }
+        if (payload && length > payload) {
+            length = payload;
+        }
+        if (packet_lengths) {
+            packet_lengths[i] = length;
+        }
+        if (length == 0) {
+            continue;
+        }
+        if (offset != (Py_ssize_t)i * packet_size) {
+            memmove(buf + offset, buf + (Py_ssize_t)i * packet_size, length);
+        }
+        offset += length;
+    }
+
+    release_views(&view, &lengths);
+    return PyLong_FromSsize_t(offset);
+}
+
+static PyObject *Device_close(DeviceObject *self, PyObject *Py_UNUSED(ignored)) {
+    device_release(self);
+    Py_RETURN_NONE;
+}
+
+static PyObject *Device_enter(DeviceObject *self, PyObject *Py_UNUSED(ignored)) {
+    if (!check_open(self)) {
+        return NULL;
+    }
+    Py_INCREF(self);
+    return (PyObject *)self;
+}
+
+static PyObject *Device_exit(DeviceObject *self, PyObject *args) {
+    device_release(self);
+    Py_RETURN_FALSE;
+}
+
+static PyMethodDef Device_methods[] = {
+    {"read_bulk", (PyCFunction)(void (*)(void))Device_read_bulk, METH_VARARGS | METH_KEYWORDS,
+     "read_bulk(buffer, endpoint=0x81, timeout=100) -> bytes read\n\n"
+     "Bulk read straight into a writable buffer. A timeout returns the bytes\n"
+     "received so far."},
+    {"read_iso", (PyCFunction)(void (*)(void))Device_read_iso, METH_VARARGS | METH_KEYWORDS,
+     "read_iso(buffer, endpoint=0x81, packet_size=0, timeout=100, payload=0,\n"
+     "         lengths=None) -> bytes read\n\n"
+     "Isochronous read of len(buffer) // packet_size packets into a writable\n"
+     "buffer. The received payloads are packed together at the start of the\n"
+     "buffer, truncated to `payload` bytes each if non-zero (288 drops the\n"
+     "SC-D70's 312-byte packet padding). packet_size=0 uses the endpoint's\n"
+     "max isochronous packet size. A writable `lengths` buffer of 32-bit\n"
+     "unsigned ints receives each packet's packed size (0 if not received)."},
+    {"close", (PyCFunction)Device_close, METH_NOARGS, "Release the interface and close the device"},
+    {"__enter__", (PyCFunction)Device_enter, METH_NOARGS, NULL},
+    {"__exit__", (PyCFunction)Device_exit, METH_VARARGS, NULL},
     {NULL, NULL, 0, NULL}
 };
 
+static PyTypeObject DeviceType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    .tp_name = "usb_reader.Device",
+    .tp_doc = "Device(vendor_id=0x0582, product_id=0x000c, interface=1, altsetting=1)\n\n"
+              "SC-D70 audio interface opened directly through libusb.",
+    .tp_basicsize = sizeof(DeviceObject),
+    .tp_itemsize = 0,
+    .tp_flags = Py_TPFLAGS_DEFAULT,
+    .tp_new = PyType_GenericNew,
+    .tp_init = (initproc)Device_init,
+    .tp_dealloc = (destructor)Device_dealloc,
+    .tp_methods = Device_methods,
+};
+
 static struct PyModuleDef usbreadermodule = {
     PyModuleDef_HEAD_INIT,
     "usb_reader",
-    "Fast USB reading module",
+    "Fast SC-D70 USB reading module",
     -1,
-    UsbReaderMethods
+    NULL
 };
 
 PyMODINIT_FUNC PyInit_usb_reader(void) {
-    return PyModule_Create(&usbreadermodule);
+    PyObject *m;
+
+    if (PyType_Ready(&DeviceType) < 0) {
+        return NULL;
+    }
+    m = PyModule_Create(&usbreadermodule);
+    if (!m) {
+        return NULL;
+    }
+
+    UsbReaderError = PyErr_NewException("usb_reader.USBError", PyExc_IOError, NULL);
+    Py_INCREF(UsbReaderError);
+    if (PyModule_AddObject(m, "USBError", UsbReaderError) < 0) {
+        Py_DECREF(UsbReaderError);
+        Py_DECREF(m);
+        return NULL;
+    }
+
+    Py_INCREF(&DeviceType);
+    if (PyModule_AddObject(m, "Device", (PyObject *)&DeviceType) < 0) {
+        Py_DECREF(&DeviceType);
+        Py_DECREF(m);
+        return NULL;
+    }
+
+    PyModule_AddIntConstant(m, "VENDOR_ID", SC_D70_VENDOR_ID);
+    PyModule_AddIntConstant(m, "PRODUCT_ID", SC_D70_PRODUCT_ID);
+    PyModule_AddIntConstant(m, "ENDPOINT_AUDIO_IN", ENDPOINT_AUDIO_IN);
+    return m;
 }
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+SC-D70 Bridge Output Scheduling
+Releases MIDI events to the bridge pump at their timestamp plus a fixed delay
+"""
+
+import collections
+import heapq
+import itertools
+import time
+
+from bridge_core import MIDI_READ_SIZE, SYSEX_END, SYSEX_START
+from midi_input import message_events, now_ms
+
+# Default delay (ms) between an event's timestamp and its release: covers
+# the input's delivery and the thread's wake-up, so every event leaves with
+# the same latency
+SCHEDULE_DELAY = 5.0
+# Below this many ms to the next due event the thread spins rather than sleeps
+SPIN_MS = 1.0
+
+
+class ScheduledInput:
+    """Wraps a MIDI input so its events come out at timestamp + `delay` ms.
+
+    Input events keep their order in a FIFO whose due times never go
+    backwards; messages given to `schedule()` wait in a heap for an
+    absolute time. `wait()` sleeps until shortly before the next due event
+    (still waking at once for new input) and spins the last SPIN_MS, so
+    the bridge thread itself is the timing thread and releases each event
+    within a fraction of a millisecond of its due time, whatever the batch
+    boundaries. A scheduled message is never released inside an input SysEx.
+
+    Presents the pygame.midi.Input read/poll interface like the input
+    backends do; timestamps are moved onto now_ms().
+    """
+
+    def __init__(self, source, delay=SCHEDULE_DELAY):
+        self.source = source
+        self.delay = delay
+        self.backend = source.backend
+        self._input = collections.deque()     # [data, due] in arrival order
+        self._last_due = 0.0
+        self._heap = []                       # (due, seq, events)
+        self._inbox = collections.deque()     # schedule() calls from any thread
+        self._seq = itertools.count()
+        self._sysex = False                   # an input SysEx is being released
+        self._woken = False
+        self.late = 0                         # events already overdue on arrival
+
+    def schedule(self, message, at):
+        """Send raw MIDI `message` at `at` (ms, on the now_ms() clock); thread-safe"""
+        self._inbox.append((at, message))
+        # A wait() in progress recomputes its sleep with the message in the heap
+        self.source.wake()
+
+    def _fill(self):
+        while self._inbox:
+            at, message = self._inbox.popleft()
+            heapq.heappush(self._heap, (at, next(self._seq), message_events(message, at)))
+        source = self.source
+        if not source.poll():
+            return
+        offset = now_ms() - source.clock() + self.delay
+        now = now_ms()
+        while source.poll():
+            for event in source.read(MIDI_READ_SIZE):
+                due = event[1] + offset
+                if due < self._last_due:
+                    due = self._last_due
+                elif due < now:
+                    self.late += 1
+                self._last_due = event[1] = due
+                self._input.append(event)
+
+    def _next_due(self):
+        due = self._input[0][1] if self._input else None
+        if self._heap and not self._sysex and (due is None or self._heap[0][0] < due):
+            due = self._heap[0][0]
+        return due
+
+    def poll(self):
+        self._fill()
+        due = self._next_due()
+        return due is not None and due <= now_ms()
+
+    def read(self, count):
+        events = []
+        now = now_ms()
+        queue = self._input
+        heap = self._heap
+        while len(events) < count:
+            if heap and not self._sysex and heap[0][0] <= now and \
+                    (not queue or heap[0][0] < queue[0][1]):
+                events.extend(heapq.heappop(heap)[2])
+            elif queue and queue[0][1] <= now:
+                event = queue.popleft()
+                events.append(event)
+                data = event[0]
+                if data[0] == SYSEX_START or (self._sysex and data[0] < 0x80):
+                    self._sysex = SYSEX_END not in data
+                elif data[0] < 0xF8:
+                    self._sysex = False
+            else:
+                break
+        return events
+
+    def clock(self):
+        """Current time in the scheduled timestamps' timebase (ms)"""
+        return now_ms()
+
+    def wait(self, timeout):
+        """Block until an event is due; False after `timeout` seconds"""
+        deadline = time.monotonic() + timeout
+        while True:
+            self._fill()
+            remaining = (deadline - time.monotonic()) * 1000.0
+            due = self._next_due()
+            if due is not None:
+                until = due - now_ms()
+                if until <= 0:
+                    return True
+                if until <= SPIN_MS:
+                    while now_ms() < due:
+                        pass
+                    return True
+                remaining = min(remaining, until - SPIN_MS)
+            if remaining <= 0:
+                return False
+            self.source.wait(remaining / 1000.0)
+            if self._woken:
+                self._woken = False
+                return self.poll()
+
+    def wake(self):
+        """Make a wait() in progress (or else the next one) return now; thread-safe"""
+        self._woken = True
+        self.source.wake()
+
+    def close(self):
+        self.source.close()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+SC-D70 Bridge Simulated Device
+A software SC-D70 for running and load-testing the bridge without hardware
+"""
+
+import errno
+import math
+import random
+import struct
+import threading
+import time
+
+import usb.core
+
+import bridge_core
+from bridge_core import ENDPOINT_MIDI_OUT, PACKET_SIZE, PRODUCT_ID, VENDOR_ID
+
+ENDPOINT_AUDIO_IN = 0x81
+# Audio packets, one per 1 ms frame (see pcm24): 48 stereo 24-bit frames,
+# padded to 312 bytes while nothing has been played recently
+AUDIO_PACKET = 288
+AUDIO_PADDED_PACKET = 312
+AUDIO_INTERVAL = 0.001
+# Seconds of 288-byte (sounding) packets after the last MIDI received
+AUDIO_DECAY = 0.5
+
+# Full-speed bulk moves ~1.2 MB/s
+BUS_RATE = 1.2e6
+
+
+def _sine_packet():
+    """One 288-byte packet of a 1 kHz sine: exactly one cycle at 48 kHz"""
+    frames = []
+    for i in range(AUDIO_PACKET // 6):
+        sample = int(0x200000 * math.sin(2 * math.pi * i / 48)) & 0xFFFFFF
+        frames.append(struct.pack("<I", sample)[:3] * 2)
+    return b"".join(frames)
+
+
+class _SimContext:
+    """Stands in for pyusb's device context: no libusb backend, so the
+    bridge writes synchronously, and nothing to dispose"""
+
+    backend = None
+
+    def dispose(self, device, close_handle=True):
+        pass
+
+
+class SimulatedSCD70:
+    """Software SC-D70 with the parts of pyusb's Device the bridge uses.
+
+    Accepts USB-MIDI packets on EP 0x02. Each transfer takes `latency`
+    seconds (plus up to `jitter`) plus its size at `bus_rate`. A transfer
+    stalls the endpoint with probability `stall_rate` until clear_halt().
+    After unplug() every call fails with ENODEV until plug(). EP 0x81
+    streams audio in real time: 288-byte packets of a 1 kHz tone while MIDI
+    has arrived in the last AUDIO_DECAY seconds, 312-byte padded silence
+    otherwise. With `record` set, every byte written is kept in `received`.
+    """
+
+    idVendor = VENDOR_ID
+    idProduct = PRODUCT_ID
+    iSerialNumber = 0
+
+    def __init__(self, port=1, latency=0.0, jitter=0.0, bus_rate=BUS_RATE,
+                 stall_rate=0.0, seed=None, record=False):
+        self._ctx = _SimContext()
+        self.bus = 0
+        self.address = port
+        self.port_numbers = (port,)
+        self.latency = latency
+        self.jitter = jitter
+        self.bus_rate = bus_rate
+        self.stall_rate = stall_rate
+        self.connected = True
+        self.stalled = False
+        self.received = bytearray() if record else None
+        self.transfers = 0
+        self.packets = 0
+        self.stalls = 0
+        self.audio_packets = 0
+        self._random = random.Random(seed)
+        self._last_midi = 0.0
+        self._audio_next = None
+        self._sine = _sine_packet()
+        self._silence = bytes(AUDIO_PADDED_PACKET)
+        self._lock = threading.Lock()
+
+    def _check(self):
+        if not self.connected:
+            raise usb.core.USBError("No such device (it may have been disconnected)",
+                                    errno=errno.ENODEV)
+
+    def unplug(self):
+        self.connected = False
+
+    def plug(self):
+        self.connected = True
+        self.stalled = False
+
+    def is_kernel_driver_active(self, interface):
+        self._check()
+        return False
+
+    def detach_kernel_driver(self, interface):
+        self._check()
+
+    def set_configuration(self, configuration=None):
+        self._check()
+
+    def set_interface_altsetting(self, interface=None, alternate_setting=None):
+        self._check()
+
+    def clear_halt(self, endpoint):
+        self._check()
+        self.stalled = False
+
+    def write(self, endpoint, data, timeout=None):
+        self._check()
+        if endpoint != ENDPOINT_MIDI_OUT:
+            raise usb.core.USBError("Invalid parameter", errno=errno.EINVAL)
+        if self.stalled:
+            raise usb.core.USBError("Pipe error", errno=errno.EPIPE)
+        size = len(data)
+        if self.stall_rate and self._random.random() < self.stall_rate:
+            self.stalled = True
+            self.stalls += 1
+            raise usb.core.USBError("Pipe error", errno=errno.EPIPE)
+        delay = self.latency + size / self.bus_rate
+        if self.jitter:
+            delay += self._random.random() * self.jitter
+        if timeout and delay * 1000.0 > timeout:
+            time.sleep(timeout / 1000.0)
+            raise usb.core.USBTimeoutError("Operation timed out", errno=errno.ETIMEDOUT)
+        if delay > 0:
+            time.sleep(delay)
+        with self._lock:
+            if self.received is not None:
+                self.received += bytes(data)
+            self.transfers += 1
+            self.packets += size // PACKET_SIZE
+            self._last_midi = time.monotonic()
+        return size
+
+    def read(self, endpoint, size_or_buffer, timeout=None):
+        """Audio packets due since the last read (waits for at least one)"""
+        self._check()
+        if endpoint != ENDPOINT_AUDIO_IN:
+            raise usb.core.USBError("Invalid parameter", errno=errno.EINVAL)
+        buffer = size_or_buffer if not isinstance(size_or_buffer, int) else None
+        size = len(buffer) if buffer is not None else size_or_buffer
+        now = time.monotonic()
+        if self._audio_next is None:
+            self._audio_next = now
+        if self._audio_next > now:
+            wait = self._audio_next - now
+            if timeout and wait * 1000.0 > timeout:
+                time.sleep(timeout / 1000.0)
+                raise usb.core.USBTimeoutError("Operation timed out", errno=errno.ETIMEDOUT)
+            time.sleep(wait)
+            now = self._audio_next
+        sounding = now - self._last_midi < AUDIO_DECAY
+        packet = self._sine if sounding else self._silence
+        due = int((now - self._audio_next) / AUDIO_INTERVAL) + 1
+        count = max(1, min(due, size // len(packet)))
+        self._audio_next += count * AUDIO_INTERVAL
+        self.audio_packets += count
+        data = packet * count
+        if buffer is None:
+            return bytearray(data)
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class SimulatedBus:
+    """A set of SimulatedSCD70s the bridge finds instead of the USB bus.
+
+    install() points bridge_core.device_backend at it, so find_device(),
+    find_devices() and the device watcher see only connected simulated
+    units; unplug()/plug() on a unit then look like a real disconnect.
+    """
+
+    def __init__(self, count=1, **options):
+        self.devices = [SimulatedSCD70(port=i + 1, **options) for i in range(count)]
+
+    def find_all(self):
+        return [dev for dev in self.devices if dev.connected]
+
+    def install(self):
+        bridge_core.device_backend = self.find_all
+        return self
+
+    def uninstall(self):
+        if bridge_core.device_backend == self.find_all:
+            bridge_core.device_backend = None
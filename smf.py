@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+SC-D70 Bridge Standard MIDI File Player
+Streams .mid files from a memory map straight into the bridge pump
+"""
+
+import heapq
+import mmap
+import struct
+
+from midi_input import TimedInput
+
+BACKEND_FILE = "file"
+
+# Time between opening a file and its first event (ms)
+PREROLL_MS = 100.0
+DEFAULT_TEMPO = 500000        # microseconds per quarter note (120 BPM)
+
+META = 0xFF
+META_TEMPO = 0x51
+META_END_OF_TRACK = 0x2F
+_KIND_MESSAGE, _KIND_TEMPO = 0, 1
+
+# All Sound Off and All Notes Off on every channel, for stopping mid-song
+ALL_NOTES_OFF = bytes(b for channel in range(16)
+                      for b in (0xB0 | channel, 120, 0, 0xB0 | channel, 123, 0))
+
+_HEADER = struct.Struct(">4sIHHH")
+_CHUNK = struct.Struct(">4sI")
+
+
+class MidiFile:
+    """A Standard MIDI File (format 0 or 1) parsed lazily from a memory map.
+
+    Opening only reads the header and the track chunk offsets. `events()`
+    runs one generator per track over the mapped bytes (delta times,
+    running status, SysEx and meta events) and merges them with a heap,
+    so only one pending event per track is ever held in Python. Tempo
+    changes are applied as they come, giving each message its time in ms.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        try:
+            self.data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"{path}: empty file")
+        data = self.data
+        if len(data) < _HEADER.size:
+            self.close()
+            raise ValueError(f"{path}: not a Standard MIDI File")
+        chunk, length, self.format, count, division = _HEADER.unpack_from(data, 0)
+        if chunk != b"MThd":
+            self.close()
+            raise ValueError(f"{path}: not a Standard MIDI File")
+        if division & 0x8000:
+            # SMPTE: frames per second (negative) and ticks per frame
+            fps = 256 - (division >> 8)
+            self.ms_per_tick = 1000.0 / (fps * (division & 0xFF))
+            self.division = None
+        else:
+            self.division = division
+            self.ms_per_tick = DEFAULT_TEMPO / 1000.0 / division
+        self.tracks = []          # (start, end) of each MTrk's data
+        pos = 8 + length
+        while pos + _CHUNK.size <= len(data):
+            chunk, length = _CHUNK.unpack_from(data, pos)
+            pos += _CHUNK.size
+            if chunk == b"MTrk":
+                self.tracks.append((pos, min(pos + length, len(data))))
+            pos += length
+
+    def _track(self, index):
+        """Yield (tick, track, seq, kind, payload) for one track"""
+        data = self.data
+        pos, end = self.tracks[index]
+        tick = 0
+        running = 0
+        seq = 0
+        try:
+            while pos < end:
+                b = data[pos]
+                pos += 1
+                delta = b & 0x7F
+                while b & 0x80:
+                    b = data[pos]
+                    pos += 1
+                    delta = delta << 7 | b & 0x7F
+                tick += delta
+                status = data[pos]
+                if status & 0x80:
+                    pos += 1
+                elif running:
+                    status = running
+                else:
+                    return            # data byte without a status: corrupt track
+                seq += 1
+                if status < 0xF0:
+                    running = status
+                    n = 2 if 0xC0 <= status < 0xE0 else 3
+                    yield tick, index, seq, _KIND_MESSAGE, bytes((status,)) + data[pos:pos + n - 1]
+                    pos += n - 1
+                    continue
+                running = 0
+                if status == META:
+                    kind = data[pos]
+                    pos += 1
+                b = data[pos]
+                pos += 1
+                length = b & 0x7F
+                while b & 0x80:
+                    b = data[pos]
+                    pos += 1
+                    length = length << 7 | b & 0x7F
+                payload = data[pos:pos + length]
+                pos += length
+                if status == META:
+                    if kind == META_TEMPO and length == 3:
+                        yield tick, index, seq, _KIND_TEMPO, int.from_bytes(payload, "big")
+                    elif kind == META_END_OF_TRACK:
+                        return
+                elif status == 0xF0:
+                    yield tick, index, seq, _KIND_MESSAGE, b"\xF0" + payload
+                elif status == 0xF7:
+                    # Escape: raw bytes (SysEx continuation, real-time, ...)
+                    yield tick, index, seq, _KIND_MESSAGE, payload
+        except IndexError:
+            return                    # truncated track
+
+    def events(self):
+        """Yield (ms, message bytes) for every track, merged in time order"""
+        ms_per_tick = self.ms_per_tick
+        last_tick = 0
+        ms = 0.0
+        merged = heapq.merge(*(self._track(i) for i in range(len(self.tracks))))
+        for tick, _track, _seq, kind, payload in merged:
+            if tick != last_tick:
+                ms += (tick - last_tick) * ms_per_tick
+                last_tick = tick
+            if kind == _KIND_MESSAGE:
+                yield ms, payload
+            elif self.division:
+                ms_per_tick = payload / 1000.0 / self.division
+
+    def close(self):
+        self.data.close()
+        self._file.close()
+
+
+class SmfInput(TimedInput):
+    """Plays a MidiFile through the bridge pump like a live input, each
+    event released on time (see TimedInput)"""
+
+    backend = BACKEND_FILE
+
+    def __init__(self, path, preroll=PREROLL_MS):
+        self.path = path
+        self.smf = MidiFile(path)
+        super().__init__(self.smf.events(), preroll)
+
+    def close(self):
+        super().close()
+        self.smf.close()
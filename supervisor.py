@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+SC-D70 Bridge Supervisor
+Recovers from USB stalls and disconnects and restores the sound state afterwards
+"""
+
+import errno
+import threading
+import time
+
+import usb.core
+import usb.util
+
+from bridge_core import (
+    ENDPOINT_MIDI_OUT, PacketRing, UsbMidiEncoder,
+    configure_device, find_device, pump_midi, stream_sysex,
+)
+from device_state import DeviceState
+from usb_async import open_ring
+
+# Reconnect attempts back off from BACKOFF_START to BACKOFF_MAX seconds
+BACKOFF_START = 0.05
+BACKOFF_MAX = 2.0
+
+
+class _OfflineRing(PacketRing):
+    """Ring used while the SC-D70 is gone: tracks state changes, drops the rest"""
+
+    def __init__(self, tracker):
+        super().__init__(slots=1)
+        self.tracker = tracker
+        self.lost = 0
+
+    def flush(self, dev=None, timeout=None):
+        count = len(self)
+        if count:
+            self.tracker.observe(self._buf, self._start, self._pos)
+            self.lost += count
+        self.advance()
+        return 0
+
+
+class BridgeSupervisor:
+    """Runs the bridge pump and keeps it running through USB faults.
+
+    Timeouts are ignored (the packets are counted as lost), an endpoint
+    stall is cleared in place, and anything else (disconnect, I/O error)
+    closes the device and re-opens it with exponential backoff. While the
+    SC-D70 is away input keeps being drained, so state changes are still
+    recorded and stale notes are not played late; SysEx still waiting in
+    the ring's BulkLane is dropped and counted as lost. Once it is back (or
+    another SC-D70 takes its place) the DeviceState mirror resends what was
+    set since the last reset, without resetting the unit. Each fault
+    and recovery is logged, and passed as (kind, message) to `on_status`
+    if set: "timeout", "stall", "offline", "error" or "recovered".
+    """
+
+    def __init__(self, dev, ring, midi_in, encoder, find=find_device, log=print):
+        self.dev = dev
+        self.ring = ring
+        self.midi_in = midi_in
+        self.encoder = encoder
+        self.find = find
+        self.log = log
+        self.state = DeviceState()
+        ring.tracker = self.state
+        self.running = True
+        self.disconnected = False
+        self.pending_device = None
+        self.lost = 0
+        self.stalls = 0
+        self.timeouts = 0
+        self.recoveries = 0
+        self.on_status = None
+        self._wake = threading.Event()
+
+    def pump(self):
+        """Forward pending input; returns packets written"""
+        if self.disconnected:
+            self.reopen("SC-D70 disconnected")
+        try:
+            return pump_midi(self.midi_in, self.ring, self.dev, self.encoder)
+        except usb.core.USBTimeoutError:
+            self.timeouts += 1
+            self.status("timeout", "USB Write Error: timeout")
+        except usb.core.USBError as e:
+            if e.errno == errno.EPIPE:
+                self.clear_stall()
+            else:
+                self.reopen(f"USB Write Error: {e}")
+        return 0
+
+    def clear_stall(self):
+        self.stalls += 1
+        try:
+            self.dev.clear_halt(ENDPOINT_MIDI_OUT)
+            self.status("stall", "USB endpoint stall cleared")
+        except usb.core.USBError as e:
+            self.reopen(f"USB Clear Halt Error: {e}")
+
+    def status(self, kind, message):
+        """Log a fault or recovery and pass it to on_status"""
+        self.log(message)
+        if self.on_status is not None:
+            self.on_status(kind, message)
+
+    def device_left(self):
+        """Hotplug notification: recover on the next pump"""
+        self.disconnected = True
+
+    def device_arrived(self, dev):
+        """Hotplug notification: hand `dev` to a waiting reopen()"""
+        self.pending_device = dev
+        self._wake.set()
+
+    def _close(self):
+        ring, self.ring = self.ring, None
+        try:
+            ring.close()
+        except Exception:
+            pass
+        self.lost += ring.dropped
+        try:
+            usb.util.dispose_resources(self.dev)
+        except Exception:
+            pass
+
+    def reopen(self, reason):
+        """Re-open the SC-D70 with backoff, then replay its state"""
+        self.status("offline", f"{reason}; recovering")
+        metrics = self.ring.metrics
+        journal = self.ring.journal
+        batcher = self.ring.batcher
+        bulk = self.ring.bulk
+        self._close()
+        if bulk is not None:
+            self.lost += bulk.reset()
+        self.disconnected = False
+        self.encoder.reset()
+        offline = _OfflineRing(self.state)
+        started = time.monotonic()
+        delay = BACKOFF_START
+        attempts = 0
+        while self.running:
+            pump_midi(self.midi_in, offline, None, self.encoder)
+            dev = self.pending_device or self.find()
+            self.pending_device = None
+            if dev is not None:
+                attempts += 1
+                try:
+                    configure_device(dev)
+                    ring = open_ring(dev)
+                    break
+                except Exception as e:
+                    self.status("error", f"SC-D70 reopen failed: {e}")
+                    try:
+                        usb.util.dispose_resources(dev)
+                    except Exception:
+                        pass
+            self._wake.wait(delay)
+            self._wake.clear()
+            delay = min(delay * 2, BACKOFF_MAX)
+        else:
+            return False
+        self.dev = dev
+        self.ring = ring
+        ring.metrics = metrics
+        ring.journal = journal
+        ring.batcher = batcher
+        ring.bulk = bulk
+        self.encoder.reset()
+        try:
+            restored = self.restore()
+        except usb.core.USBError as e:
+            self.status("error", f"State restore failed: {e}")
+            restored = 0
+        ring.tracker = self.state
+        self.lost += offline.lost
+        self.recoveries += 1
+        self.status("recovered", f"SC-D70 recovered in {time.monotonic() - started:.2f}s "
+                 f"({attempts} attempts): restored state in {restored} packets, "
+                 f"{offline.lost} packets lost while offline, {self.lost} lost in total")
+        return True
+
+    def restore(self):
+        """Bring the SC-D70 to the mirrored state; returns packets sent.
+
+        No GS Reset is sent first: a unit that was power-cycled is already
+        at the reset state, and one that kept its state only needs the
+        settings it missed, which are among those restore() yields.
+        """
+        encoder = UsbMidiEncoder(drop_realtime=False)
+        return stream_sysex(self.ring, self.dev, self.state.restore(), encoder)
+
+    def stop(self):
+        self.running = False
+        self._wake.set()
+
+    def close(self):
+        if self.ring is not None:
+            self.ring.close()
+            self.lost += self.ring.dropped
+            self.ring = None
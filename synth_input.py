@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+SC-D70 Bridge Synthetic MIDI Input
+Generated or recorded MIDI traffic at a controlled rate, for stress and soak tests
+"""
+
+import itertools
+
+from capture import JournalReader
+from midi_input import TimedInput
+
+BACKEND_SYNTH = "synth"
+
+# Default rate in MIDI bytes per second: a saturated 31250 baud DIN cable
+SYNTH_RATE = 3125
+# Full-speed bulk carries ~1.2 MB/s of USB-MIDI packets, 3 MIDI bytes per 4
+USB_CEILING = 900000
+# Size of each message of the "sysex" pattern
+SYSEX_FLOOD_SIZE = 65536
+# Non-commercial manufacturer ID: the SC-D70 (and the state mirror) ignore it
+SYSEX_ID = 0x7D
+CC_SWEEP = (1, 7, 10, 11, 74)     # modulation, volume, pan, expression, cutoff
+# Timing clocks per note round in the "clock" pattern
+CLOCKS_PER_ROUND = 6
+
+
+def note_storm():
+    """Note on on all 16 channels, then their note offs, across 4 octaves"""
+    for step in itertools.count():
+        note = 36 + step % 48
+        for channel in range(16):
+            yield bytes((0x90 | channel, note, 100))
+        for channel in range(16):
+            yield bytes((0x80 | channel, note, 0))
+
+
+def cc_sweep():
+    """Every controller of CC_SWEEP going 0-127-0 on all 16 channels"""
+    for step in itertools.count():
+        value = step % 254
+        value = value if value < 128 else 253 - value
+        for channel in range(16):
+            for controller in CC_SWEEP:
+                yield bytes((0xB0 | channel, controller, value))
+
+
+def sysex_flood(size=SYSEX_FLOOD_SIZE):
+    """Back-to-back SysEx messages of `size` bytes"""
+    message = bytes((0xF0, SYSEX_ID)) + bytes(i & 0x7F for i in range(size - 3)) + b"\xF7"
+    while True:
+        yield message
+
+
+def clock_notes():
+    """Note storm with timing clocks (0xF8) between the notes"""
+    notes = note_storm()
+    while True:
+        for _ in range(CLOCKS_PER_ROUND):
+            yield b"\xF8"
+            for _ in range(32 // CLOCKS_PER_ROUND):
+                yield next(notes)
+
+
+def mixed():
+    """Notes, controllers, clocks and a short GS SysEx, interleaved"""
+    gs_reverb = bytes((0xF0, 0x41, 0x10, 0x42, 0x12, 0x40, 0x01, 0x33, 0x40, 0x0C, 0xF7))
+    sources = (note_storm(), cc_sweep(), clock_notes())
+    for step in itertools.count():
+        if step % 256 == 255:
+            yield gs_reverb
+        else:
+            yield next(sources[step % 3])
+
+
+PATTERNS = {
+    "notes": note_storm,
+    "cc": cc_sweep,
+    "sysex": sysex_flood,
+    "clock": clock_notes,
+    "mixed": mixed,
+}
+
+
+def paced(messages, rate):
+    """(ms, message) for each message, `rate` MIDI bytes per second apart
+    (all at once with no rate)"""
+    sent = 0
+    for message in messages:
+        yield (sent * 1000.0 / rate if rate else 0.0), message
+        sent += len(message)
+
+
+class SyntheticInput(TimedInput):
+    """Stands in for pygame.midi.Input with generated or recorded traffic.
+
+    Plays `timed` (ms, message) pairs (see generate_input and replay_input).
+    Event timestamps are the times the traffic was due, so queueing
+    anywhere in the bridge shows up as latency. `count` and `bytes` are
+    the messages and MIDI bytes produced so far, for comparison with what
+    reached the device, and `max_gap` the longest wait between two
+    messages' due times (ms).
+    """
+
+    backend = BACKEND_SYNTH
+
+    def __init__(self, name, timed):
+        self.name = name
+        self.bytes = 0
+        self.max_gap = 0.0
+        super().__init__(self._counted(timed))
+
+    def _counted(self, timed):
+        last = None
+        for ms, message in timed:
+            self.bytes += len(message)
+            if last is not None and ms - last > self.max_gap:
+                self.max_gap = ms - last
+            last = ms
+            yield ms, message
+
+
+def generate_input(pattern="notes", rate=SYNTH_RATE, limit=None):
+    """`pattern` (see PATTERNS) at `rate` MIDI bytes per second, capped at
+    USB_CEILING (0: as fast as the bridge takes it), for `limit` messages
+    or forever"""
+    rate = min(rate, USB_CEILING) if rate else 0
+    messages = PATTERNS[pattern]()
+    if limit is not None:
+        messages = itertools.islice(messages, limit)
+    return SyntheticInput(pattern, paced(messages, rate))
+
+
+def replay_input(path, speed=1.0):
+    """The messages of capture journal `path` with their recorded timing,
+    scaled by 1 / `speed`"""
+    journal = JournalReader(path)
+
+    def timed():
+        try:
+            for seconds, message in journal.messages():
+                yield seconds * 1000.0 / speed, message
+        finally:
+            journal.close()
+    return SyntheticInput(path, timed())
+
+
+def open_synth(source, rate=SYNTH_RATE):
+    """generate_input for a pattern name, replay_input for a journal path"""
+    if source in PATTERNS:
+        return generate_input(source, rate)
+    return replay_input(source)
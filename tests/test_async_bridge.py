@@ -0,0 +1,115 @@
+"""AsyncBridge drain(), close() and status(), merged inputs or not"""
+
+import asyncio
+
+import pytest
+
+from async_bridge import AsyncBridge
+from midi_input import EventInput
+from sim_device import SimulatedBus
+
+
+@pytest.mark.parametrize("inputs", [None, {"keys": EventInput()}])
+def test_drain_and_close(inputs):
+    bus = SimulatedBus().install()
+
+    async def run():
+        async with AsyncBridge(inputs=inputs, deadline=0) as bridge:
+            for note in range(100):
+                await bridge.send(bytes((0x90, note, 100)))
+            await asyncio.wait_for(bridge.drain(), 2.0)
+            assert bus.devices[0].packets >= 100
+            # Nothing left to send: drain() still returns
+            await asyncio.wait_for(bridge.drain(), 2.0)
+        return bridge
+
+    try:
+        bridge = asyncio.run(asyncio.wait_for(run(), 10.0))
+    finally:
+        bus.uninstall()
+    assert bridge.last_status[0] == "stopped"
+
+
+@pytest.mark.parametrize("inputs", [None, {"keys": EventInput()}])
+def test_drain_while_sending_continues(inputs):
+    # drain() waits for what was sent before it, not for the input to go quiet
+    bus = SimulatedBus(latency=0.002, record=True).install()
+
+    async def run():
+        async with AsyncBridge(inputs=inputs, deadline=0) as bridge:
+            async def flood():
+                while True:
+                    for note in range(50):
+                        await bridge.send(bytes((0x90, note, 100)))
+                    await asyncio.sleep(0.001)
+
+            sender = asyncio.create_task(flood())
+            await asyncio.sleep(0.05)
+            for note in range(100):
+                await bridge.send(bytes((0x91, note, 100)))
+            await asyncio.wait_for(bridge.drain(), 2.0)
+            received = bytes(bus.devices[0].received)
+            sender.cancel()
+        return received
+
+    try:
+        received = asyncio.run(asyncio.wait_for(run(), 10.0))
+    finally:
+        bus.uninstall()
+    for note in range(100):
+        assert bytes((0x09, 0x91, note, 100)) in received
+
+
+def test_cancel_pending_drain():
+    # 4000 notes take 16 transfers of 9 ms or more
+    bus = SimulatedBus(latency=0.009).install()
+
+    async def run():
+        async with AsyncBridge(deadline=0) as bridge:
+            for i in range(4000):
+                await bridge.send(bytes((0x90, i & 0x7F, 100)))
+            drain = asyncio.create_task(bridge.drain())
+            await asyncio.sleep(0.02)
+            assert not drain.done()
+            drain.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await drain
+            # A later drain() is not held up by the cancelled one
+            await bridge.send(bytes((0x80, 60, 0)))
+            await asyncio.wait_for(bridge.drain(), 2.0)
+            assert bus.devices[0].packets == 4001
+        return bridge
+
+    try:
+        bridge = asyncio.run(asyncio.wait_for(run(), 10.0))
+    finally:
+        bus.uninstall()
+    assert not bridge._drains
+
+
+def test_status_events():
+    bus = SimulatedBus().install()
+
+    async def run():
+        bridge = AsyncBridge(deadline=0)
+        await bridge.start()
+        events = []
+
+        async def watch():
+            async for event in bridge.status():
+                events.append(event)
+
+        watcher = asyncio.create_task(watch())
+        await asyncio.sleep(0.01)
+        await bridge.close()
+        await asyncio.wait_for(watcher, 2.0)
+        # A watcher that starts after close gets the last event and stops
+        late = [event async for event in bridge.status()]
+        return events, late
+
+    try:
+        events, late = asyncio.run(asyncio.wait_for(run(), 10.0))
+    finally:
+        bus.uninstall()
+    assert [kind for kind, message in events] == ["connected", "stopped"]
+    assert late == events[-1:]
@@ -0,0 +1,124 @@
+"""BridgeLog: batched writes, repeat collapsing, rotation, and counts from many threads"""
+
+import re
+import sys
+import threading
+
+from bridge_log import BridgeLog
+
+# Long enough that nothing is written before close() unless a test waits
+NEVER = 60.0
+
+
+def lines(path):
+    with open(path) as f:
+        return [re.sub(r"^\[[^]]*\] ", "", line.rstrip("\n")) for line in f]
+
+
+def test_batch_written_in_order_on_close(tmp_path):
+    path = tmp_path / "logs" / "bridge.log"
+    log = BridgeLog(str(path), interval=NEVER)
+    for i in range(100):
+        log.log(f"message {i}")
+    assert not path.exists()
+    log.close()
+    assert lines(path) == [f"message {i}" for i in range(100)]
+    # close() is idempotent
+    log.close()
+
+
+def test_repeats_collapse_into_one_line(tmp_path):
+    path = tmp_path / "bridge.log"
+    log = BridgeLog(str(path), interval=NEVER, window=NEVER)
+    log.log("USB Write Error: timeout")
+    for _ in range(4311):
+        log.log("USB Write Error: timeout")
+    log.log("SC-D70 recovered")
+    log.log("SC-D70 recovered")
+    log.close()
+    assert lines(path) == [
+        "USB Write Error: timeout",
+        f"USB Write Error: timeout ×4311 in last {NEVER:.0f}s",
+        "SC-D70 recovered",
+        f"SC-D70 recovered ×1 in last {NEVER:.0f}s",
+    ]
+
+
+def test_interleaved_repeats_are_not_collapsed_across_messages(tmp_path):
+    path = tmp_path / "bridge.log"
+    log = BridgeLog(str(path), interval=NEVER, window=NEVER)
+    for _ in range(3):
+        log.log("a")
+        log.log("b")
+    log.close()
+    assert lines(path) == ["a", "b", "a", "b", "a", "b"]
+
+
+def test_full_queue_counts_dropped_records(tmp_path):
+    path = tmp_path / "bridge.log"
+    log = BridgeLog(str(path), capacity=10, interval=NEVER)
+    for i in range(25):
+        log.log(f"message {i}")
+    assert log.dropped == 15
+    log.close()
+    assert lines(path) == [f"message {i}" for i in range(10)] + \
+        ["Log queue full: 15 records dropped"]
+
+
+def test_rotation_keeps_backups(tmp_path):
+    path = tmp_path / "bridge.log"
+    log = BridgeLog(str(path), max_bytes=200, backups=2, interval=NEVER)
+    for i in range(40):
+        log.log(f"message {i:02}")
+        # One batch per message, so every write can rotate
+        log._write_pending()
+    log.close()
+    assert not (tmp_path / "bridge.log.3").exists()
+    kept = lines(f"{path}.2") + lines(f"{path}.1") + lines(path)
+    # The newest messages survive, in order, across the files
+    assert kept == [f"message {i:02}" for i in range(40 - len(kept), 40)]
+    for name in ("bridge.log.1", "bridge.log.2"):
+        assert (tmp_path / name).stat().st_size >= 200
+
+
+def test_no_backups_truncates(tmp_path):
+    path = tmp_path / "bridge.log"
+    log = BridgeLog(str(path), max_bytes=100, backups=0, interval=NEVER)
+    for i in range(20):
+        log.log(f"message {i:02}")
+        log._write_pending()
+    log.close()
+    # The full file is removed; only what came after it is left
+    assert [p.name for p in tmp_path.iterdir()] in ([], ["bridge.log"])
+    assert not path.exists() or path.stat().st_size < 100
+
+
+def test_counts_from_many_threads_while_writing(tmp_path):
+    path = tmp_path / "bridge.log"
+    log = BridgeLog(str(path), interval=0.001, window=NEVER)
+    threads = 8
+    repeats = 20000
+
+    def storm():
+        for _ in range(repeats):
+            log.log("USB Write Error: timeout")
+
+    # Switch threads as often as possible, to make a lost update likelier
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        workers = [threading.Thread(target=storm) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    finally:
+        sys.setswitchinterval(interval)
+    log.close()
+    total = 0
+    for line in lines(path):
+        match = re.fullmatch(r"USB Write Error: timeout(?: ×(\d+) in last \d+s)?", line)
+        assert match
+        total += int(match.group(1) or 1)
+    # Every call is counted exactly once
+    assert total == threads * repeats
@@ -0,0 +1,79 @@
+"""Capture journals with notes sent between SysEx packets export to .mid"""
+
+import threading
+import time
+
+import pytest
+
+from bridge_core import PacketRing
+from capture import CaptureJournal, JournalReader, _vlq, export_midi
+from smf import MidiFile
+
+SYSEX = bytes((0xF0, 0x41, 0x10, 0x42, 0x12, 0x40, 0x00, 0x7F, 0x00, 0x41, 0xF7))
+
+
+class NullDevice:
+    def write(self, endpoint, data, timeout=None):
+        return len(data)
+
+
+def interleaved_journal(path):
+    """SysEx packets flushed one at a time with a note between each pair,
+    as the bulk lane and the interleaved merge send them"""
+    ring = PacketRing()
+    ring.journal = CaptureJournal(str(path))
+    dev = NullDevice()
+    packets = [(0x4, *SYSEX[i:i + 3]) for i in range(0, 9, 3)] + [(0x6, 0x41, 0xF7, 0)]
+    for i, packet in enumerate(packets):
+        ring.append(*packet)
+        ring.flush(dev)
+        time.sleep(0.002)
+        ring.append(0x9, 0x90, 60 + i, 100)
+        ring.flush(dev)
+        time.sleep(0.002)
+    ring.journal.close()
+    return [bytes((0x90, 60 + i, 100)) for i in range(len(packets))]
+
+
+def test_sysex_stamped_at_its_end(tmp_path):
+    path = tmp_path / "capture.scj"
+    notes = interleaved_journal(path)
+    journal = JournalReader(str(path))
+    messages = list(journal.messages())
+    journal.close()
+    assert [message for _, message in messages] == notes[:3] + [SYSEX] + notes[3:]
+    times = [stamp for stamp, _ in messages]
+    assert times == sorted(times)
+
+
+def test_export_interleaved_journal(tmp_path):
+    path = tmp_path / "capture.scj"
+    notes = interleaved_journal(path)
+    out = tmp_path / "capture.mid"
+    result = []
+
+    # A hang fails the test instead of blocking the suite
+    thread = threading.Thread(target=lambda: result.append(export_midi(str(path), str(out))),
+                              daemon=True)
+    thread.start()
+    thread.join(10.0)
+    assert result == [len(notes) + 1]
+
+    smf = MidiFile(str(out))
+    events = list(smf.events())
+    smf.close()
+    assert [message for _, message in events] == notes[:3] + [SYSEX] + notes[3:]
+    times = [ms for ms, _ in events]
+    assert times == sorted(times)
+    # Notes at least 4 ms apart stay apart (0.1 ms ticks)
+    notes_ms = [ms for ms, message in events if message[0] == 0x90]
+    assert all(b - a >= 4.0 for a, b in zip(notes_ms, notes_ms[1:]))
+
+
+def test_vlq():
+    assert _vlq(0) == b"\x00"
+    assert _vlq(0x7F) == b"\x7F"
+    assert _vlq(0x80) == b"\x81\x00"
+    assert _vlq(0x0FFFFFFF) == b"\xFF\xFF\xFF\x7F"
+    with pytest.raises(ValueError):
+        _vlq(-1)
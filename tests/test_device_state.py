@@ -0,0 +1,137 @@
+"""DeviceState: what it mirrors from the packet stream and what restore() sends back"""
+
+from bridge_core import GS_RESET, PacketRing, UsbMidiEncoder
+from device_state import (
+    BEND_CENTER, CC_DEFAULTS, GS_BASE, RPN_DEFAULTS, RPN_NULL, DeviceState, roland_dt1,
+)
+from midi_input import EventInput
+from sim_device import SimulatedSCD70
+from supervisor import BridgeSupervisor
+
+GM_SYSTEM_ON = bytes((0xF0, 0x7E, 0x7F, 0x09, 0x01, 0xF7))
+
+
+def observe(state, *messages):
+    """Feed raw MIDI messages to `state` the way a ring flush does"""
+    ring = PacketRing(slots=1, slot_packets=1 << 16)
+    encoder = UsbMidiEncoder(drop_realtime=False)
+    for message in messages:
+        encoder.encode_bytes(ring, message)
+    state.observe(ring._buf, ring._start, ring._pos)
+    return state
+
+
+def restored(state):
+    """A fresh DeviceState after it was sent `state`'s restore()"""
+    return observe(DeviceState(), *state.restore())
+
+
+def same(a, b):
+    return (a.cc == b.cc and a.program == b.program and a.bend == b.bend and
+            a.rpn == b.rpn and a.nrpn == b.nrpn and a.gs_written == b.gs_written and
+            a.gs == b.gs and a.master_volume == b.master_volume and
+            dict(a.other) == dict(b.other) and a.select == b.select and
+            a.nrpn_selected == b.nrpn_selected)
+
+
+def gs_index(address):
+    return (address[0] - GS_BASE) << 14 | address[1] << 7 | address[2]
+
+
+def test_dt1_address_decoding():
+    state = observe(DeviceState(), roland_dt1((0x41, 0x02, 0x10), [0x55, 0x56]),
+                    roland_dt1((0x40, 0x01, 0x30), [0x04]))
+    index = gs_index((0x41, 0x02, 0x10))
+    assert index == (1 << 14) | (2 << 7) | 0x10
+    assert state.gs[index:index + 2] == b"\x55\x56"
+    assert state.gs_written[index:index + 2] == b"\x01\x01"
+    assert state.gs[gs_index((0x40, 0x01, 0x30))] == 0x04
+    assert sum(state.gs_written) == 3
+
+
+def test_dt1_bad_checksum_and_other_models():
+    bad = bytearray(roland_dt1((0x40, 0x01, 0x30), [0x04]))
+    bad[-2] ^= 1
+    sc55_display = roland_dt1((0x10, 0x00, 0x00), b"HELLO", model=0x45)
+    state = observe(DeviceState(), bytes(bad), sc55_display)
+    assert not any(state.gs_written)
+    assert list(state.other.values()) == [sc55_display]
+
+
+def test_rpn_tracking():
+    # Pitch bend sensitivity 12 semitones and coarse tune -2 on part 3
+    state = observe(DeviceState(), bytes((0xB3, 101, 0, 0xB3, 100, 0, 0xB3, 6, 12, 0xB3, 38, 0)),
+                    bytes((0xB3, 100, 2, 0xB3, 6, 0x3E)))
+    assert state.rpn[3 * 3:3 * 3 + 3].tolist() == [12 << 7, 0x40 << 7, 0x3E << 7]
+    assert state.select[3] == 2 and not state.nrpn_selected[3]
+    # Data entry after RPN NULL goes nowhere
+    observe(state, bytes((0xB3, 101, 0x7F, 0xB3, 100, 0x7F, 0xB3, 6, 0)))
+    assert state.rpn[3 * 3] == 12 << 7
+    assert state.select[3] == RPN_NULL
+
+
+def test_nrpn_tracking():
+    # GS vibrato rate (NRPN 01 08) on part 0, drum pitch (NRPN 18 26) on part 9
+    state = observe(DeviceState(), bytes((0xB0, 99, 0x01, 0xB0, 98, 0x08, 0xB0, 6, 0x50)),
+                    bytes((0xB9, 99, 0x18, 0xB9, 98, 0x26, 0xB9, 6, 0x30)))
+    assert state.nrpn == {(0, 0x01 << 7 | 0x08): 0x50, (9, 0x18 << 7 | 0x26): 0x30}
+    assert state.nrpn_selected[0] and state.nrpn_selected[9]
+    assert state.rpn.tolist() == list(RPN_DEFAULTS) * 16
+
+
+def test_reset_all_controllers():
+    state = observe(DeviceState(), bytes((0xB2, 1, 90, 0xB2, 11, 40, 0xB2, 64, 127, 0xE2, 0, 0x50)),
+                    bytes((0xB2, 121, 0)))
+    assert state.cc[2 * 128 + 1] == 0 and state.cc[2 * 128 + 11] == 127
+    assert state.cc[2 * 128 + 64] == 0
+    assert state.bend[2] == BEND_CENTER
+
+
+def test_gs_and_gm_reset():
+    for reset in (bytes(GS_RESET), GM_SYSTEM_ON):
+        state = observe(DeviceState(), bytes((0xB0, 7, 20, 0xC0, 5, 0xE0, 0, 0x50)),
+                        roland_dt1((0x40, 0x01, 0x30), [0x04]),
+                        bytes((0xB0, 99, 0x01, 0xB0, 98, 0x08, 0xB0, 6, 0x50)))
+        observe(state, reset)
+        assert state.cc == CC_DEFAULTS * 16
+        assert not any(state.program) and not any(state.gs_written) and not state.nrpn
+        assert state.bend.tolist() == [BEND_CENTER] * 16
+        assert list(state.restore()) == []
+
+
+def test_restore_round_trip():
+    state = observe(DeviceState(), bytes((0xF0, 0x7F, 0x7F, 0x04, 0x01, 0x00, 0x60, 0xF7)),
+                    roland_dt1((0x40, 0x01, 0x30), [0x04]),
+                    roland_dt1((0x40, 0x11, 0x02), [0x01, 0x02, 0x03]),
+                    bytes((0xB1, 0, 8, 0xB1, 32, 1, 0xC1, 25)),
+                    bytes((0xB1, 7, 90, 0xB1, 10, 30, 0xB1, 91, 100)),
+                    bytes((0xB1, 101, 0, 0xB1, 100, 0, 0xB1, 6, 7)),
+                    bytes((0xB9, 99, 0x18, 0xB9, 98, 0x26, 0xB9, 6, 0x30)),
+                    bytes((0xEF, 0x10, 0x30)))
+    assert same(restored(state), state)
+
+
+def test_restore_sends_only_what_was_set():
+    state = observe(DeviceState(), bytes((0xB4, 7, 90)))
+    assert list(state.restore()) == [bytes((0xB4, 7, 90))]
+
+
+def test_restore_includes_values_set_back_to_default():
+    # A unit that kept its state but missed the write must still get it
+    state = observe(DeviceState(), bytes((0xB4, 7, 100, 0xC4, 0, 0xE4, 0, 0x40)),
+                    bytes((0xB4, 101, 0, 0xB4, 100, 0, 0xB4, 6, 2, 0xB4, 38, 0)))
+    messages = list(state.restore())
+    assert bytes((0xB4, 7, 100)) in messages
+    assert bytes((0xC4, 0)) in messages
+    assert bytes((0xE4, 0, 0x40)) in messages
+    assert bytes((0xB4, 101, 0, 0xB4, 100, 0, 0xB4, 6, 2, 0xB4, 38, 0)) in messages
+    assert same(restored(state), state)
+
+
+def test_supervisor_restore_sends_no_reset():
+    dev = SimulatedSCD70(record=True)
+    supervisor = BridgeSupervisor(dev, PacketRing(), EventInput(), UsbMidiEncoder(),
+                                  find=lambda: None, log=lambda message: None)
+    observe(supervisor.state, bytes((0xB0, 7, 90)))
+    assert supervisor.restore() == 1
+    assert dev.received == bytes((0x0B, 0xB0, 7, 90))
@@ -0,0 +1,241 @@
+"""UsbMidiEncoder framing checked byte by byte against USB-MIDI 1.0 (Table 4-1)"""
+
+import pytest
+
+from bridge_core import MAX_EVENT_PACKETS, PacketRing, UsbMidiEncoder
+
+# What USB-MIDI 1.0 says each status byte becomes, written out independently
+# of the encoder's tables: (CIN, MIDI bytes in the packet)
+EXPECTED = {}
+for _status in range(0x80, 0xF0):
+    EXPECTED[_status] = (_status >> 4, 2 if 0xC0 <= _status < 0xE0 else 3)
+EXPECTED.update({
+    0xF1: (0x2, 2),     # MTC quarter frame
+    0xF2: (0x3, 3),     # Song Position Pointer
+    0xF3: (0x2, 2),     # Song Select
+    0xF4: (0xF, 1),     # undefined System Common
+    0xF5: (0xF, 1),
+    0xF6: (0x5, 1),     # Tune Request
+})
+for _status in range(0xF8, 0x100):
+    EXPECTED[_status] = (0xF, 1)
+SHORT_STATUSES = sorted(EXPECTED)
+REALTIME = range(0xF8, 0x100)
+
+
+def message(status):
+    """`status` with made-up data bytes, as many as it takes"""
+    return bytes((status, 0x12, 0x34)[:EXPECTED[status][1]])
+
+
+def encode(data, encoder=None):
+    """Packets for raw MIDI bytes, fed to `encoder` (a fresh one by default)"""
+    ring = PacketRing(slots=1, slot_packets=1024)
+    encoder = encoder or UsbMidiEncoder(drop_realtime=False)
+    assert encoder.encode_bytes(ring, data) == len(data)
+    return split(ring)
+
+
+def pack(events, encoder=None):
+    """Packets for pygame-style [[b0, b1, b2, b3], timestamp] events"""
+    ring = PacketRing(slots=1, slot_packets=1024)
+    encoder = encoder or UsbMidiEncoder(drop_realtime=False)
+    assert encoder.pack_events(ring, events) == len(events)
+    return split(ring)
+
+
+def split(ring):
+    data = bytes(ring.pending())
+    return [tuple(data[i:i + 4]) for i in range(0, len(data), 4)]
+
+
+def pygame_events(data):
+    """`data` as pygame.midi.Input.read() gives it: short messages one per
+    event, SysEx in 4-byte chunks with the last padded with zeros"""
+    events = []
+    i = 0
+    while i < len(data):
+        if data[i] == 0xF0:
+            end = data.index(0xF7, i) + 1
+            for j in range(i, end, 4):
+                chunk = data[j:min(j + 4, end)]
+                events.append([list(chunk) + [0] * (4 - len(chunk)), 0])
+            i = end
+        else:
+            length = EXPECTED[data[i]][1]
+            events.append([list(data[i:i + length]) + [0] * (4 - length), 0])
+            i += length
+    return events
+
+
+def sysex(length):
+    """Complete SysEx message of `length` bytes, F0 and F7 included"""
+    return bytes([0xF0] + [(0x10 + i) & 0x7F for i in range(length - 2)] + [0xF7])
+
+
+def expected_sysex(data):
+    """USB-MIDI packets for one complete SysEx message: 0x4 for every full
+    three bytes, then 0x5/0x6/0x7 for the one, two or three that end it"""
+    packets = []
+    for i in range(0, len(data), 3):
+        chunk = data[i:i + 3]
+        if i + 3 < len(data):
+            cin = 0x4
+        else:
+            cin = (0x5, 0x6, 0x7)[len(chunk) - 1]
+        packets.append((cin,) + tuple(chunk) + (0,) * (3 - len(chunk)))
+    return packets
+
+
+@pytest.mark.parametrize("status", SHORT_STATUSES)
+def test_status_byte_cin_and_length(status):
+    cin, length = EXPECTED[status]
+    packet = (cin,) + tuple(message(status)) + (0,) * (3 - length)
+    assert encode(message(status)) == [packet]
+    assert pack(pygame_events(message(status))) == [packet]
+
+
+@pytest.mark.parametrize("status", SHORT_STATUSES)
+def test_unused_bytes_are_zero(status):
+    # pygame leaves whatever it likes in the bytes a message does not use
+    cin, length = EXPECTED[status]
+    event = list(message(status)) + [0x55] * (4 - length)
+    assert pack([[event, 0]]) == [(cin,) + tuple(message(status)) + (0,) * (3 - length)]
+
+
+def test_realtime_dropped_by_default():
+    encoder = UsbMidiEncoder()
+    for status in REALTIME:
+        assert encode(bytes((status,)), encoder) == []
+        assert pack([[[status, 0, 0, 0], 0]], encoder) == []
+
+
+@pytest.mark.parametrize("length", range(2, 12))
+def test_sysex_end_cin_for_each_tail(length):
+    data = sysex(length)
+    assert expected_sysex(data)[-1][0] == (0x5, 0x6, 0x7)[(length - 1) % 3]
+    assert encode(data) == expected_sysex(data)
+    assert pack(pygame_events(data)) == expected_sysex(data)
+
+
+@pytest.mark.parametrize("length", range(2, 12))
+def test_sysex_split_across_calls(length):
+    data = sysex(length)
+    for cut in range(1, length):
+        encoder = UsbMidiEncoder(drop_realtime=False)
+        assert encode(data[:cut], encoder) + encode(data[cut:], encoder) == expected_sysex(data)
+
+
+@pytest.mark.parametrize("length", range(2, 40))
+def test_pygame_sysex_events(length):
+    data = sysex(length)
+    events = pygame_events(data)
+    assert pack(events) == expected_sysex(data)
+    # A note straight after the padded last chunk is not taken for SysEx
+    note = bytes((0x90, 60, 100))
+    assert pack(events + pygame_events(note)) == expected_sysex(data) + [(0x9, 0x90, 60, 100)]
+
+
+def test_pygame_sysex_one_event_at_a_time():
+    data = sysex(23)
+    encoder = UsbMidiEncoder(drop_realtime=False)
+    packets = []
+    for event in pygame_events(data):
+        packets += pack([event], encoder)
+    assert packets == expected_sysex(data)
+
+
+@pytest.mark.parametrize("status", [s for s in SHORT_STATUSES if s < 0xF0])
+def test_running_status(status):
+    cin, length = EXPECTED[status]
+    data = message(status)
+    packet = (cin,) + tuple(data) + (0,) * (3 - length)
+    assert encode(data + data[1:] + data[1:]) == [packet] * 3
+    # Running status carries over from the fast path to later raw bytes
+    encoder = UsbMidiEncoder(drop_realtime=False)
+    assert pack(pygame_events(data), encoder) == [packet]
+    assert encode(data[1:], encoder) == [packet]
+
+
+def test_running_status_across_calls():
+    encoder = UsbMidiEncoder(drop_realtime=False)
+    assert encode(b"\x90\x3C", encoder) == []
+    assert encode(b"\x40\x3E", encoder) == [(0x9, 0x90, 0x3C, 0x40)]
+    assert encode(b"\x41", encoder) == [(0x9, 0x90, 0x3E, 0x41)]
+
+
+@pytest.mark.parametrize("status", [0xF0, 0xF1, 0xF2, 0xF3, 0xF6])
+def test_system_messages_cancel_running_status(status):
+    data = message(status) if status != 0xF0 else sysex(5)
+    packets = encode(b"\x90\x3C\x40" + data + b"\x3E\x40")
+    # The data bytes after the system message are stray and dropped
+    assert packets[0] == (0x9, 0x90, 0x3C, 0x40)
+    assert (0x9, 0x90, 0x3E, 0x40) not in packets
+
+
+@pytest.mark.parametrize("realtime", REALTIME)
+def test_realtime_inside_short_message(realtime):
+    packets = encode(bytes((0x90, realtime, 0x3C, realtime, 0x40, 0x3E, realtime, 0x41)))
+    assert packets == [(0xF, realtime, 0, 0), (0xF, realtime, 0, 0),
+                       (0x9, 0x90, 0x3C, 0x40), (0xF, realtime, 0, 0),
+                       (0x9, 0x90, 0x3E, 0x41)]
+    # Dropped real-time leaves the message and its running status intact
+    assert encode(bytes((0x90, realtime, 0x3C, 0x40, realtime, 0x3E, 0x41)),
+                  UsbMidiEncoder()) == [(0x9, 0x90, 0x3C, 0x40), (0x9, 0x90, 0x3E, 0x41)]
+
+
+@pytest.mark.parametrize("length", range(2, 12))
+def test_realtime_inside_sysex(length):
+    data = sysex(length)
+    for at in range(1, length):
+        packets = encode(data[:at] + b"\xF8" + data[at:])
+        assert (0xF, 0xF8, 0, 0) in packets
+        packets.remove((0xF, 0xF8, 0, 0))
+        assert packets == expected_sysex(data)
+        assert encode(data[:at] + b"\xF8" + data[at:], UsbMidiEncoder()) == expected_sysex(data)
+
+
+def test_realtime_events_between_pygame_sysex_chunks():
+    data = sysex(30)
+    events = pygame_events(data)
+    mixed = []
+    for event in events:
+        mixed += [event, [[0xF8, 0, 0, 0], 0]]
+    packets = pack(mixed)
+    assert packets.count((0xF, 0xF8, 0, 0)) == len(events)
+    assert [p for p in packets if p[0] != 0xF] == expected_sysex(data)
+    assert pack(mixed, UsbMidiEncoder()) == expected_sysex(data)
+
+
+def test_status_byte_aborts_sysex():
+    # The unfinished SysEx's tail is dropped; the new message goes out whole
+    packets = encode(b"\xF0\x01\x02\x03\x04\x90\x3C\x40")
+    assert packets == [(0x4, 0xF0, 0x01, 0x02), (0x9, 0x90, 0x3C, 0x40)]
+
+
+def test_stray_data_and_sysex_end_are_dropped():
+    assert encode(b"\x3C\x40\xF7\x01") == []
+
+
+def test_running_status_skips_dropped_realtime():
+    # The dropped clock after the note does not end the note's running status
+    encoder = UsbMidiEncoder()
+    assert pack([[[0x90, 0x3C, 0x40, 0], 0], [[0xF8, 0, 0, 0], 0]], encoder) == \
+        [(0x9, 0x90, 0x3C, 0x40)]
+    assert encode(b"\x3E\x41", encoder) == [(0x9, 0x90, 0x3E, 0x41)]
+
+
+@pytest.mark.parametrize("slot_packets", range(MAX_EVENT_PACKETS, 8))
+def test_slot_fills_mid_read(slot_packets):
+    # Notes, clocks and SysEx chunks across slots of every small size
+    data = bytes((0x90, 0x3C, 0x40, 0xF8, 0x80, 0x3C, 0x00)) + sysex(10) + bytes((0xB0, 7, 100))
+    events = pygame_events(data)
+    encoder = UsbMidiEncoder(drop_realtime=False)
+    ring = PacketRing(slots=1, slot_packets=slot_packets)
+    packets = []
+    i = 0
+    while i < len(events):
+        i = encoder.pack_events(ring, events, i)
+        packets += split(ring)
+        ring.advance()
+    assert packets == encode(data)
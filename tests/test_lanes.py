@@ -0,0 +1,48 @@
+"""A reopen does not resume a half-sent SysEx from the BulkLane on the new device"""
+
+from bridge_core import UsbMidiEncoder
+from midi_input import EventInput
+from sim_device import SimulatedSCD70
+from supervisor import BridgeSupervisor
+from usb_async import open_ring
+
+
+def test_reopen_drops_half_sent_sysex():
+    dev = SimulatedSCD70()
+    replacement = SimulatedSCD70(record=True)
+    source = EventInput()
+    supervisor = BridgeSupervisor(dev, open_ring(dev, deadline=0), source, UsbMidiEncoder(),
+                                  find=lambda: replacement, log=lambda message: None)
+    bulk = supervisor.ring.bulk
+    write = dev.write
+
+    def unplug_after_first(endpoint, data, timeout=None):
+        # The SC-D70 goes away once the first transfer of the dump is out
+        size = write(endpoint, data, timeout)
+        dev.unplug()
+        return size
+
+    dev.write = unplug_after_first
+    # A dump whose end has not arrived yet, then a .syx file being streamed
+    source.push(bytes((0xF0, 0x41, 0x10, 0x42, 0x12)) + bytes(range(0x60)) * 40)
+    bulk.stream([bytes((0xF0, 0x7D)) + bytes(3000) + b"\xF7"])
+    supervisor.pump()
+
+    assert supervisor.recoveries == 1
+    assert supervisor.ring.bulk is bulk
+    assert not bulk.busy
+    assert not bulk.encoder.sysex
+    assert not bulk._stream_encoder.sysex
+    assert supervisor.lost >= 1
+    # Nothing was set before the dump, so the new unit gets no restore and
+    # no dump continuation
+    assert replacement.received == b""
+
+    # The rest of the old dump is dropped too; a new message goes through
+    sent = len(replacement.received)
+    source.push(bytes(range(0x60)) + b"\xF7")
+    source.push(bytes((0x90, 60, 100)))
+    supervisor.pump()
+    assert replacement.received[sent:] == bytes((0x09, 0x90, 60, 100))
+    supervisor.stop()
+    supervisor.close()
@@ -0,0 +1,37 @@
+"""Filter rules: system messages cannot be limited to channels; the README example works"""
+
+import json
+import os
+import re
+
+import pytest
+
+from bridge_core import PacketRing, UsbMidiEncoder
+from midi_filter import SYSTEM_MESSAGES, MidiFilter
+
+README = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "README.md")
+
+
+def encode(midi_filter, data):
+    ring = PacketRing(slots=1)
+    UsbMidiEncoder(midi_filter=midi_filter).encode_bytes(ring, data)
+    return bytes(ring.pending())
+
+
+@pytest.mark.parametrize("name", SYSTEM_MESSAGES)
+def test_system_messages_with_channels_rejected(name):
+    with pytest.raises(ValueError, match="no channel"):
+        MidiFilter([{"type": "drop", "messages": ["note_on", name], "channels": [10]}])
+    MidiFilter([{"type": "drop", "messages": [name]}])
+
+
+def test_readme_example():
+    with open(README) as f:
+        example = re.search(r'```json\n(\{\n  "filters".*?)```', f.read(), re.S).group(1)
+    midi_filter = MidiFilter(json.loads(example)["filters"])
+    assert not midi_filter.sysex
+    assert encode(midi_filter, b"\xF0\x41\x10\xF7") == b""
+    assert encode(midi_filter, b"\xFE") == b""
+    # Program change dropped on channel 10 only
+    assert encode(midi_filter, b"\xC9\x05") == b""
+    assert encode(midi_filter, b"\xC8\x05") == bytes((0x0C, 0xC8, 0x05, 0x00))
@@ -0,0 +1,56 @@
+"""The rtmidi event backend passes MIDI clock and MTC and filters active sensing"""
+
+import midi_input
+from bridge_core import PacketRing, UsbMidiEncoder
+
+
+class FakeMidiIn:
+    """Just enough of rtmidi.MidiIn: one port, and the ignore_types() call"""
+
+    def __init__(self):
+        self.ignored = None
+        self.callback = None
+
+    def get_ports(self):
+        return ["SC-D70 Keys"]
+
+    def ignore_types(self, sysex=True, timing=True, active_sense=True):
+        self.ignored = {"sysex": sysex, "timing": timing, "active_sense": active_sense}
+
+    def open_port(self, index):
+        pass
+
+    def set_callback(self, callback):
+        self.callback = callback
+
+    def send(self, message):
+        """Deliver `message` unless rtmidi would ignore it"""
+        status = message[0]
+        if (status == 0xFE and self.ignored["active_sense"] or
+                status in (0xF1, 0xF8) and self.ignored["timing"] or
+                status == 0xF0 and self.ignored["sysex"]):
+            return
+        self.callback((list(message), 0.0))
+
+
+class FakeRtmidi:
+    def __init__(self):
+        self.port = FakeMidiIn()
+
+    def MidiIn(self):
+        return self.port
+
+
+def test_rtmidi_passes_mtc_and_clock(monkeypatch):
+    fake = FakeRtmidi()
+    monkeypatch.setattr(midi_input, "rtmidi", fake)
+    midi_in = midi_input.open_rtmidi_input("SC-D70 Keys")
+    assert fake.port.ignored == {"sysex": False, "timing": False, "active_sense": True}
+    for message in ((0xF1, 0x23), (0xF8,), (0xFE,), (0x90, 60, 100)):
+        fake.port.send(message)
+    events = midi_in.read(10)
+    assert [event[0][0] for event in events] == [0xF1, 0xF8, 0x90]
+    # As on the polling path, the encoder keeps MTC and drops the clock
+    ring = PacketRing(slots=1)
+    UsbMidiEncoder().pack_events(ring, events)
+    assert bytes(ring.pending()) == bytes((0x02, 0xF1, 0x23, 0, 0x09, 0x90, 60, 100))
@@ -0,0 +1,40 @@
+"""Inputs merged or routed share one wake event through EventInput.attach"""
+
+import threading
+import time
+
+from midi_input import EventInput
+from midi_merge import MergedInput
+from multi_device import InputRouter
+
+
+def push_later(midi_in, delay=0.05):
+    threading.Timer(delay, midi_in.push, ((0x90, 60, 100),)).start()
+
+
+def test_merged_input_wakes_on_push():
+    merged = MergedInput()
+    keys, pads = EventInput(), EventInput()
+    merged.add("keys", keys)
+    merged.add("pads", pads)
+    for midi_in in (keys, pads):
+        push_later(midi_in)
+        start = time.monotonic()
+        assert merged.wait(5.0)
+        assert time.monotonic() - start < 1.0
+        assert [event[0] for event in merged.read(10)] == [[0x90, 60, 100, 0]]
+    # An attached input still waits and wakes on its own
+    push_later(keys)
+    assert keys.wait(5.0)
+
+
+def test_router_wakes_on_push():
+    router = InputRouter()
+    keys, queue = EventInput(), EventInput()
+    router.add(keys, [queue])
+    push_later(keys)
+    start = time.monotonic()
+    assert router.wait(5.0)
+    assert time.monotonic() - start < 1.0
+    assert router.pump() == 1
+    assert queue.poll()
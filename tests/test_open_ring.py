@@ -0,0 +1,89 @@
+"""open_ring sizes its transfers from the MIDI OUT endpoint's wMaxPacketSize,
+and FlushDeadline holds partly filled ones only under load"""
+
+from types import SimpleNamespace
+
+import pytest
+
+import usb_async
+from batching import IDLE_GAP, FlushDeadline
+from bridge_core import (
+    ENDPOINT_MIDI_OUT, FULL_SPEED_MAX_PACKET, MAX_EVENT_PACKETS, PACKET_SIZE, max_packet_size,
+)
+from sim_device import SimulatedSCD70
+from usb_async import RING_PACKETS, TRANSFER_SIZE, open_ring
+
+
+class DescribedSCD70(SimulatedSCD70):
+    """SimulatedSCD70 with a configuration descriptor for the MIDI endpoints"""
+
+    def __init__(self, max_packet):
+        super().__init__()
+        self.max_packet = max_packet
+
+    def get_active_configuration(self):
+        endpoints = [SimpleNamespace(bEndpointAddress=0x81, wMaxPacketSize=312),
+                     SimpleNamespace(bEndpointAddress=ENDPOINT_MIDI_OUT,
+                                     wMaxPacketSize=self.max_packet)]
+        return [[], endpoints]
+
+
+def test_max_packet_size():
+    assert max_packet_size(DescribedSCD70(512)) == 512
+    # Bits 11-12 (extra transactions per microframe) are not part of the size
+    assert max_packet_size(DescribedSCD70(0x1000 | 512)) == 512
+    # No readable descriptors: the full-speed bulk size
+    assert max_packet_size(SimulatedSCD70()) == FULL_SPEED_MAX_PACKET
+
+
+@pytest.mark.parametrize("max_packet, packets", [(64, 256), (512, 256), (96, 240), (8, 256)])
+def test_slots_hold_whole_max_packets(max_packet, packets):
+    ring = open_ring(DescribedSCD70(max_packet))
+    assert ring.slot_size == packets * PACKET_SIZE
+    # Full transfers end on a packet boundary and are at most TRANSFER_SIZE
+    assert ring.slot_size % max_packet == 0
+    assert ring.slot_size <= TRANSFER_SIZE
+    assert ring.slots == RING_PACKETS // packets
+
+
+def test_slot_packets_floor_and_override(monkeypatch):
+    # A slot always holds a whole event, however small the transfers
+    monkeypatch.setattr(usb_async, "TRANSFER_SIZE", 16)
+    ring = open_ring(DescribedSCD70(64))
+    assert ring.slot_size == MAX_EVENT_PACKETS * PACKET_SIZE
+    # An explicit size wins, and the ring keeps RING_PACKETS in at least 2 slots
+    ring = open_ring(SimulatedSCD70(), slot_packets=16)
+    assert ring.slot_size == 16 * PACKET_SIZE
+    assert ring.slots == RING_PACKETS // 16
+    ring = open_ring(SimulatedSCD70(), slot_packets=RING_PACKETS)
+    assert ring.slots == 2
+    assert open_ring(SimulatedSCD70(), slots=3, slot_packets=16).slots == 3
+
+
+def test_deadline_and_lanes_options():
+    ring = open_ring(SimulatedSCD70(), deadline=2.0)
+    assert ring.batcher.limit == 0.002 and ring.bulk is not None
+    ring = open_ring(SimulatedSCD70(), deadline=0, lanes=False)
+    assert ring.batcher is None and ring.bulk is None
+
+
+def test_flush_deadline_only_under_load():
+    batcher = FlushDeadline(limit=0.5)
+    # Sparse input: every slot is written at once
+    for _ in range(50):
+        batcher.record_write(0.0004)
+    assert batcher.gap == IDLE_GAP
+    assert batcher.deadline == 0.0
+    # Input arriving faster than writes complete: wait up to one write time
+    now = 0.0
+    for _ in range(50):
+        now += 0.0001
+        batcher.record_input(1, now)
+    assert batcher.gap < batcher.write_time
+    assert batcher.deadline == pytest.approx(batcher.write_time)
+    assert batcher.hold(now) == pytest.approx(batcher.deadline)
+    assert batcher.hold(now + batcher.deadline) == pytest.approx(0.0)
+    # ...but never longer than the limit
+    for _ in range(100):
+        batcher.record_write(0.01)
+    assert batcher.deadline == pytest.approx(0.0005)
@@ -0,0 +1,89 @@
+"""PCM24Decoder framing of 288-byte and padded 312-byte packets, read by read
+and packet by packet"""
+
+import numpy as np
+import pytest
+
+from pcm24 import PADDED_PACKET, PAYLOAD_PACKET, PACKET_SAMPLES, PCM24Decoder, packet_lengths
+
+# Ramp step between consecutive 24-bit samples
+STEP = 4099
+
+
+def ramp(samples, first=0):
+    """Sign-extended 24-bit values of a ramp"""
+    values = (np.arange(first, first + samples, dtype=np.int64) * STEP) & 0xFFFFFF
+    return np.where(values >= 1 << 23, values - (1 << 24), values)
+
+
+def read(sizes):
+    """A read of back to back packets of `sizes`, each 288 bytes of the
+    ramp (plus zero padding if 312)"""
+    data = bytearray()
+    first = 0
+    for size in sizes:
+        values = (np.arange(first, first + PACKET_SAMPLES, dtype=np.int64) * STEP) & 0xFFFFFF
+        data += values.astype("<u4").view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+        data += bytes(size - PAYLOAD_PACKET)
+        first += PACKET_SAMPLES
+    return np.frombuffer(bytes(data), dtype=np.uint8)
+
+
+def decoded(decoder, raw, lengths=None):
+    samples = decoder.unpack(raw, lengths)
+    out = np.zeros(samples, dtype=np.int32)
+    decoder.to_int32(out)
+    return out
+
+
+MIXED = [
+    [PAYLOAD_PACKET, PADDED_PACKET],
+    [PADDED_PACKET, PAYLOAD_PACKET, PAYLOAD_PACKET, PADDED_PACKET, PAYLOAD_PACKET],
+    [PAYLOAD_PACKET] * 3 + [PADDED_PACKET] + [PAYLOAD_PACKET] * 3 + [PADDED_PACKET] * 3,
+]
+
+
+@pytest.mark.parametrize("sizes", MIXED + [[PAYLOAD_PACKET] * 10, [PADDED_PACKET] * 10])
+def test_packet_sizes_from_reader(sizes):
+    decoder = PCM24Decoder(len(sizes) * PACKET_SAMPLES)
+    out = decoded(decoder, read(sizes), np.array(sizes, dtype=np.uint32))
+    assert (out == ramp(len(sizes) * PACKET_SAMPLES)).all()
+    assert decoder.framing_errors == 0
+
+
+@pytest.mark.parametrize("sizes", MIXED + [[PAYLOAD_PACKET] * 10, [PADDED_PACKET] * 10])
+def test_packet_sizes_detected(sizes):
+    raw = read(sizes)
+    assert packet_lengths(raw) == sizes
+    decoder = PCM24Decoder(len(sizes) * PACKET_SAMPLES)
+    assert (decoded(decoder, raw) == ramp(len(sizes) * PACKET_SAMPLES)).all()
+    assert decoder.framing_errors == 0
+
+
+def test_silence_decodes_whole_either_way():
+    # Zero audio looks like padding: whichever split is taken, every packet
+    # still yields whole frames
+    raw = np.zeros(PAYLOAD_PACKET * 2 + PADDED_PACKET, dtype=np.uint8)
+    decoder = PCM24Decoder(16 * PACKET_SAMPLES)
+    samples = decoder.unpack(raw)
+    assert samples == 3 * PACKET_SAMPLES
+    assert decoder.framing_errors == 0
+
+
+def test_unknown_packet_sizes():
+    decoder = PCM24Decoder(16 * PACKET_SAMPLES)
+    # A read that splits into neither size is decoded as plain frames
+    assert decoder.unpack(read([PAYLOAD_PACKET])[:150]) == 50
+    assert decoder.framing_errors == 1
+    # A short packet from the reader keeps its whole frames
+    sizes = [PAYLOAD_PACKET, 150, PADDED_PACKET]
+    raw = np.concatenate([read([PAYLOAD_PACKET]), read([PAYLOAD_PACKET])[:150],
+                          read([PADDED_PACKET])])
+    out = decoded(decoder, raw, sizes)
+    assert len(out) == 2 * PACKET_SAMPLES + 50
+    assert (out[:PACKET_SAMPLES] == ramp(PACKET_SAMPLES)).all()
+    assert (out[PACKET_SAMPLES:PACKET_SAMPLES + 50] == ramp(50)).all()
+    assert decoder.framing_errors == 2
+    # Missed packets are reported as 0 bytes
+    assert decoder.unpack(read([PAYLOAD_PACKET]), [0, PAYLOAD_PACKET, 0]) == PACKET_SAMPLES
+    assert decoder.framing_errors == 2
@@ -0,0 +1,90 @@
+"""ScheduledInput wakes for schedule() whatever input it wraps, and schedules
+each unit of a multi-device bridge"""
+
+import threading
+import time
+
+import pytest
+
+from midi_input import EventInput, PollingInput, TimedInput, now_ms
+from midi_merge import MergedInput
+from multi_device import DeviceWorker
+from scheduler import ScheduledInput
+from sim_device import SimulatedSCD70
+
+
+class IdlePygameInput:
+    """pygame.midi.Input stand-in with nothing to read"""
+
+    def poll(self):
+        return False
+
+    def read(self, count):
+        return []
+
+    def close(self):
+        pass
+
+
+def merged():
+    midi_in = MergedInput()
+    midi_in.add("keys", EventInput())
+    return midi_in
+
+
+SOURCES = {
+    "event": EventInput,
+    "polling": lambda: PollingInput(IdlePygameInput()),
+    "timed": lambda: TimedInput([]),
+    "merged": merged,
+}
+
+
+@pytest.mark.parametrize("kind", SOURCES)
+def test_wake_ends_wait(kind):
+    midi_in = SOURCES[kind]()
+    threading.Timer(0.05, midi_in.wake).start()
+    start = time.monotonic()
+    assert not midi_in.wait(5.0)
+    assert time.monotonic() - start < 1.0
+    # A wake() before wait() is not lost either
+    midi_in.wake()
+    start = time.monotonic()
+    midi_in.wait(5.0)
+    assert time.monotonic() - start < 1.0
+
+
+@pytest.mark.parametrize("kind", SOURCES)
+def test_schedule_during_wait(kind):
+    scheduled = ScheduledInput(SOURCES[kind]())
+    due = now_ms() + 100.0
+    threading.Timer(0.05, scheduled.schedule, ((0x90, 60, 100), due)).start()
+    assert scheduled.wait(5.0)
+    assert abs(now_ms() - due) < 50.0
+    assert scheduled.read(10) == [[[0x90, 60, 100, 0], due]]
+
+
+def test_wake_ends_scheduled_wait():
+    scheduled = ScheduledInput(EventInput())
+    threading.Timer(0.05, scheduled.wake).start()
+    start = time.monotonic()
+    assert not scheduled.wait(5.0)
+    assert time.monotonic() - start < 1.0
+
+
+@pytest.mark.parametrize("inputs", [["keys"], ["keys", "seq"]])
+def test_device_worker_schedule(inputs):
+    dev = SimulatedSCD70(record=True)
+    worker = DeviceWorker("sim", dev, inputs, log=lambda message: None, deadline=0,
+                          schedule=100.0).start()
+    try:
+        pushed = now_ms()
+        worker.queues["keys"].push(bytes((0x90, 60, 100)), pushed)
+        time.sleep(0.05)
+        assert not dev.packets
+        while not dev.packets and now_ms() - pushed < 2000.0:
+            time.sleep(0.001)
+        assert now_ms() - pushed >= 100.0
+        assert dev.received == bytes((0x09, 0x90, 60, 100))
+    finally:
+        worker.stop()
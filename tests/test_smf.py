@@ -0,0 +1,132 @@
+"""MidiFile parsing (running status, SysEx, escapes, meta events) and its tempo map"""
+
+import struct
+
+import pytest
+
+from smf import ALL_NOTES_OFF, MidiFile, SmfInput
+
+
+def vlq(value):
+    out = [value & 0x7F]
+    value >>= 7
+    while value:
+        out.insert(0, value & 0x7F | 0x80)
+        value >>= 7
+    return bytes(out)
+
+
+def track(*events):
+    """MTrk chunk of (delta ticks, event bytes) pairs, End of Track added"""
+    data = b"".join(vlq(delta) + event for delta, event in events) + b"\x00\xFF\x2F\x00"
+    return b"MTrk" + struct.pack(">I", len(data)) + data
+
+
+def tempo(us):
+    return b"\xFF\x51\x03" + us.to_bytes(3, "big")
+
+
+def write_smf(tmp_path, tracks, division=480, fmt=None):
+    path = tmp_path / "song.mid"
+    fmt = (0 if len(tracks) == 1 else 1) if fmt is None else fmt
+    path.write_bytes(b"MThd" + struct.pack(">IHHH", 6, fmt, len(tracks), division) +
+                     b"".join(tracks))
+    return str(path)
+
+
+def events(path):
+    """(ms rounded to the µs, message) of every event in `path`"""
+    smf = MidiFile(path)
+    try:
+        return [(round(ms, 3), message) for ms, message in smf.events()]
+    finally:
+        smf.close()
+
+
+def test_running_status_and_default_tempo(tmp_path):
+    # 120 BPM at 480 ticks per quarter: 480 ticks = 500 ms
+    path = write_smf(tmp_path, [track((0, b"\x90\x3C\x40"), (480, b"\x3E\x40"),
+                                      (240, b"\xC1\x05"), (0, b"\x07"),
+                                      (240, b"\x80\x3C\x00"))])
+    assert events(path) == [(0.0, b"\x90\x3C\x40"), (500.0, b"\x90\x3E\x40"),
+                            (750.0, b"\xC1\x05"), (750.0, b"\xC1\x07"),
+                            (1000.0, b"\x80\x3C\x00")]
+
+
+def test_sysex_escapes_and_meta(tmp_path):
+    gs_reset = bytes((0xF0, 0x41, 0x10, 0x42, 0x12, 0x40, 0x00, 0x7F, 0x00, 0x41, 0xF7))
+    path = write_smf(tmp_path, [track(
+        (0, b"\xFF\x03\x04Song"),                     # track name: skipped
+        (0, b"\xF0" + vlq(len(gs_reset) - 1) + gs_reset[1:]),
+        (0, b"\xF7\x01\xF8"),                         # escaped real-time byte
+        # A meta event cancels running status: the data byte ends the track
+        (10, b"\x90\x3C\x40"), (0, b"\xFF\x01\x01x"), (0, b"\x3E\x40"),
+        (0, b"\x90\x40\x40"))])
+    assert [message for _, message in events(path)] == [gs_reset, b"\xF8", b"\x90\x3C\x40"]
+
+
+def test_tempo_map_across_tracks(tmp_path):
+    # Tempo changes in the conductor track time the other tracks' events
+    conductor = track((0, tempo(1000000)), (480, tempo(250000)))
+    notes = track((0, b"\x90\x3C\x40"), (480, b"\x90\x3E\x40"), (480, b"\x90\x40\x40"))
+    drums = track((240, b"\x99\x24\x64"), (480, b"\x99\x26\x64"))
+    assert events(write_smf(tmp_path, [conductor, notes, drums])) == [
+        (0.0, b"\x90\x3C\x40"),
+        (500.0, b"\x99\x24\x64"),       # 240 ticks at 60 BPM
+        (1000.0, b"\x90\x3E\x40"),      # tempo quadruples at tick 480
+        (1125.0, b"\x99\x26\x64"),
+        (1250.0, b"\x90\x40\x40"),
+    ]
+
+
+def test_same_tick_keeps_track_then_file_order(tmp_path):
+    first = track((0, b"\xB0\x07\x64"), (0, b"\xC0\x01"))
+    second = track((0, b"\xB1\x07\x64"))
+    assert [message for _, message in events(write_smf(tmp_path, [first, second]))] == \
+        [b"\xB0\x07\x64", b"\xC0\x01", b"\xB1\x07\x64"]
+
+
+def test_smpte_division(tmp_path):
+    # 25 fps, 40 ticks per frame: 1 ms per tick, and tempo events do not apply
+    division = (256 - 25) << 8 | 40
+    path = write_smf(tmp_path, [track((0, tempo(1000000)), (100, b"\x90\x3C\x40"))],
+                     division=division)
+    assert events(path) == [(100.0, b"\x90\x3C\x40")]
+
+
+def test_truncated_and_corrupt_tracks(tmp_path):
+    whole = track((0, b"\x90\x3C\x40"), (10, b"\x90\x3E\x40"))
+    cut = write_smf(tmp_path, [whole[:-7]])
+    assert [message for _, message in events(cut)] == [b"\x90\x3C\x40"]
+    corrupt = write_smf(tmp_path, [track((0, b"\x3C\x40"), (0, b"\x90\x3C\x40"))])
+    assert events(corrupt) == []
+
+
+def test_not_a_midi_file(tmp_path):
+    empty = tmp_path / "empty.mid"
+    empty.write_bytes(b"")
+    junk = tmp_path / "junk.mid"
+    junk.write_bytes(b"RIFF" + bytes(20))
+    for path in (empty, junk):
+        with pytest.raises(ValueError):
+            MidiFile(str(path))
+
+
+def test_smf_input_plays_the_file(tmp_path):
+    path = write_smf(tmp_path, [track((0, b"\x90\x3C\x40"), (48, b"\x80\x3C\x00"))])
+    midi_in = SmfInput(path, preroll=0.0)
+    try:
+        played = []
+        while not midi_in.done:
+            if midi_in.wait(1.0):
+                played += midi_in.read(16)
+        assert [event[0][:3] for event in played] == [[0x90, 0x3C, 0x40], [0x80, 0x3C, 0x00]]
+        # 48 ticks at 120 BPM and 480 ticks per quarter
+        assert played[1][1] - played[0][1] == pytest.approx(50.0)
+    finally:
+        midi_in.close()
+
+
+def test_all_notes_off():
+    assert len(ALL_NOTES_OFF) == 16 * 6
+    assert ALL_NOTES_OFF[:6] == bytes((0xB0, 120, 0, 0xB0, 123, 0))
@@ -0,0 +1,118 @@
+"""USB stalls and timeouts reach BridgeSupervisor the same way from both ring types"""
+
+import ctypes
+import errno
+import queue
+
+import pytest
+import usb.core
+from usb.backend import libusb1
+
+from bridge_core import PacketRing, UsbMidiEncoder
+from midi_input import EventInput
+from sim_device import SimulatedSCD70
+from supervisor import BridgeSupervisor
+from usb_async import AsyncPacketRing
+
+
+class FakeLibusb:
+    """Just enough of libusb's asynchronous API to run an AsyncPacketRing on
+    a SimulatedSCD70: each submitted transfer is written to the device on
+    the ring's event thread and completes with the status libusb would give"""
+
+    def __init__(self, dev):
+        self.dev = dev
+        self.submitted = queue.Queue()
+
+        def libusb_alloc_transfer(iso_packets):
+            return ctypes.pointer(libusb1._libusb_transfer())
+
+        def libusb_submit_transfer(transfer):
+            self.submitted.put(transfer)
+            return 0
+
+        def libusb_handle_events_timeout(ctx, tv):
+            try:
+                transfer = self.submitted.get(timeout=0.01)
+            except queue.Empty:
+                return 0
+            t = transfer.contents
+            try:
+                t.actual_length = self.dev.write(t.endpoint, ctypes.string_at(t.buffer, t.length),
+                                                 t.timeout)
+                t.status = libusb1.LIBUSB_TRANSFER_COMPLETED
+            except usb.core.USBTimeoutError:
+                t.status = libusb1.LIBUSB_TRANSFER_TIMED_OUT
+            except usb.core.USBError as e:
+                t.status = (libusb1.LIBUSB_TRANSFER_STALL if e.errno == errno.EPIPE
+                            else libusb1.LIBUSB_TRANSFER_ERROR)
+            t.callback(transfer)
+            return 0
+
+        self.libusb_alloc_transfer = libusb_alloc_transfer
+        self.libusb_submit_transfer = libusb_submit_transfer
+        self.libusb_handle_events_timeout = libusb_handle_events_timeout
+        self.libusb_cancel_transfer = lambda transfer: 0
+        self.libusb_free_transfer = lambda transfer: None
+
+
+def make_ring(kind, dev):
+    if kind == "sync":
+        return PacketRing()
+    return AsyncPacketRing(FakeLibusb(dev), None, None)
+
+
+def pump_note(supervisor, source, note=60):
+    """Send one note through the supervisor and let any async transfer finish"""
+    source.push(bytes((0x90, note, 100)))
+    supervisor.pump()
+    supervisor.ring.drain(1.0)
+
+
+@pytest.fixture(params=["sync", "async"])
+def bridge(request):
+    dev = SimulatedSCD70()
+    source = EventInput()
+    ring = make_ring(request.param, dev)
+    supervisor = BridgeSupervisor(dev, ring, source, UsbMidiEncoder(), find=lambda: None,
+                                  log=lambda message: None)
+    # A reopen (the wrong recovery here) gives up at once instead of waiting
+    supervisor.find = supervisor.stop
+    statuses = []
+    supervisor.on_status = lambda kind, message: statuses.append(kind)
+    yield dev, source, supervisor, statuses
+    supervisor.stop()
+    supervisor.close()
+
+
+def test_stall_is_cleared_in_place(bridge):
+    dev, source, supervisor, statuses = bridge
+    ring = supervisor.ring
+    pump_note(supervisor, source)
+    dev.stalled = True
+    pump_note(supervisor, source, 61)
+    # The async ring reports a failed transfer from the next flush
+    pump_note(supervisor, source, 62)
+    assert statuses[:1] == ["stall"]
+    assert supervisor.stalls == 1
+    assert supervisor.recoveries == 0
+    assert supervisor.ring is ring
+    assert not dev.stalled
+    pump_note(supervisor, source, 63)
+    assert dev.packets >= 3
+
+
+def test_timeout_only_counts_lost_packets(bridge):
+    dev, source, supervisor, statuses = bridge
+    ring = supervisor.ring
+    pump_note(supervisor, source)
+    # Slower than the 10 ms live-traffic timeout pump_midi writes with
+    dev.latency = 0.05
+    pump_note(supervisor, source, 61)
+    dev.latency = 0.0
+    pump_note(supervisor, source, 62)
+    assert statuses[:1] == ["timeout"]
+    assert supervisor.timeouts == 1
+    assert supervisor.recoveries == 0
+    assert supervisor.ring is ring
+    assert ring.dropped == 1
@@ -0,0 +1,169 @@
+"""research/usb_reader.c built against research/libusb_shim: reads, truncation
+and every error path the shim can inject (see USB_SHIM_FAULT in libusb_shim.c)"""
+
+import array
+import glob
+import importlib.util
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+RESEARCH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "research")
+PAYLOAD = 288
+PADDED = 312
+# Ramp step of the shim's samples (24-bit little-endian)
+STEP = 4099
+
+
+@pytest.fixture(scope="module")
+def usb_reader(tmp_path_factory):
+    build = tmp_path_factory.mktemp("usb_reader")
+    result = subprocess.run(
+        [sys.executable, "setup.py", "build_ext", "--build-lib", str(build),
+         "--build-temp", str(build / "temp")],
+        cwd=RESEARCH, env=dict(os.environ, USB_READER_SHIM="1"),
+        capture_output=True, text=True)
+    if result.returncode:
+        pytest.skip(f"usb_reader does not build here:\n{result.stderr[-2000:]}")
+    path, = glob.glob(str(build / "usb_reader*"))
+    spec = importlib.util.spec_from_file_location("usb_reader", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def device(usb_reader):
+    with usb_reader.Device() as device:
+        yield device
+
+
+def samples(data):
+    return [int.from_bytes(data[i:i + 3], "little") for i in range(0, len(data) - 2, 3)]
+
+
+def assert_ramp(data):
+    values = samples(data)
+    assert len(values) > 1
+    for a, b in zip(values, values[1:]):
+        assert (b - a) % (1 << 24) == STEP
+
+
+def test_read_bulk(device):
+    buf = bytearray(PAYLOAD * 4)
+    assert device.read_bulk(buf) == PAYLOAD * 4
+    assert_ramp(buf)
+
+
+def test_read_bulk_whole_packets_only(device):
+    buf = bytearray(PAYLOAD * 2 + 100)
+    assert device.read_bulk(buf) == PAYLOAD * 2
+    assert buf[PAYLOAD * 2:] == bytes(100)
+
+
+def test_read_bulk_errors(device, usb_reader, monkeypatch):
+    buf = bytearray(PAYLOAD * 4)
+    monkeypatch.setenv("USB_SHIM_FAULT", "bulk_timeout")
+    # A timeout is not an error: what arrived is returned
+    assert device.read_bulk(buf) == PAYLOAD
+    monkeypatch.setenv("USB_SHIM_FAULT", "bulk_error")
+    with pytest.raises(usb_reader.USBError, match="NO_DEVICE"):
+        device.read_bulk(buf)
+    monkeypatch.delenv("USB_SHIM_FAULT")
+    assert device.read_bulk(buf) == PAYLOAD * 4
+
+
+def test_read_iso_packs_payloads(device):
+    # Every fourth packet is padded: 6 of 288 bytes and 2 of 312
+    buf = bytearray(PADDED * 8)
+    assert device.read_iso(buf) == PAYLOAD * 6 + PADDED * 2
+    assert buf[PAYLOAD * 3:PAYLOAD * 3 + PADDED] == \
+        bytes(buf[PAYLOAD * 3:PAYLOAD * 4]) + bytes(PADDED - PAYLOAD)
+
+
+def test_read_iso_truncates_to_payload(device):
+    buf = bytearray(PADDED * 8)
+    assert device.read_iso(buf, payload=PAYLOAD) == PAYLOAD * 8
+    assert_ramp(buf[:PAYLOAD * 8])
+
+
+def test_read_iso_buffer_sizes(device):
+    # Only whole packets are read into the buffer
+    buf = bytearray(PADDED * 2 + 100)
+    assert device.read_iso(buf, payload=PAYLOAD) == PAYLOAD * 2
+    with pytest.raises(ValueError):
+        device.read_iso(bytearray(PADDED - 1))
+    assert device.read_iso(bytearray(PAYLOAD * 4), packet_size=PAYLOAD) == PAYLOAD * 4
+
+
+def test_read_iso_packet_lengths(device):
+    buf = bytearray(PADDED * 8)
+    lengths = array.array("I", bytes(4 * 8))
+    assert device.read_iso(buf, lengths=lengths) == PAYLOAD * 6 + PADDED * 2
+    assert list(lengths) == [PAYLOAD, PAYLOAD, PAYLOAD, PADDED] * 2
+    assert device.read_iso(buf, payload=PAYLOAD, lengths=lengths) == PAYLOAD * 8
+    assert list(lengths) == [PAYLOAD] * 8
+    with pytest.raises(ValueError):
+        device.read_iso(buf, lengths=array.array("I", bytes(4 * 7)))
+
+
+def test_read_iso_timeout_returns_partial(device, monkeypatch):
+    monkeypatch.setenv("USB_SHIM_FAULT", "transfer_timeout")
+    buf = bytearray(PADDED * 8)
+    lengths = array.array("I", bytes(4 * 8))
+    assert device.read_iso(buf, lengths=lengths) == PAYLOAD * 3 + PADDED
+    assert list(lengths) == [PAYLOAD, PAYLOAD, PAYLOAD, PADDED] + [0] * 4
+
+
+@pytest.mark.parametrize("fault, message", [
+    ("submit_error", "libusb_submit_transfer failed: LIBUSB_ERROR_NO_DEVICE"),
+    ("transfer_error", "Isochronous transfer failed"),
+    ("events_error", "USB event handling failed: LIBUSB_ERROR_IO"),
+    ("events_dead", "Isochronous transfer not cancelled: LIBUSB_ERROR_IO"),
+])
+def test_read_iso_errors(device, usb_reader, monkeypatch, fault, message):
+    monkeypatch.setenv("USB_SHIM_FAULT", fault)
+    buf = bytearray(PADDED * 8)
+    errors = []
+
+    def read():
+        try:
+            device.read_iso(buf)
+        except usb_reader.USBError as e:
+            errors.append(str(e))
+
+    # A read that never returns fails the test instead of hanging it
+    thread = threading.Thread(target=read, daemon=True)
+    thread.start()
+    thread.join(10.0)
+    assert not thread.is_alive(), "read_iso did not return"
+    assert errors and message in errors[0]
+    # The device still reads once the fault is gone
+    monkeypatch.delenv("USB_SHIM_FAULT")
+    assert device.read_iso(buf) == PAYLOAD * 6 + PADDED * 2
+
+
+def test_closed_device(usb_reader):
+    device = usb_reader.Device()
+    device.close()
+    with pytest.raises(ValueError):
+        device.read_bulk(bytearray(PAYLOAD))
+    with pytest.raises(ValueError):
+        device.read_iso(bytearray(PADDED))
+
+
+def test_abandoned_read_keeps_buffer(device, usb_reader, monkeypatch):
+    monkeypatch.setenv("USB_SHIM_FAULT", "events_dead")
+    buf = bytearray(PADDED * 8)
+    with pytest.raises(usb_reader.USBError, match="not cancelled"):
+        device.read_iso(buf)
+    # libusb may still write into the buffer, so it stays exported
+    with pytest.raises(BufferError):
+        buf.extend(b"\0")
+    monkeypatch.delenv("USB_SHIM_FAULT")
+    # The next read's event handling completes the abandoned transfer too
+    assert device.read_iso(bytearray(PADDED * 8)) == PAYLOAD * 6 + PADDED * 2
+    buf.extend(b"\0")
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+SC-D70 Bridge Asynchronous USB Output
+Keeps several libusb bulk transfers in flight on the MIDI OUT endpoint
+"""
+
+import ctypes
+import errno
+import threading
+import time
+
+import usb.core
+import usb.util
+from usb.backend import libusb1
+
+from batching import FLUSH_DEADLINE, FlushDeadline
+from lanes import BulkLane
+from bridge_core import (
+    ENDPOINT_MIDI_OUT, MAX_EVENT_PACKETS, PACKET_SIZE, PacketRing, max_packet_size,
+)
+
+INTERFACE_MIDI = 2
+
+# libusb_handle_events_timeout poll period, bounds how long close() waits
+EVENT_TIMEOUT_US = 100000
+# Largest transfer open_ring's slots make, in bytes: the most wMaxPacketSize
+# packets that fit, as one transfer costs a whole write however short it is
+TRANSFER_SIZE = 1024
+# Packets buffered by open_ring's rings, whatever their transfer size
+RING_PACKETS = 1024
+
+
+class _timeval(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long),
+                ("tv_usec", ctypes.c_long)]
+
+
+def transfer_error(status):
+    """USBError for a failed libusb transfer status, as pyusb's synchronous
+    write raises it: a timeout is a USBTimeoutError and a stall has EPIPE"""
+    message = libusb1._str_transfer_error.get(status, "Unknown error")
+    if status == libusb1.LIBUSB_TRANSFER_TIMED_OUT:
+        return usb.core.USBTimeoutError(message, status, errno.ETIMEDOUT)
+    if status == libusb1.LIBUSB_TRANSFER_STALL:
+        return usb.core.USBError(message, status, errno.EPIPE)
+    return usb.core.USBError(message, status, libusb1._transfer_errno.get(status))
+
+
+class AsyncPacketRing(PacketRing):
+    """PacketRing whose slots are submitted as asynchronous bulk transfers.
+
+    Every slot owns one libusb_transfer pointing straight at the slot's
+    memory, so a flush submits without copying and returns immediately.
+    Events keep packing into the next free slot while earlier transfers are
+    on the bus; the bridge thread only waits when all `slots` transfers are
+    in flight. A failed transfer is raised from the next flush().
+    """
+
+    def __init__(self, lib, ctx, handle, endpoint=ENDPOINT_MIDI_OUT,
+                 slots=4, slot_packets=256, timeout=1000):
+        super().__init__(slots=slots, slot_packets=slot_packets)
+        self.lib = lib
+        self.ctx = ctx
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.in_flight = [False] * slots
+        # (input origin, submit time, packets) of each slot's transfer
+        self._submitted = [None] * slots
+        self.completed = 0
+        self.errors = 0
+        self._error = None
+        self._cond = threading.Condition()
+        self._running = True
+
+        self._lib_setup()
+        storage = (ctypes.c_ubyte * len(self._buf)).from_buffer(self._buf)
+        base = ctypes.addressof(storage)
+        self._storage = storage
+        self._callbacks = []
+        self._transfers = []
+        for slot in range(slots):
+            callback = libusb1._libusb_transfer_cb_fn_p(
+                lambda transfer, slot=slot: self._complete(slot, transfer))
+            transfer = lib.libusb_alloc_transfer(0)
+            t = transfer.contents
+            t.dev_handle = handle
+            t.endpoint = endpoint
+            t.type = libusb1._LIBUSB_TRANSFER_TYPE_BULK
+            t.timeout = timeout
+            t.buffer = base + slot * self.slot_size
+            t.callback = callback
+            self._callbacks.append(callback)
+            self._transfers.append(transfer)
+
+        self._events_thread = threading.Thread(target=self._handle_events, daemon=True)
+        self._events_thread.start()
+
+    def _lib_setup(self):
+        self.lib.libusb_handle_events_timeout.argtypes = [ctypes.c_void_p,
+                                                         ctypes.POINTER(_timeval)]
+        self.lib.libusb_cancel_transfer.argtypes = [ctypes.POINTER(libusb1._libusb_transfer)]
+
+    def _handle_events(self):
+        tv = _timeval(0, EVENT_TIMEOUT_US)
+        while self._running or any(self.in_flight):
+            self.lib.libusb_handle_events_timeout(self.ctx, ctypes.byref(tv))
+
+    def _complete(self, slot, transfer):
+        status = transfer.contents.status
+        completed = time.perf_counter()
+        with self._cond:
+            self.in_flight[slot] = False
+            self.done += self._submitted[slot][2]
+            if status == libusb1.LIBUSB_TRANSFER_COMPLETED:
+                self.completed += 1
+                origin, submitted, packets = self._submitted[slot]
+                if self.metrics:
+                    self.metrics.record_write(origin, submitted, completed, packets)
+                if self.batcher:
+                    self.batcher.record_write(completed - submitted)
+            else:
+                self.errors += 1
+                self.dropped += self._submitted[slot][2]
+                self._error = transfer_error(status)
+                if self.metrics:
+                    self.metrics.record_error()
+            self._cond.notify_all()
+
+    def _raise_error(self):
+        error = self._error
+        if error is not None:
+            self._error = None
+            raise error
+
+    def flush(self, dev=None, timeout=None):
+        """Submit the pending packets without waiting for completion.
+
+        The transfer times out after `timeout` ms (the ring's own timeout
+        if None), as a synchronous write would.
+        """
+        count = len(self)
+        origin = self.origin
+        self.origin = 0.0
+        with self._cond:
+            self._raise_error()
+            if not count:
+                return 0
+            slot = self._slot
+            t = self._transfers[slot].contents
+            t.length = self._pos - self._start
+            t.timeout = self.timeout if timeout is None else timeout
+            if self.tracker:
+                self.tracker.observe(self._buf, self._start, self._pos)
+            if self.journal:
+                self.journal.record(self._buf, self._start, self._pos)
+            self._submitted[slot] = (origin, time.perf_counter(), count)
+            self.submitted += count
+            result = self.lib.libusb_submit_transfer(self._transfers[slot])
+            if result < 0:
+                self.dropped += count
+                self.done += count
+                if self.metrics:
+                    self.metrics.record_error()
+                self.advance_locked()
+                raise usb.core.USBError(libusb1._strerror(result), result,
+                                        libusb1._libusb_errno.get(result))
+            self.in_flight[slot] = True
+            self.advance_locked()
+        return count
+
+    def advance_locked(self):
+        """Move to the next slot, waiting for its transfer if still on the bus"""
+        self.advance()
+        while self.in_flight[self._slot]:
+            self._cond.wait()
+
+    def drain(self, timeout=None):
+        """Wait until every submitted transfer has completed"""
+        with self._cond:
+            return self._cond.wait_for(lambda: not any(self.in_flight), timeout)
+
+    def close(self):
+        """Finish or cancel in-flight transfers and free them"""
+        if not self.drain(self.timeout / 1000.0):
+            for slot, busy in enumerate(self.in_flight):
+                if busy:
+                    self.lib.libusb_cancel_transfer(self._transfers[slot])
+            self.drain(self.timeout / 1000.0)
+        self._running = False
+        self._events_thread.join()
+        for transfer in self._transfers:
+            self.lib.libusb_free_transfer(transfer)
+        self._transfers = []
+
+
+def open_ring(dev, slots=None, slot_packets=None, deadline=FLUSH_DEADLINE, lanes=True):
+    """Packet ring for `dev`: asynchronous on libusb1, synchronous otherwise.
+
+    Each slot is one transfer of as many of the MIDI OUT endpoint's
+    wMaxPacketSize packets as fit in TRANSFER_SIZE (RING_PACKETS in all),
+    so full transfers end on a packet boundary. Unless `deadline` is 0, a
+    FlushDeadline lets partly filled slots wait up to `deadline` ms for
+    more input; otherwise they are written as soon as the input is drained.
+    With `lanes`, SysEx goes through a BulkLane so short messages pass it.
+    """
+    if slot_packets is None:
+        packet = max_packet_size(dev)
+        slot_packets = max(TRANSFER_SIZE // packet * packet // PACKET_SIZE, MAX_EVENT_PACKETS)
+    if slots is None:
+        slots = max(RING_PACKETS // slot_packets, 2)
+    backend = dev._ctx.backend
+    if not isinstance(backend, libusb1._LibUSB):
+        ring = PacketRing(slots=slots, slot_packets=slot_packets)
+    else:
+        dev._ctx.managed_open()
+        usb.util.claim_interface(dev, INTERFACE_MIDI)
+        ring = AsyncPacketRing(backend.lib, backend.ctx, dev._ctx.handle.handle,
+                               slots=slots, slot_packets=slot_packets)
+    if deadline:
+        ring.batcher = FlushDeadline(deadline)
+    if lanes:
+        ring.bulk = BulkLane()
+    return ring